@@ -0,0 +1,437 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import typing
+from cpu import Opcode, handler_name, timer_wait_loop, ILLEGAL_HANDLER
+from scheduler import INSTRUCTIONS_PER_FRAME
+
+START = 0x200
+MEMORY = 4096
+
+Region = typing.Tuple[int, int]
+
+SKIP_HANDLERS = {
+    "op_se_vx_byte", "op_sne_vx_byte", "op_se_vx_vy", "op_sne_vx_vy",
+    "op_skp_vx", "op_sknp_vx"
+}
+
+MNEMONICS = {
+    "op_sys": "SYS {NNN:03X}",
+    "op_cls": "CLS",
+    "op_ret": "RET",
+    "op_jp_addr": "JP {NNN:03X}",
+    "op_call_addr": "CALL {NNN:03X}",
+    "op_se_vx_byte": "SE V{x:X}, {NN:02X}",
+    "op_sne_vx_byte": "SNE V{x:X}, {NN:02X}",
+    "op_se_vx_vy": "SE V{x:X}, V{y:X}",
+    "op_ld_vx_byte": "LD V{x:X}, {NN:02X}",
+    "op_add_vx_byte": "ADD V{x:X}, {NN:02X}",
+    "op_ld_vx_vy": "LD V{x:X}, V{y:X}",
+    "op_or_vx_vy": "OR V{x:X}, V{y:X}",
+    "op_and_vx_vy": "AND V{x:X}, V{y:X}",
+    "op_xor_vx_vy": "XOR V{x:X}, V{y:X}",
+    "op_add_vx_vy": "ADD V{x:X}, V{y:X}",
+    "op_sub_vx_vy": "SUB V{x:X}, V{y:X}",
+    "op_shr_vx_vy": "SHR V{x:X}, V{y:X}",
+    "op_subn_vx_vy": "SUBN V{x:X}, V{y:X}",
+    "op_shl_vx_vy": "SHL V{x:X}, V{y:X}",
+    "op_sne_vx_vy": "SNE V{x:X}, V{y:X}",
+    "op_ld_i_addr": "LD I, {NNN:03X}",
+    "op_jp_v0_addr": "JP V0, {NNN:03X}",
+    "op_rnd_vx_byte": "RND V{x:X}, {NN:02X}",
+    "op_drw_vx_vy_nibble": "DRW V{x:X}, V{y:X}, {N:X}",
+    "op_skp_vx": "SKP V{x:X}",
+    "op_sknp_vx": "SKNP V{x:X}",
+    "op_ld_vx_dt": "LD V{x:X}, DT",
+    "op_ld_vx_k": "LD V{x:X}, K",
+    "op_ld_dt_vx": "LD DT, V{x:X}",
+    "op_ld_st_vx": "LD ST, V{x:X}",
+    "op_add_i_vx": "ADD I, V{x:X}",
+    "op_ld_f_vx": "LD F, V{x:X}",
+    "op_ld_b_vx": "LD B, V{x:X}",
+    "op_ld_i_vx": "LD [I], V{x:X}",
+    "op_ld_vx_i": "LD V{x:X}, [I]",
+    ILLEGAL_HANDLER: "DW {opcode:04X}",
+}
+
+
+class Block(typing.NamedTuple):
+    start: int
+    # the address after the last instruction
+    end: int
+    successors: typing.List[int]
+
+
+def mnemonic(opcode: int) -> str:
+    return MNEMONICS[handler_name(opcode)].format(
+        **Opcode.adapt(opcode)._asdict())
+
+
+def successors(opcode: int, address: int) -> typing.List[int]:
+    # the addresses execution can continue at; a computed jump is followed
+    # to its base as if V0 were 0, a return leaves nothing to follow
+    name = handler_name(opcode)
+
+    if name in ("op_ret", ILLEGAL_HANDLER):
+        return []
+    if name in ("op_jp_addr", "op_jp_v0_addr"):
+        return [opcode & 0x0FFF]
+    if name == "op_call_addr":
+        return [opcode & 0x0FFF, address + 2]
+    if name in SKIP_HANDLERS:
+        return [address + 2, address + 4]
+
+    return [address + 2]
+
+
+def find_code(rom: bytes) -> typing.Dict[int, int]:
+    # address -> opcode of every instruction reachable from START
+    end = START + len(rom) - 1
+    code: typing.Dict[int, int] = {}
+    pending = [START]
+
+    while pending:
+        address = pending.pop()
+
+        if address in code or not START <= address < end:
+            continue
+
+        offset = address - START
+        opcode = rom[offset] << 8 | rom[offset + 1]
+        code[address] = opcode
+        pending.extend(successors(opcode, address))
+
+    return code
+
+
+def find_blocks(code: typing.Dict[int, int]) -> typing.Dict[int, Block]:
+    # a block starts at START, at every branch target and after every
+    # branch, and runs until the next block starts
+    leaders = {START}
+
+    for address, opcode in code.items():
+        targets = successors(opcode, address)
+
+        if targets != [address + 2]:
+            leaders.update(targets)
+            leaders.add(address + 2)
+
+    blocks = {}
+
+    for start in sorted(leaders & code.keys()):
+        address = start
+
+        while address + 2 in code and address + 2 not in leaders:
+            address += 2
+
+        blocks[start] = Block(start, address + 2, [
+            target for target in successors(code[address], address)
+            if target in code
+        ])
+
+    return blocks
+
+
+def merge(spans: typing.Iterable[Region]) -> typing.List[Region]:
+    # overlapping or touching [start, end) spans joined
+    merged: typing.List[Region] = []
+
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    return merged
+
+
+def regions(addresses: typing.Iterable[int],
+            size: int = 2) -> typing.List[Region]:
+    return merge((address, address + size) for address in addresses)
+
+
+def data_regions(code: typing.List[Region],
+                 length: int) -> typing.List[Region]:
+    # whatever the rom holds outside the code regions
+    data = []
+    address = START
+
+    for start, end in code + [(START + length, START + length)]:
+        if start > address:
+            data.append((address, start))
+        address = max(address, end)
+
+    return data
+
+
+class Accesses(typing.NamedTuple):
+    # [start, end) spans found by tracking constant values of I
+    sprites: typing.List[Region]
+    # (instruction address, span written)
+    writes: typing.List[typing.Tuple[int, Region]]
+    # Fx33/Fx55 whose I could not be worked out
+    unknown_writes: typing.List[int]
+
+
+def _trace_i(code: typing.Dict[int, int], block: Block,
+             i: typing.Optional[int],
+             accesses: typing.Optional[Accesses]) -> typing.Optional[int]:
+    for address in range(block.start, block.end, 2):
+        opcode = code[address]
+        name = handler_name(opcode)
+        x = (opcode & 0x0F00) >> 8
+
+        if name == "op_ld_i_addr":
+            i = opcode & 0x0FFF
+        elif name in ("op_add_i_vx", "op_ld_f_vx"):
+            i = None
+        elif accesses is None:
+            continue
+        elif name == "op_drw_vx_vy_nibble" and i is not None:
+            accesses.sprites.append((i, i + (opcode & 0x000F)))
+        elif name in ("op_ld_b_vx", "op_ld_i_vx"):
+            if i is None:
+                accesses.unknown_writes.append(address)
+            else:
+                size = 3 if name == "op_ld_b_vx" else x + 1
+                accesses.writes.append((address, (i, i + size)))
+
+    return i
+
+
+def trace_i(code: typing.Dict[int, int],
+            blocks: typing.Dict[int, Block]) -> Accesses:
+    # constant propagation of I over the graph: a block starts with the
+    # value every predecessor agrees on, or unknown; a subroutine may
+    # change I so the return site starts unknown
+    unset = -1
+    entry: typing.Dict[int, typing.Optional[int]] = dict.fromkeys(
+        blocks, unset)
+    entry[START] = 0
+    changed = True
+
+    while changed:
+        changed = False
+
+        for block in blocks.values():
+            if entry[block.start] == unset:
+                continue
+
+            i = _trace_i(code, block, entry[block.start], None)
+            last = block.end - 2
+            call = handler_name(code[last]) == "op_call_addr"
+
+            for target in block.successors:
+                value = None if call and target == block.end else i
+                old = entry[target]
+                new = value if old == unset or old == value else None
+
+                if new != old:
+                    entry[target] = new
+                    changed = True
+
+    accesses = Accesses([], [], [])
+
+    for block in blocks.values():
+        if entry[block.start] != unset:
+            _trace_i(code, block, entry[block.start], accesses)
+
+    return accesses
+
+
+def find_loops(code: typing.Dict[int, int], blocks: typing.Dict[int, Block],
+               ram: bytes) -> typing.List[typing.Dict]:
+    # back edges of a depth first walk from START; depth counts the loops
+    # enclosing one, the innermost are where a rom spends its time
+    loops = []
+    visited = set()
+    on_stack = set()
+    stack = [(START, iter(blocks[START].successors))] if blocks else []
+    on_stack.add(START)
+    visited.add(START)
+
+    while stack:
+        start, targets = stack[-1]
+        target = next(targets, None)
+
+        if target is None:
+            stack.pop()
+            on_stack.discard(start)
+            continue
+
+        if target in on_stack:
+            tail = blocks[start].end - 2
+            kind = "loop"
+
+            if (handler_name(code[tail]) == "op_jp_addr"
+                    and timer_wait_loop(ram, target, tail)):
+                kind = "timer_wait"
+
+            loops.append({"head": target, "tail": tail, "kind": kind})
+        elif target not in visited:
+            visited.add(target)
+            on_stack.add(target)
+            stack.append((target, iter(blocks[target].successors)))
+
+    for loop in loops:
+        span = range(loop["head"], loop["tail"] + 2)
+        loop["instructions"] = sum(address in code for address in span)
+        loop["depth"] = sum(
+            other["head"] <= loop["head"] and loop["tail"] <= other["tail"]
+            for other in loops) - 1
+
+    return sorted(loops, key=lambda loop: (-loop["depth"],
+                                           loop["instructions"]))
+
+
+def recommended_ipf(code: typing.Dict[int, int]) -> int:
+    # roms that set the delay timer pace themselves and tolerate a faster
+    # cpu, the rest were tuned against slow interpreters
+    if any(handler_name(opcode) == "op_ld_dt_vx" for opcode in code.values()):
+        return INSTRUCTIONS_PER_FRAME * 2
+
+    return INSTRUCTIONS_PER_FRAME
+
+
+def _clip(spans: typing.Iterable[Region], length: int) -> typing.List[Region]:
+    end = START + length
+    return merge((max(start, START), min(stop, end)) for start, stop in spans
+                 if start < end and stop > START)
+
+
+def analyze(rom: bytes) -> typing.Dict:
+    # plain lists and ints only, the catalog stores it as json
+    code = find_code(rom)
+    blocks = find_blocks(code)
+    code_regions = regions(code)
+    accesses = trace_i(code, blocks)
+    ram = bytes(START) + rom[:MEMORY - START]
+    ram += bytes(MEMORY - len(ram))
+
+    return {
+        "size": len(rom),
+        "instructions": [[address, opcode, handler_name(opcode)]
+                         for address, opcode in sorted(code.items())],
+        "blocks": [[block.start, block.end, block.successors]
+                   for block in blocks.values()],
+        "code": [list(region) for region in code_regions],
+        "data": [list(region)
+                 for region in data_regions(code_regions, len(rom))],
+        "sprites": [list(region)
+                    for region in _clip(accesses.sprites, len(rom))],
+        "loops": find_loops(code, blocks, ram),
+        "self_modifying": sorted({
+            address
+            for address, (start, end) in accesses.writes
+            if any(start < stop and first < end
+                   for first, stop in code_regions)
+        }),
+        "unknown_writes": sorted(set(accesses.unknown_writes)),
+        "ipf": recommended_ipf(code),
+    }
+
+
+def listing(rom: bytes, analysis: typing.Dict) -> typing.List[str]:
+    # code as mnemonics, sprite rows as pixels, any other data as bytes
+    code = {
+        address: opcode
+        for address, opcode, _ in analysis["instructions"]
+    }
+    sprites = set()
+
+    for start, end in analysis["sprites"]:
+        sprites.update(range(start, end))
+
+    lines = []
+    address = START
+
+    while address < START + len(rom):
+        if address in code:
+            opcode = code[address]
+            lines.append(f"{address:03X}  {opcode:04X}  {mnemonic(opcode)}")
+            address += 2
+            continue
+
+        byte = rom[address - START]
+        text = f"DB {byte:02X}"
+
+        if address in sprites:
+            text += "  " + f"{byte:08b}".replace("0", ".").replace("1", "#")
+
+        lines.append(f"{address:03X}  {byte:02X}    {text}")
+        address += 1
+
+    return lines
+
+
+def rom_paths(paths: typing.Iterable[str]) -> typing.Iterator[str]:
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+
+        for directory, _, names in sorted(os.walk(path)):
+            for name in sorted(names):
+                if name.lower().endswith((".ch8", ".c8")):
+                    yield os.path.join(directory, name)
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Chip-8 rom analyzer")
+    parser.add_argument("roms",
+                        nargs="+",
+                        help="rom files, directories are searched for .ch8 "
+                        "and .c8 files.")
+    parser.add_argument("-o",
+                        "--output",
+                        help="write the json to this file instead of stdout.")
+    parser.add_argument("-l",
+                        "--listing",
+                        action="store_true",
+                        help="print a disassembly instead of json.")
+    parser.add_argument("-s",
+                        "--summary",
+                        action="store_true",
+                        help="leave the instructions and blocks out of the "
+                        "json.")
+    args = parser.parse_args(argv)
+
+    results = []
+
+    for path in rom_paths(args.roms):
+        with open(path, "rb") as file:
+            rom = file.read()
+
+        analysis = analyze(rom)
+
+        if args.listing:
+            print(f"; {path}")
+            print("\n".join(listing(rom, analysis)))
+            continue
+
+        if args.summary:
+            del analysis["instructions"], analysis["blocks"]
+
+        results.append({
+            "path": path,
+            "sha256": hashlib.sha256(rom).hexdigest(),
+            **analysis
+        })
+
+    if args.listing:
+        return 0
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+import typing
+import numpy as np
+from cpu import CPU, Opcode, handler_names
+from fonts import FONTS
+
+_handler_ids: typing.Optional[np.ndarray] = None
+_handler_table: typing.List[str] = []
+
+
+def handler_ids() -> np.ndarray:
+    # the decode table of cpu.py as an array, one handler index per opcode
+    global _handler_ids
+
+    if _handler_ids is None:
+        names = handler_names()
+        _handler_table.extend(sorted(set(names)))
+        index = {name: i for i, name in enumerate(_handler_table)}
+        _handler_ids = np.array([index[name] for name in names],
+                                dtype=np.uint8)
+
+    return _handler_ids
+
+
+class BatchCPU:
+    # N machines stepped together, every register gets a leading instance
+    # axis and each op_* handles all instances running that opcode at once
+
+    FIRST_ADDRESS_MEMORY = CPU.FIRST_ADDRESS_MEMORY
+    FONTS_ADDRESS_MEMORY = CPU.FONTS_ADDRESS_MEMORY
+    WIDTH = CPU.WIDTH
+    HEIGHT = CPU.HEIGHT
+
+    def __init__(self, count: int, seed: typing.Optional[int] = None):
+        self.count = count
+        self.v = np.zeros([count, 16], dtype=np.ubyte)
+        self.i = np.zeros(count, dtype=np.ushort)
+        self.stack = np.zeros([count, 64], dtype=np.ushort)
+        self.sp = np.zeros(count, dtype=np.ubyte)
+        self.dt = np.zeros(count, dtype=np.ubyte)
+        self.st = np.zeros(count, dtype=np.ubyte)
+        self.frame_buffer = np.zeros([count, self.WIDTH, self.HEIGHT],
+                                     dtype=np.bool_)
+        self.pc = np.full(count, self.FIRST_ADDRESS_MEMORY, dtype=np.ushort)
+        self.ram = np.zeros([count, 4096], dtype=np.ubyte)
+        self.keys = np.zeros([count, 16], dtype=np.bool_)
+        self.ram[:, self.FONTS_ADDRESS_MEMORY:self.FONTS_ADDRESS_MEMORY +
+                 FONTS.shape[0]] = FONTS
+        # instances stop once they hit an illegal opcode
+        self.halted = np.zeros(count, dtype=np.bool_)
+        self.rng = np.random.default_rng(seed)
+        self.handlers = [getattr(self, name) for name in self.handler_table()]
+
+    @staticmethod
+    def handler_table() -> typing.List[str]:
+        handler_ids()
+        return _handler_table
+
+    @classmethod
+    def from_cpus(cls, cpus: typing.Sequence[CPU]) -> "BatchCPU":
+        batch = cls(len(cpus))
+
+        for name in ("v", "i", "stack", "sp", "dt", "st", "frame_buffer",
+                     "pc", "ram", "keys"):
+            getattr(batch, name)[:] = [
+                np.asarray(getattr(machine, name)) for machine in cpus
+            ]
+
+        return batch
+
+    def to_cpu(self, index: int) -> CPU:
+        machine = CPU()
+
+        for name in ("v", "stack", "frame_buffer", "ram", "keys"):
+            np.copyto(getattr(machine, name), getattr(self, name)[index])
+        for name in ("i", "sp", "dt", "st", "pc"):
+            setattr(machine, name, getattr(self, name)[index])
+
+        return machine
+
+    def load_rom_to_ram(self, path: str) -> None:
+        self.load_rom(np.fromfile(path, dtype=np.ubyte))
+
+    def load_rom(self, rom: typing.Union[bytes, np.ndarray]) -> None:
+        buffer_np = np.frombuffer(rom, dtype=np.ubyte)
+        start = int(self.FIRST_ADDRESS_MEMORY)
+        self.ram[:, start:start + buffer_np.shape[0]] = buffer_np
+
+    def cpu_cycle(self) -> None:
+        running = np.flatnonzero(~self.halted)
+        pc = self.pc[running].astype(np.intp)
+        opcodes = ((self.ram[running, pc].astype(np.intp) << 8)
+                   | self.ram[running, pc + 1])
+
+        self.pc[running] += 2
+
+        ids = handler_ids()[opcodes]
+
+        for handler_id in np.unique(ids):
+            selected = ids == handler_id
+            op = opcodes[selected]
+            self.handlers[handler_id](
+                running[selected],
+                Opcode(op, op & 0x0FFF, op & 0x00FF, op & 0x000F,
+                       (op & 0x0F00) >> 8, (op & 0x00F0) >> 4))
+
+    def cpu_frame(self, instructions: int) -> None:
+        for _ in range(instructions):
+            self.cpu_cycle()
+
+        self.tick_timers()
+
+    def tick_timers(self) -> None:
+        # 60 Hz
+        self.dt[self.dt > 0] -= 1
+        self.st[self.st > 0] -= 1
+
+    def op_illegal(self, idx: np.ndarray, opcode: Opcode):
+        self.pc[idx] -= 2
+        self.halted[idx] = True
+
+    def op_sys(self, idx: np.ndarray, opcode: Opcode):
+        # 0nnn
+        pass
+
+    def op_cls(self, idx: np.ndarray, opcode: Opcode):
+        # 00E0
+        self.frame_buffer[idx] = 0
+
+    def op_ret(self, idx: np.ndarray, opcode: Opcode):
+        # 00EE
+        self.sp[idx] -= 1
+        self.pc[idx] = self.stack[idx, self.sp[idx]]
+
+    def op_jp_addr(self, idx: np.ndarray, opcode: Opcode):
+        # 1nnn
+        self.pc[idx] = opcode.NNN
+
+    def op_call_addr(self, idx: np.ndarray, opcode: Opcode):
+        # 2nnn
+        self.stack[idx, self.sp[idx]] = self.pc[idx]
+        self.sp[idx] += 1
+        self.pc[idx] = opcode.NNN
+
+    def op_se_vx_byte(self, idx: np.ndarray, opcode: Opcode):
+        # 3xkk
+        self.pc[idx[self.v[idx, opcode.x] == opcode.NN]] += 2
+
+    def op_sne_vx_byte(self, idx: np.ndarray, opcode: Opcode):
+        # 4xkk
+        self.pc[idx[self.v[idx, opcode.x] != opcode.NN]] += 2
+
+    def op_se_vx_vy(self, idx: np.ndarray, opcode: Opcode):
+        # 5xy0
+        self.pc[idx[self.v[idx, opcode.x] == self.v[idx, opcode.y]]] += 2
+
+    def op_ld_vx_byte(self, idx: np.ndarray, opcode: Opcode):
+        # 6xkk
+        self.v[idx, opcode.x] = opcode.NN
+
+    def op_add_vx_byte(self, idx: np.ndarray, opcode: Opcode):
+        # 7xkk
+        self.v[idx, opcode.x] = (self.v[idx, opcode.x] + opcode.NN) & 0xFF
+
+    def op_ld_vx_vy(self, idx: np.ndarray, opcode: Opcode):
+        # 8xy0
+        self.v[idx, opcode.x] = self.v[idx, opcode.y]
+
+    def op_or_vx_vy(self, idx: np.ndarray, opcode: Opcode):
+        # 8xy1
+        self.v[idx, opcode.x] |= self.v[idx, opcode.y]
+
+    def op_and_vx_vy(self, idx: np.ndarray, opcode: Opcode):
+        # 8xy2
+        self.v[idx, opcode.x] &= self.v[idx, opcode.y]
+
+    def op_xor_vx_vy(self, idx: np.ndarray, opcode: Opcode):
+        # 8xy3
+        self.v[idx, opcode.x] ^= self.v[idx, opcode.y]
+
+    def op_add_vx_vy(self, idx: np.ndarray, opcode: Opcode):
+        # 8xy4
+        vx = (self.v[idx, opcode.x].astype(np.ushort) +
+              self.v[idx, opcode.y])
+
+        self.v[idx, 0xF] = vx > 255
+        self.v[idx, opcode.x] = vx & 0xFF
+
+    def op_sub_vx_vy(self, idx: np.ndarray, opcode: Opcode):
+        # 8xy5
+        self.v[idx, 0xF] = 0
+        self.v[idx, 0xF] = self.v[idx, opcode.x] > self.v[idx, opcode.y]
+        self.v[idx, opcode.x] -= self.v[idx, opcode.y]
+
+    def op_shr_vx_vy(self, idx: np.ndarray, opcode: Opcode):
+        # 8xy6
+        self.v[idx, 0xF] = self.v[idx, opcode.x] & 0x1
+        self.v[idx, opcode.x] >>= 1
+
+    def op_subn_vx_vy(self, idx: np.ndarray, opcode: Opcode):
+        # 8xy7
+        self.v[idx, 0xF] = 0
+        self.v[idx, 0xF] = self.v[idx, opcode.y] > self.v[idx, opcode.x]
+        self.v[idx, opcode.x] = self.v[idx, opcode.y] - self.v[idx, opcode.x]
+
+    def op_shl_vx_vy(self, idx: np.ndarray, opcode: Opcode):
+        # 8xyE
+        self.v[idx, 0xF] = (self.v[idx, opcode.x] & 0x80) >> 7
+        self.v[idx, opcode.x] <<= 1
+
+    def op_sne_vx_vy(self, idx: np.ndarray, opcode: Opcode):
+        # 9xy0
+        self.pc[idx[self.v[idx, opcode.x] != self.v[idx, opcode.y]]] += 2
+
+    def op_ld_i_addr(self, idx: np.ndarray, opcode: Opcode):
+        # Annn
+        self.i[idx] = opcode.NNN
+
+    def op_jp_v0_addr(self, idx: np.ndarray, opcode: Opcode):
+        # Bnnn
+        self.pc[idx] = opcode.NNN + self.v[idx, 0]
+
+    def op_rnd_vx_byte(self, idx: np.ndarray, opcode: Opcode):
+        # Cxkk
+        self.v[idx, opcode.x] = self.rng.integers(
+            255, size=idx.shape[0]) & opcode.NN
+
+    def op_drw_vx_vy_nibble(self, idx: np.ndarray, opcode: Opcode):
+        # Dxyn, coordinates are read before VF is cleared
+        pos_x = (self.v[idx, opcode.x, None].astype(np.intp) +
+                 np.arange(8)) % self.WIDTH
+        base_y = self.v[idx, opcode.y].astype(np.intp)
+        collision = np.zeros(idx.shape[0], dtype=np.bool_)
+        shifts = np.arange(7, -1, -1)
+
+        for j in range(int(opcode.N.max(initial=0))):
+            rows = opcode.N > j
+            row_idx = idx[rows]
+            sprite_byte = self.ram[row_idx, (self.i[row_idx] + j) % 4096]
+            sprite_bits = ((sprite_byte[:, None] >> shifts) & 1).astype(
+                np.bool_)
+            pos_y = ((base_y[rows] + j) % self.HEIGHT)[:, None]
+            current = self.frame_buffer[row_idx[:, None], pos_x[rows], pos_y]
+
+            collision[rows] |= (current & sprite_bits).any(axis=1)
+            self.frame_buffer[row_idx[:, None], pos_x[rows],
+                              pos_y] = current ^ sprite_bits
+
+        self.v[idx, 0xF] = collision
+
+    def op_skp_vx(self, idx: np.ndarray, opcode: Opcode):
+        # Ex9E
+        self.pc[idx[self.keys[idx, self.v[idx, opcode.x]]]] += 2
+
+    def op_sknp_vx(self, idx: np.ndarray, opcode: Opcode):
+        # ExA1
+        self.pc[idx[~self.keys[idx, self.v[idx, opcode.x]]]] += 2
+
+    def op_ld_vx_dt(self, idx: np.ndarray, opcode: Opcode):
+        # Fx07
+        self.v[idx, opcode.x] = self.dt[idx]
+
+    def op_ld_vx_k(self, idx: np.ndarray, opcode: Opcode):
+        # Fx0A
+        keys = self.keys[idx]
+        pressed = keys.any(axis=1)
+
+        self.pc[idx[~pressed]] -= 2
+        self.v[idx[pressed], opcode.x[pressed]] = keys[pressed].argmax(axis=1)
+
+    def op_ld_dt_vx(self, idx: np.ndarray, opcode: Opcode):
+        # Fx15
+        self.dt[idx] = self.v[idx, opcode.x]
+
+    def op_ld_st_vx(self, idx: np.ndarray, opcode: Opcode):
+        # Fx18
+        self.st[idx] = self.v[idx, opcode.x]
+
+    def op_add_i_vx(self, idx: np.ndarray, opcode: Opcode):
+        # Fx1E
+        self.i[idx] += self.v[idx, opcode.x]
+
+    def op_ld_f_vx(self, idx: np.ndarray, opcode: Opcode):
+        # Fx29
+        self.i[idx] = self.FONTS_ADDRESS_MEMORY + 5 * self.v[
+            idx, opcode.x].astype(np.ushort)
+
+    def op_ld_b_vx(self, idx: np.ndarray, opcode: Opcode):
+        # Fx33
+        number = self.v[idx, opcode.x]
+        i = self.i[idx].astype(np.intp)
+        self.ram[idx, i + 2] = number % 10
+        self.ram[idx, i + 1] = (number // 10) % 10
+        self.ram[idx, i] = number // 100
+
+    def op_ld_i_vx(self, idx: np.ndarray, opcode: Opcode):
+        # Fx55
+        for register in range(16):
+            rows = opcode.x >= register
+            self.ram[idx[rows], self.i[idx[rows]].astype(np.intp) +
+                     register] = self.v[idx[rows], register]
+
+    def op_ld_vx_i(self, idx: np.ndarray, opcode: Opcode):
+        # Fx65
+        for register in range(16):
+            rows = opcode.x >= register
+            self.v[idx[rows], register] = self.ram[
+                idx[rows], self.i[idx[rows]].astype(np.intp) + register]
@@ -0,0 +1,237 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import typing
+import numpy as np
+from cpu import CPU, PackedCPU, Opcode
+from jit import JitCPU, PackedJitCPU
+from scalar import ScalarCPU
+
+CPU_TYPES = {
+    "cpu": CPU,
+    "packed": PackedCPU,
+    "jit": JitCPU,
+    "packed_jit": PackedJitCPU,
+    "scalar": ScalarCPU,
+}
+
+# small programs that loop forever at 0x200
+SYNTHETIC_ROMS = {
+    # arithmetic and skips
+    "loop": [
+        0x70, 0x01, 0x81, 0x04, 0x82, 0x15, 0x83, 0x26, 0x4F, 0x01, 0x74,
+        0x01, 0x12, 0x00
+    ],
+    # a font sprite walking over the screen
+    "draw": [
+        0xA0, 0x50, 0xD0, 0x15, 0x70, 0x05, 0x71, 0x03, 0x12, 0x02
+    ],
+    # bulk register stores/loads and BCD
+    "memory": [
+        0xA3, 0x00, 0xFF, 0x55, 0xFF, 0x65, 0xF0, 0x33, 0xF0, 0x1E, 0x70,
+        0x01, 0x12, 0x00
+    ],
+}
+
+# handler name -> opcode used to microbenchmark it
+MICRO_OPCODES = {
+    "op_cls": 0x00E0,
+    "op_jp_addr": 0x1200,
+    "op_se_vx_byte": 0x3344,
+    "op_ld_vx_byte": 0x6344,
+    "op_add_vx_byte": 0x7344,
+    "op_ld_vx_vy": 0x8340,
+    "op_or_vx_vy": 0x8341,
+    "op_add_vx_vy": 0x8344,
+    "op_sub_vx_vy": 0x8345,
+    "op_shr_vx_vy": 0x8346,
+    "op_shl_vx_vy": 0x834E,
+    "op_ld_i_addr": 0xA300,
+    "op_rnd_vx_byte": 0xC3FF,
+    "op_drw_vx_vy_nibble": 0xD01F,
+    "op_skp_vx": 0xE39E,
+    "op_ld_vx_dt": 0xF307,
+    "op_add_i_vx": 0xF31E,
+    "op_ld_b_vx": 0xF333,
+    "op_ld_i_vx": 0xFF55,
+    "op_ld_vx_i": 0xFF65,
+}
+
+THRESHOLD = 0.1
+
+# results committed with the code, they carry their own threshold since
+# the machine running the check is rarely the one that wrote them
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "benchmarks.json")
+
+
+def best_of(function: typing.Callable[[], None], repeat: int) -> float:
+    best = float("inf")
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def bench_rom(cpu_type: type,
+              program: typing.List[int],
+              instructions: int,
+              repeat: int = 3) -> float:
+    # instructions per second, headless, timers ticking every 10 instructions
+    cpu = cpu_type()
+    np.asarray(cpu.ram)[0x200:0x200 + len(program)] = program
+    frames = max(1, instructions // 10)
+
+    def run():
+        for _ in range(frames):
+            cpu.cpu_frame(10)
+
+    return frames * 10 / best_of(run, repeat)
+
+
+def bench_opcode(cpu_type: type,
+                 name: str,
+                 opcode: int,
+                 calls: int,
+                 repeat: int = 3) -> float:
+    # handler calls per second, pc and the stack are reset between calls
+    cpu = cpu_type()
+    cpu.i = 0x300
+    np.asarray(cpu.v)[:] = np.arange(16)
+    handler = getattr(cpu, name)
+    operands = Opcode.adapt(opcode)
+
+    def run():
+        for _ in range(calls):
+            handler(operands)
+            cpu.pc = 0x200
+
+    return calls / best_of(run, repeat)
+
+
+def bench_fork(cpu_type: type, calls: int, repeat: int = 3) -> float:
+    # forks per second of a machine that has run for a while
+    cpu = cpu_type()
+    program = SYNTHETIC_ROMS["memory"]
+    np.asarray(cpu.ram)[0x200:0x200 + len(program)] = program
+    cpu.cpu_frame(100)
+
+    def run():
+        for _ in range(calls):
+            cpu.fork()
+
+    return calls / best_of(run, repeat)
+
+
+def run(instructions: int = 20000,
+        calls: int = 2000,
+        cpu_types: typing.Iterable[str] = CPU_TYPES) -> typing.Dict:
+    results: typing.Dict[str, typing.Dict[str, float]] = {}
+
+    for type_name in cpu_types:
+        cpu_type = CPU_TYPES[type_name]
+
+        for rom_name, program in SYNTHETIC_ROMS.items():
+            results[f"rom/{rom_name}/{type_name}"] = {
+                "ips": bench_rom(cpu_type, program, instructions)
+            }
+
+        results[f"fork/{type_name}"] = {
+            "forks_per_second": bench_fork(cpu_type, calls)
+        }
+
+        for name, opcode in MICRO_OPCODES.items():
+            results[f"opcode/{name}/{type_name}"] = {
+                "calls_per_second": bench_opcode(cpu_type, name, opcode,
+                                                 calls)
+            }
+
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "results": results,
+    }
+
+
+def compare(results: typing.Dict,
+            baseline: typing.Dict,
+            threshold: typing.Optional[float] = None) -> typing.List[str]:
+    # every metric is a rate, a drop of more than threshold is a regression;
+    # without one the baseline's own is used, then THRESHOLD
+    if threshold is None:
+        threshold = baseline.get("threshold", THRESHOLD)
+
+    regressions = []
+
+    for name, metrics in results["results"].items():
+        for metric, value in metrics.items():
+            old = baseline["results"].get(name, {}).get(metric)
+
+            if old and value < old * (1 - threshold):
+                regressions.append(
+                    f"{name} {metric}: {value:.0f} < {old:.0f} "
+                    f"({value / old - 1:+.1%})")
+
+    return regressions
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Chip-8 benchmarks")
+    parser.add_argument("-o",
+                        "--output",
+                        help="write the results as json to this file.")
+    parser.add_argument("-b",
+                        "--baseline",
+                        nargs="?",
+                        const=BASELINE,
+                        help="compare against results stored in this file, "
+                        "the committed benchmarks.json if no file is given.")
+    parser.add_argument("-t",
+                        "--threshold",
+                        type=float,
+                        help="the slowdown ratio reported as a regression, "
+                        f"by default the baseline's or {THRESHOLD}.")
+    parser.add_argument("-q",
+                        "--quick",
+                        action="store_true",
+                        help="a tenth of the work, for smoke testing.")
+    parser.add_argument("-c",
+                        "--cpu",
+                        action="append",
+                        choices=list(CPU_TYPES),
+                        help="only benchmark these cpu types.")
+    args = parser.parse_args(argv)
+
+    scale = 10 if args.quick else 1
+    results = run(20000 // scale, 2000 // scale, args.cpu or CPU_TYPES)
+
+    for name, metrics in results["results"].items():
+        for metric, value in metrics.items():
+            print(f"{name:40} {value:>14,.0f} {metric}")
+
+    if args.output:
+        results["threshold"] = args.threshold or THRESHOLD
+
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+
+        for regression in regressions:
+            print("regression:", regression)
+
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
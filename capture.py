@@ -0,0 +1,252 @@
+import os
+import queue
+import struct
+import threading
+import typing
+import zlib
+import numpy as np
+from cpu import CPU
+from framebuffer import WIDTH, HEIGHT, pack_frame
+from scheduler import FRAME_RATE
+
+
+def unpack_frame(data: bytes, scale: int = 1) -> np.ndarray:
+    # packed rows back to a [height, width] array, each pixel scale x scale
+    rows = np.unpackbits(np.frombuffer(data, dtype=np.ubyte)).reshape(
+        HEIGHT, WIDTH)
+
+    return np.repeat(np.repeat(rows, scale, axis=0), scale, axis=1)
+
+
+class RawWriter:
+    # the 256 byte packed frames back to back, replayable with
+    # PackedFrameBuffer.frombytes
+
+    def __init__(self, path: str, scale: int = 1) -> None:
+        self.file = open(path, "wb")
+
+    def write(self, frame: bytes) -> None:
+        self.file.write(frame)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def png(pixels: np.ndarray) -> bytes:
+    # a 1 bit grayscale png, every row unfiltered
+    height, width = pixels.shape
+    rows = np.packbits(pixels, axis=1)
+    raw = np.hstack([np.zeros((height, 1), dtype=np.ubyte), rows])
+
+    def chunk(kind: bytes, body: bytes) -> bytes:
+        return (struct.pack(">I", len(body)) + kind + body +
+                struct.pack(">I", zlib.crc32(kind + body)))
+
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 1, 0, 0, 0, 0)),
+        chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)),
+        chunk(b"IEND", b""),
+    ])
+
+
+class PngWriter:
+    # one frame_<n>.png per frame in a directory
+
+    def __init__(self, path: str, scale: int = 1) -> None:
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.scale = scale
+        self.frames = 0
+
+    def write(self, frame: bytes) -> None:
+        name = os.path.join(self.path, f"frame_{self.frames:06d}.png")
+
+        with open(name, "wb") as file:
+            file.write(png(unpack_frame(frame, self.scale)))
+
+        self.frames += 1
+
+    def close(self) -> None:
+        pass
+
+
+def lzw(indices: bytes, min_size: int = 2) -> bytes:
+    # gif flavoured lzw: little endian variable width codes, a clear code
+    # whenever the 12 bit table fills up
+    clear = 1 << min_size
+    end = clear + 1
+    out = bytearray()
+    bits = 0
+    count = 0
+
+    def reset() -> typing.Dict[bytes, int]:
+        return {bytes([index]): index for index in range(clear)}
+
+    table = reset()
+    size = min_size + 1
+    next_code = end + 1
+
+    def emit(code: int) -> None:
+        nonlocal bits, count
+        bits |= code << count
+        count += size
+
+        while count >= 8:
+            out.append(bits & 0xFF)
+            bits >>= 8
+            count -= 8
+
+    emit(clear)
+    prefix = indices[:1]
+
+    for index in indices[1:]:
+        candidate = prefix + bytes([index])
+
+        if candidate in table:
+            prefix = candidate
+            continue
+
+        emit(table[prefix])
+
+        if next_code == 4096:
+            emit(clear)
+            table = reset()
+            size = min_size + 1
+            next_code = end + 1
+        else:
+            table[candidate] = next_code
+            next_code += 1
+
+            if next_code > 1 << size:
+                size += 1
+
+        prefix = bytes([index])
+
+    if prefix:
+        emit(table[prefix])
+
+    emit(end)
+
+    if count:
+        out.append(bits & 0xFF)
+
+    return bytes(out)
+
+
+class GifWriter:
+    # an animated black and white gif looping forever, gif delays are in
+    # hundredths of a second so 60 Hz plays back at 50
+
+    def __init__(self,
+                 path: str,
+                 scale: int = 1,
+                 frame_rate: int = FRAME_RATE) -> None:
+        self.file = open(path, "wb")
+        self.scale = scale
+        self.delay = max(2, round(100 / frame_rate))
+        width, height = WIDTH * scale, HEIGHT * scale
+
+        self.file.write(b"GIF89a" + struct.pack("<HHBBB", width, height,
+                                                0x80, 0, 0))
+        self.file.write(b"\x00\x00\x00\xff\xff\xff")
+        self.file.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00")
+
+    def write(self, frame: bytes) -> None:
+        pixels = unpack_frame(frame, self.scale)
+        height, width = pixels.shape
+        data = lzw(pixels.tobytes())
+
+        self.file.write(struct.pack("<BBBBHBB", 0x21, 0xF9, 4, 0, self.delay,
+                                    0, 0))
+        self.file.write(struct.pack("<BHHHHB", 0x2C, 0, 0, width, height, 0))
+        self.file.write(b"\x02")
+
+        for start in range(0, len(data), 255):
+            block = data[start:start + 255]
+            self.file.write(bytes([len(block)]) + block)
+
+        self.file.write(b"\x00")
+
+    def close(self) -> None:
+        self.file.write(b"\x3b")
+        self.file.close()
+
+
+WRITERS = {
+    "raw": RawWriter,
+    "png": PngWriter,
+    "gif": GifWriter,
+}
+
+
+def open_writer(path: str, scale: int = 1):
+    # by extension, anything but .raw or .gif is a png directory
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    return WRITERS.get(extension, PngWriter)(path, scale)
+
+
+class Capture:
+    # frames are packed on the emulation side and handed to a writer thread
+    # through a bounded queue, when it is full the frame is dropped and
+    # counted so encoding never holds up emulation
+
+    def __init__(self, writer, queue_size: int = 120) -> None:
+        self.writer = writer
+        self.queue: "queue.Queue[typing.Optional[bytes]]" = queue.Queue(
+            queue_size)
+        self.captured = 0
+        self.dropped = 0
+        self.written = 0
+        self.error: typing.Optional[BaseException] = None
+        self.thread = threading.Thread(target=self._write,
+                                       name="capture",
+                                       daemon=True)
+        self.thread.start()
+
+    def _write(self) -> None:
+        # after an error the queue is still drained so close() never blocks
+        while True:
+            frame = self.queue.get()
+
+            if frame is None:
+                break
+
+            if self.error is not None:
+                continue
+
+            try:
+                self.writer.write(frame)
+                self.written += 1
+            except Exception as error:
+                self.error = error
+
+        try:
+            self.writer.close()
+        except Exception as error:
+            self.error = self.error or error
+
+    def push(self, frame_buffer) -> None:
+        try:
+            self.queue.put_nowait(pack_frame(frame_buffer))
+            self.captured += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def record(self, cpu: CPU) -> None:
+        # a scheduler hook
+        self.push(cpu.frame_buffer)
+
+    def close(self) -> None:
+        # waits for everything queued to be written
+        self.queue.put(None)
+        self.thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self) -> "Capture":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
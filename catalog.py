@@ -0,0 +1,108 @@
+import glob
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import typing
+import numpy as np
+from analysis import analyze
+
+# bump when analyze() changes, older cache entries are then recomputed
+ANALYSIS_VERSION = 3
+
+
+def default_cache_dir() -> str:
+    return os.environ.get("CHIP8_CACHE") or os.path.join(
+        os.path.expanduser("~"), ".cache", "chip8")
+
+
+def rom_hash(rom: typing.Union[bytes, np.ndarray]) -> str:
+    return hashlib.sha256(rom).hexdigest()
+
+
+def map_rom(path: str) -> np.ndarray:
+    # a read only view of the file, the mapping lives as long as the array
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return np.zeros(0, dtype=np.ubyte)
+
+        return np.frombuffer(mmap.mmap(file.fileno(), 0,
+                                       access=mmap.ACCESS_READ),
+                             dtype=np.ubyte)
+
+
+class Rom(typing.NamedTuple):
+    path: str
+    data: np.ndarray
+    hash: str
+    analysis: typing.Dict
+
+    @property
+    def ipf(self) -> int:
+        return self.analysis["ipf"]
+
+
+class Catalog:
+    # roms keyed by the sha256 of their bytes, the analysis of each is kept
+    # in cache_dir/<hash>.json so changed bytes never hit a stale entry
+
+    def __init__(self, cache_dir: typing.Optional[str] = None) -> None:
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.roms: typing.Dict[str, Rom] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def cache_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, digest + ".json")
+
+    def analysis(self, data: np.ndarray, digest: str) -> typing.Dict:
+        try:
+            with open(self.cache_path(digest)) as file:
+                cached = json.load(file)
+
+            if (cached.get("version") == ANALYSIS_VERSION
+                    and cached.get("hash") == digest):
+                self.hits += 1
+                return cached
+        except (OSError, ValueError):
+            pass
+
+        self.misses += 1
+        result = {"version": ANALYSIS_VERSION, "hash": digest}
+        result.update(analyze(data.tobytes()))
+        self.store(digest, result)
+
+        return result
+
+    def store(self, digest: str, result: typing.Dict) -> None:
+        # written to a temporary file and renamed so concurrent jobs never
+        # read half an entry; a read only cache only costs the reanalysis
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            handle, temporary = tempfile.mkstemp(dir=self.cache_dir,
+                                                 suffix=".tmp")
+
+            with os.fdopen(handle, "w") as file:
+                json.dump(result, file)
+
+            os.replace(temporary, self.cache_path(digest))
+        except OSError:
+            pass
+
+    def load(self, path: str) -> Rom:
+        data = map_rom(path)
+        digest = rom_hash(data)
+        rom = self.roms.get(digest)
+
+        if rom is None:
+            rom = Rom(path, data, digest, self.analysis(data, digest))
+            self.roms[digest] = rom
+
+        return rom
+
+    def scan(self, directory: str, pattern: str = "*.ch8") -> typing.List[Rom]:
+        return [
+            self.load(path)
+            for path in sorted(glob.glob(os.path.join(directory, pattern)))
+        ]
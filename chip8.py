@@ -1,60 +1,433 @@
 import argparse
-from ast import arg
-import numpy as np
-import pygame
+import queue
+import random
 import sys
-from cpu import CPU
-import gpu
-from key_map import key_map
+import time
+import typing
+from cpu import CPU, PackedCPU
+from jit import JitCPU, PackedJitCPU
+from scalar import ScalarCPU
+from keypad import Keypad
+from display import DISPLAYS
+from scheduler import FrameScheduler
+from savestate import Rewind
+from recording import Recording, RecordingError, replay
+from framebuffer import frame_hash
+from catalog import Catalog, Rom
 
-parser = argparse.ArgumentParser(description="Chip-8")
+if typing.TYPE_CHECKING:
+    from capture import Capture
+    from debugger import Debugger, Console
+    from profiler import Profiler
+    from telemetry import Telemetry, MetricsServer
 
-parser.add_argument("rom", type=str, help="The path to the rom file")
-parser.add_argument(
-    "-d",
-    "--delay",
-    default=1,
-    type=int,
-    help="the delay time the cpu takes before performing another operation.")
-parser.add_argument(
-    "-s",
-    "--scale",
-    default=15,
-    type=int,
-    help="the delay time the cpu takes before performing another operation.")
+# pygame, gpu and key_map are imported by run_window() only, so headless
+# runs, tests and worker processes never load SDL; every optional feature
+# is likewise imported by the branch that turns it on
 
-args = parser.parse_args()
 
-gpu.scale = args.scale
-gpu.delaytime = args.delay
-pygame.init()
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Chip-8")
 
-screen = pygame.display.set_mode(
-    (gpu.width * gpu.scale, gpu.height * gpu.scale))
+    parser.add_argument("rom", type=str, help="The path to the rom file")
+    parser.add_argument(
+        "-i",
+        "--ipf",
+        type=int,
+        help="the number of instructions the cpu performs every 60 Hz frame, "
+        "recommended per rom by default.")
+    parser.add_argument(
+        "-s",
+        "--scale",
+        default=15,
+        type=int,
+        help="the delay time the cpu takes before performing another "
+        "operation.")
+    parser.add_argument(
+        "-b",
+        "--display",
+        default="pygame",
+        choices=["pygame"] + list(DISPLAYS),
+        help="the display backend, null and framebuffer run without a window.")
+    parser.add_argument(
+        "-n",
+        "--frames",
+        default=0,
+        type=int,
+        help="stop after this many frames, 0 runs until the window is closed.")
+    parser.add_argument(
+        "-p",
+        "--packed",
+        action="store_true",
+        help="use the packed 64 bit row framebuffer.")
+    parser.add_argument(
+        "-j",
+        "--jit",
+        action="store_true",
+        help="translate basic blocks to python functions instead of "
+        "interpreting.")
+    parser.add_argument(
+        "-r",
+        "--rewind",
+        default=10,
+        type=int,
+        help="seconds of play kept for rewinding with backspace, 0 disables "
+        "it.")
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="profile opcodes and addresses, writing a json report on exit.")
+    parser.add_argument(
+        "--scalar",
+        action="store_true",
+        help="use the numpy free scalar cpu, implies the packed framebuffer.")
+    parser.add_argument(
+        "--exact",
+        action="store_true",
+        help="keep running instructions while a rom waits on a timer or a "
+        "key.")
+    parser.add_argument(
+        "--layout",
+        metavar="PATH",
+        help="a json keypad layout to use instead of the default one.")
+    parser.add_argument(
+        "-t",
+        "--threaded",
+        action="store_true",
+        help="emulate on a separate thread so presenting never stalls the "
+        "cpu.")
+    parser.add_argument(
+        "--capture",
+        metavar="PATH",
+        help="write every frame to a .gif, a .raw packed stream or a png "
+        "directory.")
+    parser.add_argument(
+        "--capture-scale",
+        default=4,
+        type=int,
+        help="the pixel size of gif and png captures.")
+    parser.add_argument(
+        "--debug",
+        action="store_true",
+        help="start paused in the console debugger.")
+    parser.add_argument(
+        "--break",
+        dest="breaks",
+        metavar="ADDR",
+        action="append",
+        default=[],
+        type=lambda text: int(text, 16),
+        help="a hex breakpoint address for the debugger, may be repeated.")
+    parser.add_argument(
+        "--stream",
+        metavar="ADDRESS",
+        help="run headless at 60 Hz, streaming frames to viewers on "
+        "host:port or a unix socket path.")
+    parser.add_argument(
+        "--cache",
+        metavar="DIR",
+        help="where rom analyses are kept, ~/.cache/chip8 by default.")
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="seed the random number generator, random by default.")
+    parser.add_argument(
+        "--record",
+        metavar="PATH",
+        help="record the seed and key presses to this file, disables rewind.")
+    parser.add_argument(
+        "--replay",
+        metavar="PATH",
+        help="replay a recording headless and unpaced, printing the frame "
+        "hash.")
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        help="write prometheus style metrics to this file every interval.")
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="serve prometheus style metrics on localhost:PORT/metrics.")
+    parser.add_argument(
+        "--metrics-interval",
+        default=1.0,
+        type=float,
+        help="seconds between metric updates.")
+    parser.add_argument(
+        "--overlay",
+        action="store_true",
+        help="show the frame rate, speed and time split over the window.")
 
-pygame.display.set_caption("Chip-8")
+    return parser
 
-screen.fill(gpu.Colors.black)
 
-clock = pygame.time.Clock()
+def cpu_class(args: argparse.Namespace) -> type:
+    if args.scalar:
+        return ScalarCPU
+    if args.jit:
+        return PackedJitCPU if args.packed else JitCPU
 
-cpu = CPU(screen)
-cpu.load_rom_to_ram(args.rom)
+    return PackedCPU if args.packed else CPU
 
-while True:
 
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            sys.exit()
+class Session:
+    # what every front end shares: the profiler, the debugger, capture and
+    # telemetry
 
-        if event.type == pygame.KEYDOWN:
-            key = pygame.key.get_pressed()
-            for k, v in key_map.items():
-                if key[v]:
-                    cpu.keys[k] = 1
+    def __init__(self, args: argparse.Namespace, rom: Rom,
+                 seed: int) -> None:
+        self.args = args
+        self.rom = rom
+        self.seed = seed
+        self.debugging = args.debug or bool(args.breaks)
+        self.profiler: typing.Optional["Profiler"] = None
+        self.debugger: typing.Optional["Debugger"] = None
+        self.console: typing.Optional["Console"] = None
+        self.capture: typing.Optional["Capture"] = None
+        self.telemetry: typing.Optional["Telemetry"] = None
+        self.metrics_server: typing.Optional["MetricsServer"] = None
+        self.hooks: typing.List[typing.Callable[[CPU], None]] = []
 
-        if event.type == pygame.KEYUP:
-            cpu.keys = np.zeros(16, dtype=np.bool_)
+        if args.profile:
+            from profiler import Profiler
+            self.profiler = Profiler()
 
-    pygame.time.delay(gpu.delaytime)
-    cpu.cpu_cycle()
+        if self.debugging:
+            from debugger import Debugger, Console
+            self.debugger = Debugger(args.ipf)
+            self.console = Console(self.debugger)
+
+        if args.capture:
+            from capture import Capture, open_writer
+            self.capture = Capture(
+                open_writer(args.capture, args.capture_scale))
+            self.hooks.append(self.capture.record)
+
+        if args.metrics or args.metrics_port is not None or args.overlay:
+            from telemetry import Telemetry, TextfileExporter, MetricsServer
+            self.telemetry = Telemetry(interval=args.metrics_interval)
+
+        if args.metrics:
+            self.telemetry.exporters.append(TextfileExporter(args.metrics))
+
+        if args.metrics_port is not None:
+            self.metrics_server = MetricsServer(self.telemetry,
+                                                args.metrics_port)
+
+    def create(self, cpu_type: type, display) -> CPU:
+        args = self.args
+        cpu = cpu_type(display, self.seed)
+        cpu.load_rom(self.rom.data)
+        cpu.idle_skip = not args.exact
+
+        if self.telemetry is not None:
+            self.telemetry.attach(cpu)
+
+        if self.profiler is not None:
+            self.profiler.attach(cpu)
+
+        if self.debugger is not None:
+            self.debugger.breakpoints.update(args.breaks)
+            self.debugger.attach(cpu)
+
+            if args.debug:
+                self.debugger.pause("started paused, h for help")
+
+        return cpu
+
+    def debug_input(self) -> bool:
+        # the console takes over while the debugger has the machine paused
+        if self.debugger is None or not self.debugger.paused:
+            return True
+
+        return self.console.prompt()
+
+    def report(self) -> None:
+        if self.telemetry is not None:
+            self.telemetry.flush()
+            print(self.telemetry.summary())
+
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+
+        if self.capture:
+            self.capture.close()
+            print(f"captured {self.capture.captured} "
+                  f"dropped {self.capture.dropped}")
+
+        if self.profiler is not None:
+            print(self.profiler.report())
+            self.profiler.dump(self.args.profile)
+
+
+def run_replay(args: argparse.Namespace, cpu_type: type) -> None:
+    recording = Recording.load(args.replay)
+    start = time.perf_counter()
+    cpu = replay(recording, args.rom, cpu_type)
+    elapsed = time.perf_counter() - start
+
+    print(f"{recording.frames} frames in {elapsed:.3f}s, "
+          f"{recording.frames / max(elapsed, 1e-9):,.0f} fps")
+    print(frame_hash(cpu.frame_buffer))
+
+
+def run_headless(session: Session, cpu_type: type) -> None:
+    args = session.args
+    # a streamed session has no window whatever --display says
+    cpu = session.create(cpu_type,
+                         DISPLAYS.get(args.display, DISPLAYS["null"])())
+    poll_input = session.debug_input if session.debugging else None
+    hooks = list(session.hooks)
+    server = None
+
+    if args.stream:
+        from stream import StreamServer, parse_address
+
+        # viewers send keys back, they are latched before every frame
+        server = StreamServer(parse_address(args.stream))
+        hooks.append(server.record)
+
+        def stream_input() -> bool:
+            return session.debug_input() and server.poll(cpu)
+
+        poll_input = stream_input
+
+    try:
+        FrameScheduler(cpu,
+                       args.ipf,
+                       poll_input=poll_input,
+                       paced=server is not None,
+                       hooks=hooks,
+                       telemetry=session.telemetry).run(args.frames)
+    finally:
+        if server is not None:
+            server.close()
+
+
+def run_window(session: Session, cpu_type: type) -> None:
+    import pygame
+    import gpu
+    from key_map import key_map, load_layout
+
+    args = session.args
+    gpu.scale = args.scale
+    pygame.init()
+
+    cpu = session.create(cpu_type, gpu.PygameDisplay(gpu.scale))
+    rewind = Rewind(args.rewind * 60)
+    keypad = Keypad(load_layout(args.layout) if args.layout else key_map)
+    # frames to rewind, queued by the event loop and applied before a frame
+    # so the machine is only ever touched by the thread emulating it
+    rewinds: "queue.SimpleQueue[int]" = queue.SimpleQueue()
+
+    def poll_events() -> bool:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return False
+
+            if (event.type == pygame.KEYDOWN
+                    and event.key == pygame.K_BACKSPACE and not args.record):
+                rewinds.put(60)
+
+            elif event.type == pygame.KEYDOWN:
+                keypad.press(event.key)
+
+            elif event.type == pygame.KEYUP:
+                keypad.release(event.key)
+
+        return True
+
+    def latch_input() -> bool:
+        if not session.debug_input():
+            return False
+
+        while not rewinds.empty():
+            rewind.rewind(cpu, rewinds.get())
+
+        keypad.latch(cpu)
+
+        return True
+
+    def poll_input() -> bool:
+        return poll_events() and latch_input()
+
+    if args.record:
+        # rewinding would make the session impossible to replay
+        recording = Recording(session.rom.hash, session.seed, args.ipf,
+                              cpu.idle_skip)
+        hooks = [recording.record]
+    else:
+        hooks = [rewind.record] if args.rewind else []
+
+    hooks += session.hooks
+
+    if args.overlay:
+        display = cpu.display
+
+        def show(telemetry: "Telemetry") -> None:
+            display.overlay = telemetry.summary()
+
+        session.telemetry.exporters.append(show)
+
+    if args.threaded:
+        from threaded import ThreadedScheduler
+
+        scheduler = ThreadedScheduler(cpu,
+                                      cpu.display,
+                                      args.ipf,
+                                      poll_input=latch_input,
+                                      poll_events=poll_events,
+                                      hooks=hooks,
+                                      telemetry=session.telemetry)
+        scheduler.run(args.frames)
+        print(" ".join(f"{name} {count}"
+                       for name, count in scheduler.stats().items()))
+    else:
+        FrameScheduler(cpu,
+                       args.ipf,
+                       poll_input=poll_input,
+                       hooks=hooks,
+                       telemetry=session.telemetry).run(args.frames)
+
+    if args.record:
+        recording.save(args.record)
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    # both replace cpu methods on the instance, which __slots__ forbids
+    if (args.debug or args.breaks or args.profile) and args.scalar:
+        parser.error("the debugger and the profiler need a cpu with "
+                     "instance attributes, not --scalar")
+
+    if args.overlay and (args.display != "pygame" or args.stream):
+        parser.error("--overlay needs the pygame window")
+
+    cpu_type = cpu_class(args)
+
+    if args.replay:
+        try:
+            run_replay(args, cpu_type)
+        except RecordingError as error:
+            parser.error(f"{args.replay}: {error}")
+        return 0
+
+    rom = Catalog(args.cache).load(args.rom)
+    args.ipf = args.ipf or rom.ipf
+    seed = random.getrandbits(64) if args.seed is None else args.seed
+    session = Session(args, rom, seed)
+
+    if args.display == "pygame" and not args.stream:
+        run_window(session, cpu_type)
+    else:
+        run_headless(session, cpu_type)
+
+    session.report()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
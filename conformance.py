@@ -0,0 +1,254 @@
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import typing
+from analysis import rom_paths
+from benchmarks import CPU_TYPES
+from catalog import rom_hash
+from framebuffer import frame_hash
+from recording import Recording, replay
+from savestate import save_state
+
+VERSION = 1
+FRAMES = 300
+INSTRUCTIONS_PER_FRAME = 10
+PERIOD = 60
+SEED = 0
+
+Script = typing.List[typing.Tuple[int, int]]
+
+
+def default_script(frames: int) -> Script:
+    # every 30 frames the next keypad key is held for 10, so roms waiting
+    # on input get somewhere
+    script: Script = []
+
+    for start in range(30, frames, 30):
+        script.append((start, 1 << ((start // 30 - 1) % 16)))
+        script.append((start + 10, 0))
+
+    return [change for change in script if change[0] < frames]
+
+
+def run_rom(path: str,
+            frames: int = FRAMES,
+            instructions_per_frame: int = INSTRUCTIONS_PER_FRAME,
+            script: typing.Optional[Script] = None,
+            period: int = PERIOD,
+            cpu_type: str = "cpu",
+            seed: int = SEED) -> typing.Dict:
+    with open(path, "rb") as file:
+        rom = rom_hash(file.read())
+
+    recording = Recording(rom, seed, instructions_per_frame)
+    recording.frames = frames
+    recording.changes = [
+        tuple(change)
+        for change in (default_script(frames) if script is None else script)
+    ]
+    periodic: typing.List[str] = []
+    counter = itertools.count(1)
+
+    def sample(cpu) -> None:
+        if period and next(counter) % period == 0:
+            periodic.append(frame_hash(cpu.frame_buffer))
+
+    try:
+        cpu = replay(recording, path, CPU_TYPES[cpu_type], hooks=[sample])
+    except Exception as error:
+        # a crash is an outcome like any other, it has to stay the same and
+        # must not take the rest of the run down with it
+        return {
+            "sha256": rom,
+            "error": f"{type(error).__name__}: {error}",
+            "periodic": periodic,
+        }
+
+    return {
+        "sha256": rom,
+        "frame": frame_hash(cpu.frame_buffer),
+        "state": hashlib.sha1(save_state(cpu)).hexdigest(),
+        "periodic": periodic,
+    }
+
+
+def _run(job: typing.Tuple[str, str, typing.Dict]) -> typing.Tuple:
+    name, path, options = job
+    return name, run_rom(path, **options)
+
+
+def run_all(directory: str,
+            golden: typing.Dict,
+            jobs: int = 0,
+            cpu_type: str = "cpu") -> typing.Dict[str, typing.Dict]:
+    # every rom under directory keyed by its relative path, on a process
+    # pool unless jobs is 1
+    settings = {
+        "frames": golden["frames"],
+        "instructions_per_frame": golden["ipf"],
+        "period": golden["period"],
+        "seed": golden["seed"],
+        "cpu_type": cpu_type,
+    }
+    work = []
+
+    for path in rom_paths([directory]):
+        name = os.path.relpath(path, directory).replace(os.sep, "/")
+        options = dict(settings)
+        options["script"] = golden["roms"].get(name, {}).get("script")
+        work.append((name, path, options))
+
+    jobs = jobs or multiprocessing.cpu_count()
+
+    if jobs == 1 or len(work) < 2:
+        return dict(map(_run, work))
+
+    # spawned like pool.EnvPool's workers, see there
+    context = multiprocessing.get_context("spawn")
+
+    with context.Pool(min(jobs, len(work))) as pool:
+        return dict(pool.imap_unordered(_run, work))
+
+
+def compare(results: typing.Dict[str, typing.Dict],
+            golden: typing.Dict) -> typing.List[str]:
+    problems = []
+
+    for name, result in sorted(results.items()):
+        expected = golden["roms"].get(name)
+
+        if expected is None:
+            problems.append(f"{name}: no golden hashes")
+            continue
+
+        if expected["sha256"] != result["sha256"]:
+            problems.append(f"{name}: the rom changed")
+            continue
+
+        for index, (old, new) in enumerate(
+                zip(expected["periodic"], result["periodic"])):
+            if old != new:
+                frame = (index + 1) * golden["period"]
+                problems.append(f"{name}: frame {frame} differs")
+                break
+        else:
+            if expected.get("error") != result.get("error"):
+                problems.append(f"{name}: {result.get('error', 'no error')}"
+                                f" instead of {expected.get('error', 'none')}")
+            elif expected.get("frame") != result.get("frame"):
+                problems.append(f"{name}: final frame differs")
+            elif expected.get("state") != result.get("state"):
+                problems.append(f"{name}: final state differs")
+
+    for name in sorted(golden["roms"].keys() - results.keys()):
+        problems.append(f"{name}: missing")
+
+    return problems
+
+
+def new_golden(frames: int = FRAMES,
+               instructions_per_frame: int = INSTRUCTIONS_PER_FRAME,
+               period: int = PERIOD,
+               seed: int = SEED) -> typing.Dict:
+    return {
+        "version": VERSION,
+        "frames": frames,
+        "ipf": instructions_per_frame,
+        "period": period,
+        "seed": seed,
+        "roms": {},
+    }
+
+
+def update(golden: typing.Dict,
+           results: typing.Dict[str, typing.Dict]) -> None:
+    # keeps any hand written scripts
+    for name, result in results.items():
+        script = golden["roms"].get(name, {}).get("script")
+        golden["roms"][name] = dict(result)
+
+        if script is not None:
+            golden["roms"][name]["script"] = script
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Chip-8 conformance runner")
+    parser.add_argument("roms", help="the directory of roms to run.")
+    parser.add_argument("-g",
+                        "--golden",
+                        required=True,
+                        help="the json file of golden hashes.")
+    parser.add_argument("-u",
+                        "--update",
+                        action="store_true",
+                        help="write the current hashes as the golden ones.")
+    parser.add_argument("-n",
+                        "--frames",
+                        default=FRAMES,
+                        type=int,
+                        help="frames per rom for a new golden file.")
+    parser.add_argument("-i",
+                        "--ipf",
+                        default=INSTRUCTIONS_PER_FRAME,
+                        type=int,
+                        help="instructions per frame for a new golden file.")
+    parser.add_argument("-p",
+                        "--period",
+                        default=PERIOD,
+                        type=int,
+                        help="hash the frame every this many frames, 0 only "
+                        "hashes the last.")
+    parser.add_argument("-j",
+                        "--jobs",
+                        default=0,
+                        type=int,
+                        help="worker processes, one per core by default.")
+    parser.add_argument("-c",
+                        "--cpu",
+                        action="append",
+                        choices=list(CPU_TYPES),
+                        help="check these cpu types, cpu by default.")
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.golden):
+        with open(args.golden) as file:
+            golden = json.load(file)
+
+        if golden.get("version") != VERSION:
+            parser.error(f"{args.golden} is version {golden.get('version')}, "
+                         f"expected {VERSION}; delete it to start over")
+    else:
+        golden = new_golden(args.frames, args.ipf, args.period)
+
+    problems = []
+
+    for index, cpu_type in enumerate(args.cpu or ["cpu"]):
+        results = run_all(args.roms, golden, args.jobs, cpu_type)
+
+        # the first cpu writes the hashes, any others are checked against
+        # them so an update never hides a disagreement between cpus
+        if args.update and index == 0:
+            update(golden, results)
+
+            with open(args.golden, "w") as file:
+                json.dump(golden, file, indent=1, sort_keys=True)
+
+            print(f"{cpu_type}: {len(results)} roms written to {args.golden}")
+            continue
+
+        problems += [f"{cpu_type} {problem}"
+                     for problem in compare(results, golden)]
+        print(f"{cpu_type}: {len(results)} roms")
+
+    for problem in problems:
+        print(problem)
+
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,30 +1,185 @@
-from dataclasses import dataclass
+import typing
+from typing import NamedTuple
 import numpy as np
 from fonts import FONTS
-import pygame
-from gpu import scale_rect, Colors
+from display import Display, NullDisplay
+from framebuffer import PackedFrameBuffer
 
 
-@dataclass(frozen=True)
-class Opcode:
-
-    def __init__(self) -> None:
-        self.opcode: np.ushort
-        self.NNN: np.ushort
-        self.NN: np.ushort
-        self.N: np.ubyte
-        self.x: np.ubyte
-        self.y: np.ubyte
+class Opcode(NamedTuple):
+    opcode: int
+    NNN: int
+    NN: int
+    N: int
+    x: int
+    y: int
 
     @classmethod
     def adapt(cls, opcode: np.ushort):
-        cls.opcode = opcode
-        cls.NNN = opcode & 0x0FFF
-        cls.NN = opcode & 0x00FF
-        cls.N = opcode & 0x000F
-        cls.x = (opcode & 0x0F00) >> 8
-        cls.y = (opcode & 0x00F0) >> 4
-        return cls
+        opcode = int(opcode)
+        return cls(opcode, opcode & 0x0FFF, opcode & 0x00FF, opcode & 0x000F,
+                   (opcode & 0x0F00) >> 8, (opcode & 0x00F0) >> 4)
+
+
+class IllegalOpcodeError(Exception):
+
+    def __init__(self, opcode: int, address: int) -> None:
+        super().__init__(f"illegal opcode {opcode:04X} at {address:03X}")
+        self.opcode = opcode
+        self.address = address
+
+
+class SpriteRangeError(IndexError):
+    # Dxyn with I + n past the end of ram, raised by every interpreter
+    # before anything is drawn rather than by whichever read fails first
+
+    def __init__(self, address: int, rows: int) -> None:
+        super().__init__(
+            f"sprite of {rows} rows at {address:03X} runs past the end of ram")
+        self.address = address
+        self.rows = rows
+
+
+class FrameIdle(Exception):
+    # raised by a handler when the rest of the frame would only spin, ends
+    # the frame early
+    pass
+
+
+def timer_wait_loop(ram, start: int, jump: int) -> bool:
+    # Fx07, 3xkk or 4xkk, then a jump back to the Fx07: nothing the loop
+    # reads changes until the timers tick at the end of the frame
+    if jump - start != 4:
+        return False
+
+    x = ram[start] & 0x0F
+
+    return (ram[start] & 0xF0 == 0xF0 and ram[start + 1] == 0x07
+            and ram[start + 2] in (0x30 | x, 0x40 | x))
+
+
+ZERO_HANDLERS = {
+    0x00E0: "op_cls",
+    0x00EE: "op_ret",
+}
+
+ARITHMETIC_HANDLERS = {
+    0x0: "op_ld_vx_vy",
+    0x1: "op_or_vx_vy",
+    0x2: "op_and_vx_vy",
+    0x3: "op_xor_vx_vy",
+    0x4: "op_add_vx_vy",
+    0x5: "op_sub_vx_vy",
+    0x6: "op_shr_vx_vy",
+    0x7: "op_subn_vx_vy",
+    0xE: "op_shl_vx_vy",
+}
+
+E_HANDLERS = {
+    0x9E: "op_skp_vx",
+    0xA1: "op_sknp_vx",
+}
+
+F_HANDLERS = {
+    0x07: "op_ld_vx_dt",
+    0x0A: "op_ld_vx_k",
+    0x15: "op_ld_dt_vx",
+    0x18: "op_ld_st_vx",
+    0x1E: "op_add_i_vx",
+    0x29: "op_ld_f_vx",
+    0x33: "op_ld_b_vx",
+    0x55: "op_ld_i_vx",
+    0x65: "op_ld_vx_i",
+}
+
+GENERAL_HANDLERS = {
+    0x1: "op_jp_addr",
+    0x2: "op_call_addr",
+    0x3: "op_se_vx_byte",
+    0x4: "op_sne_vx_byte",
+    0x5: "op_se_vx_vy",
+    0x6: "op_ld_vx_byte",
+    0x7: "op_add_vx_byte",
+    0x9: "op_sne_vx_vy",
+    0xA: "op_ld_i_addr",
+    0xB: "op_jp_v0_addr",
+    0xC: "op_rnd_vx_byte",
+    0xD: "op_drw_vx_vy_nibble",
+}
+
+ILLEGAL_HANDLER = "op_illegal"
+# 0nnn called machine code on the original interpreters, it is ignored as
+# modern ones do; 0000 is not, it is what running into empty ram looks like
+SYS_HANDLER = "op_sys"
+
+
+def handler_name(opcode: int) -> str:
+    family = opcode >> 12
+
+    if family == 0x0:
+        return ZERO_HANDLERS.get(opcode,
+                                 SYS_HANDLER if opcode else ILLEGAL_HANDLER)
+    if family == 0x8:
+        return ARITHMETIC_HANDLERS.get(opcode & 0x000F, ILLEGAL_HANDLER)
+    if family == 0xE:
+        return E_HANDLERS.get(opcode & 0x00FF, ILLEGAL_HANDLER)
+    if family == 0xF:
+        return F_HANDLERS.get(opcode & 0x00FF, ILLEGAL_HANDLER)
+
+    return GENERAL_HANDLERS[family]
+
+
+_decoded_opcodes: typing.Optional[typing.List[Opcode]] = None
+_handler_names: typing.Optional[typing.List[str]] = None
+
+
+def decoded_opcodes() -> typing.List[Opcode]:
+    # every 16 bit value split into its operands, built once per process
+    global _decoded_opcodes, _handler_names
+
+    if _decoded_opcodes is None:
+        _decoded_opcodes = [Opcode.adapt(op) for op in range(0x10000)]
+        _handler_names = [handler_name(op) for op in range(0x10000)]
+
+    return _decoded_opcodes
+
+
+def handler_names() -> typing.List[str]:
+    decoded_opcodes()
+    return _handler_names
+
+
+def decode(opcode: int) -> Opcode:
+    return decoded_opcodes()[opcode]
+
+
+def build_decode_table(
+        cls: type) -> typing.List[typing.Tuple[typing.Callable, Opcode]]:
+    # built once per class so subclasses that override a handler get their
+    # own table
+    table = cls.__dict__.get("_decode_table")
+
+    if table is None:
+        opcodes = decoded_opcodes()
+        names = handler_names()
+        handlers = {name: getattr(cls, name) for name in set(names)}
+        table = [(handlers[name], opcode)
+                 for name, opcode in zip(names, opcodes)]
+        cls._decode_table = table
+
+    return table
+
+
+# fork() seeds each new bit generator from this instead of the os, its
+# state is overwritten straight away anyway
+_FORK_SEED = np.random.SeedSequence(0)
+
+
+def fork_rng(rng: np.random.Generator) -> np.random.Generator:
+    # an independent generator that continues exactly where rng is
+    bit_generator = type(rng.bit_generator)(_FORK_SEED)
+    bit_generator.state = rng.bit_generator.state
+    return np.random.Generator(bit_generator)
 
 
 class CPU:
@@ -34,7 +189,9 @@ class CPU:
     WIDTH = np.ubyte(64)
     HEIGHT = np.ubyte(32)
 
-    def __init__(self, screen):
+    def __init__(self,
+                 display: typing.Optional[Display] = None,
+                 seed: typing.Optional[int] = None):
         self.v = np.zeros(16, dtype=np.ubyte)
         self.i: np.ushort = 0
         self.stack = np.zeros(64, dtype=np.ushort)
@@ -45,24 +202,72 @@ class CPU:
         self.pc: np.ushort = self.FIRST_ADDRESS_MEMORY
         self.ram = np.zeros(4096, dtype=np.ubyte)
         self.keys = np.zeros(16, dtype=np.bool_)
+        self.rng = np.random.default_rng(seed)
+        # end a frame early when the program is waiting on a timer or a key
+        self.idle_skip = False
+        self.idle_frames = 0
         self.ram[self.FONTS_ADDRESS_MEMORY:self.FONTS_ADDRESS_MEMORY +
                  FONTS.shape[0]] = FONTS
-        self.screen = screen
+        self.display = NullDisplay() if display is None else display
+        self.dispatch = self.decode_table()
 
     def load_rom_to_ram(self, path: str) -> None:
-        with open(path, "rb") as file:
-            buffer = file.read()
-        buffer_np = np.array(list(buffer), dtype=np.ubyte)
+        self.load_rom(np.fromfile(path, dtype=np.ubyte))
+
+    def load_rom(self, rom: typing.Union[bytes, np.ndarray]) -> None:
+        buffer_np = np.frombuffer(rom, dtype=np.ubyte)
         self.ram[self.pc:self.pc + buffer_np.shape[0]] = buffer_np
 
+    def fork(self) -> "CPU":
+        # a clone that runs on independently, everything it can change is
+        # copied; ram is only 4 KB so it is copied too, sharing it would
+        # leak a write through cpu.ram from one machine into the other
+        child = object.__new__(type(self))
+        state = self.__dict__.copy()
+        # instrumentation shadowing the class methods stays with this cpu
+        state.pop("cpu_cycle", None)
+        state.pop("cpu_frame", None)
+        state["v"] = self.v.copy()
+        state["stack"] = self.stack.copy()
+        state["ram"] = self.ram.copy()
+        state["keys"] = self.keys.copy()
+        state["frame_buffer"] = self.frame_buffer.copy()
+        state["rng"] = fork_rng(self.rng)
+        child.__dict__.update(state)
+        return child
+
+    @classmethod
+    def decode_table(
+            cls) -> typing.List[typing.Tuple[typing.Callable, Opcode]]:
+        return build_decode_table(cls)
+
     def cpu_cycle(self):
-        opcode_temp = (self.ram[self.pc] << 0x8) | self.ram[self.pc + 1]
-        opcode = Opcode.adapt(opcode_temp)
+        handler, opcode = self.dispatch[(int(self.ram[self.pc]) << 0x8)
+                                        | int(self.ram[self.pc + 1])]
 
         self.pc += 2
 
-        self.instruction_look_up(opcode)
+        handler(self, opcode)
+
+    def cpu_frame(self, instructions: int) -> int:
+        # returns the instructions run, fewer than asked when the frame
+        # went idle; the instruction that idled counts
+        cycle = self.cpu_cycle
+        executed = 0
 
+        try:
+            for executed in range(instructions):
+                cycle()
+            executed = instructions
+        except FrameIdle:
+            self.idle_frames += 1
+            executed += 1
+
+        self.tick_timers()
+        return executed
+
+    def tick_timers(self) -> None:
+        # 60 Hz
         if self.dt > 0:
             self.dt -= 1
 
@@ -70,73 +275,19 @@ class CPU:
             self.st -= 1
 
     def instruction_look_up(self, opcode: Opcode):
+        handler, _ = self.dispatch[opcode.opcode]
+        handler(self, opcode)
+
+    def op_illegal(self, opcode: Opcode):
+        raise IllegalOpcodeError(opcode.opcode, int(self.pc) - 2)
 
-        zero_look_up_dict = {
-            0x0: self.op_cls,
-            0xE: self.op_ret,
-        }
-
-        Arthicmatics_look_up_dict = {
-            0x0: self.op_ld_vx_vy,
-            0x1: self.op_or_vx_vy,
-            0x2: self.op_and_vx_vy,
-            0x3: self.op_xor_vx_vy,
-            0x4: self.op_add_vx_vy,
-            0x5: self.op_sub_vx_vy,
-            0x6: self.op_shr_vx_vy,
-            0x7: self.op_subn_vx_vy,
-            0xE: self.op_shl_vx_vy,
-        }
-
-        FE_look_up_dict = {
-            0xA1: self.op_sknp_vx,
-            0x9E: self.op_skp_vx,
-            0x07: self.op_ld_vx_dt,
-            0x0A: self.op_ld_vx_k,
-            0x15: self.op_ld_dt_vx,
-            0x18: self.op_ld_st_vx,
-            0x1E: self.op_add_i_vx,
-            0x29: self.op_ld_f_vx,
-            0x33: self.op_ld_b_vx,
-            0x55: self.op_ld_i_vx,
-            0x65: self.op_ld_vx_i,
-        }
-
-        def zero_lookup(_):
-            zero_look_up_dict[opcode.N](opcode)
-
-        def Arthicmatics_lookup(_):
-            Arthicmatics_look_up_dict[opcode.N](opcode)
-
-        def FE_lookup(_):
-            FE_look_up_dict[opcode.NN](opcode)
-
-        general_look_up_dict = {
-            0x0: zero_lookup,
-            0x1: self.op_jp_addr,
-            0x2: self.op_call_addr,
-            0x3: self.op_se_vx_byte,
-            0x4: self.op_sne_vx_byte,
-            0x5: self.op_se_vx_vy,
-            0x6: self.op_ld_vx_byte,
-            0x7: self.op_add_vx_byte,
-            0x8: Arthicmatics_lookup,
-            0x9: self.op_sne_vx_vy,
-            0xA: self.op_ld_i_addr,
-            0xB: self.op_jp_v0_addr,
-            0xC: self.op_rnd_vx_byte,
-            0xD: self.op_drw_vx_vy_nibble,
-            0xE: FE_lookup,
-            0xF: FE_lookup
-        }
-
-        index = (opcode.opcode & 0xF000) >> 12
-        general_look_up_dict[index](opcode)
+    def op_sys(self, opcode: Opcode):
+        # 0nnn
+        pass
 
     def op_cls(self, opcode: Opcode):
         # 00E0
-        self.frame_buffer = np.zeros([self.WIDTH, self.HEIGHT], dtype=np.bool_)
-        self.screen.fill(Colors.black)
+        self.frame_buffer.fill(0)
 
     def op_ret(self, opcode: Opcode):
         # 00EE
@@ -145,8 +296,12 @@ class CPU:
 
     def op_jp_addr(self, opcode: Opcode):
         # 1nnn
+        jump = int(self.pc) - 2
         self.pc = opcode.NNN
 
+        if self.idle_skip and timer_wait_loop(self.ram, opcode.NNN, jump):
+            raise FrameIdle
+
     def op_call_addr(self, opcode: Opcode):
         # 2nnn
         self.stack[self.sp] = self.pc
@@ -242,14 +397,21 @@ class CPU:
 
     def op_jp_v0_addr(self, opcode: Opcode):
         # Bnnn
-        self.pc = opcode.NNN + self.v[0]
+        self.pc = opcode.NNN + int(self.v[0])
 
     def op_rnd_vx_byte(self, opcode: Opcode):
         # Cxkk
-        self.v[opcode.x] = np.random.randint(255) & opcode.NN
+        self.v[opcode.x] = self.rng.integers(255) & opcode.NN
 
     def op_drw_vx_vy_nibble(self, opcode: Opcode):
-        # Dxyn
+        # Dxyn, the coordinates are read before VF is cleared so x or y
+        # may be F
+        if self.i + opcode.N > len(self.ram):
+            raise SpriteRangeError(self.i, opcode.N)
+
+        x = int(self.v[opcode.x])
+        y = int(self.v[opcode.y])
+        width, height = int(self.WIDTH), int(self.HEIGHT)
         self.v[0xF] = 0
 
         for j in range(opcode.N):
@@ -257,23 +419,16 @@ class CPU:
 
             for i in range(8):
                 sprite_bit = sprite_byte & (0x80 >> i)
-                pos_x = (self.v[opcode.x] + i) % self.WIDTH
-                pos_y = (self.v[opcode.y] + j) % self.HEIGHT
+                pos_x = (x + i) % width
+                pos_y = (y + j) % height
                 current_bit = self.frame_buffer[pos_x, pos_y]
 
                 if current_bit == 1 and sprite_bit:
                     self.v[0xF] = 1
                     self.frame_buffer[pos_x, pos_y] = 0
-                    pygame.draw.rect(self.screen, Colors.black,
-                                     scale_rect([pos_x, pos_y]))
 
                 elif current_bit == 0 and sprite_bit:
                     self.frame_buffer[pos_x, pos_y] = 1
-                    pygame.draw.rect(self.screen, Colors.white,
-                                     scale_rect([pos_x, pos_y]))
-
-        pygame.display.update()
-        # test this later
 
     def op_skp_vx(self, opcode: Opcode):
         # Ex9E
@@ -296,6 +451,10 @@ class CPU:
         pressed_keys = np.where(self.keys == 1)[0]
         if np.size(pressed_keys) == 0:
             self.pc -= 2
+
+            # keys are latched once per frame
+            if self.idle_skip:
+                raise FrameIdle
         else:
             self.v[opcode.x] = pressed_keys[0]
 
@@ -309,11 +468,11 @@ class CPU:
 
     def op_add_i_vx(self, opcode: Opcode):
         # Fx1E
-        self.i += self.v[opcode.x]
+        self.i += int(self.v[opcode.x])
 
     def op_ld_f_vx(self, opcode: Opcode):
         # Fx29
-        self.i = self.FONTS_ADDRESS_MEMORY + (5 * self.v[opcode.x])
+        self.i = int(self.FONTS_ADDRESS_MEMORY) + (5 * int(self.v[opcode.x]))
 
     def op_ld_b_vx(self, opcode: Opcode):
         # Fx33
@@ -328,4 +487,28 @@ class CPU:
 
     def op_ld_vx_i(self, opcode: Opcode):
         # Fx65
-        self.v[:opcode.x + 1] = self.ram[self.i:self.i + opcode.x + 1]
\ No newline at end of file
+        self.v[:opcode.x + 1] = self.ram[self.i:self.i + opcode.x + 1]
+
+
+class PackedCPU(CPU):
+    # frame_buffer is a PackedFrameBuffer, Dxyn costs one shift + XOR per row
+
+    def __init__(self,
+                 display: typing.Optional[Display] = None,
+                 seed: typing.Optional[int] = None):
+        super().__init__(display, seed)
+        self.frame_buffer = PackedFrameBuffer()
+
+    def op_cls(self, opcode: Opcode):
+        # 00E0
+        self.frame_buffer.clear()
+
+    def op_drw_vx_vy_nibble(self, opcode: Opcode):
+        # Dxyn, a slice would quietly come up short
+        if self.i + opcode.N > len(self.ram):
+            raise SpriteRangeError(self.i, opcode.N)
+
+        sprite = self.ram[self.i:self.i + opcode.N].tobytes()
+        self.v[0xF] = self.frame_buffer.draw_sprite(int(self.v[opcode.x]),
+                                                    int(self.v[opcode.y]),
+                                                    sprite)
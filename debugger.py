@@ -0,0 +1,268 @@
+import typing
+from cpu import CPU, FrameIdle, handler_name
+from analysis import mnemonic
+from scheduler import INSTRUCTIONS_PER_FRAME
+
+# give up on a step over after this many instructions
+STEP_OVER_LIMIT = 1_000_000
+
+
+class Debugger:
+    # like the profiler, attach() shadows cpu_frame on the instance with a
+    # checked stepping loop and detach() removes it, so a cpu that is not
+    # being debugged runs the plain class method without any checks
+
+    def __init__(self,
+                 instructions_per_frame: int = INSTRUCTIONS_PER_FRAME
+                 ) -> None:
+        self.instructions_per_frame = instructions_per_frame
+        self.breakpoints: typing.Set[int] = set()
+        # ram addresses checked on Fx33 and Fx55 writes
+        self.watchpoints: typing.Set[int] = set()
+        # V registers checked after every instruction
+        self.register_watchpoints: typing.Set[int] = set()
+        self.paused = False
+        self.reason = ""
+        self.steps = 0
+        # a breakpoint at the address execution resumes from is not hit
+        # again straight away
+        self.resume_at: typing.Optional[int] = None
+        self.cpu: typing.Optional[CPU] = None
+
+    def attach(self, cpu: CPU) -> None:
+        self.cpu = cpu
+        cpu.cpu_frame = self.cpu_frame
+
+    def detach(self) -> None:
+        if self.cpu is not None:
+            del self.cpu.cpu_frame
+            self.cpu = None
+
+    def pause(self, reason: str = "paused") -> None:
+        self.paused = True
+        self.reason = reason
+
+    def resume(self) -> None:
+        self.paused = False
+        self.reason = ""
+        self.resume_at = int(self.cpu.pc)
+
+    def opcode(self, address: typing.Optional[int] = None) -> int:
+        ram = self.cpu.ram
+        address = int(self.cpu.pc) if address is None else address
+        return (int(ram[address]) << 8) | int(ram[address + 1])
+
+    def location(self, address: typing.Optional[int] = None) -> str:
+        address = int(self.cpu.pc) if address is None else address
+        opcode = self.opcode(address)
+        return f"{address:03X}  {opcode:04X}  {mnemonic(opcode)}"
+
+    def written(self, opcode: int) -> range:
+        # the ram an instruction is about to store to
+        name = handler_name(opcode)
+        i = int(self.cpu.i)
+
+        if name == "op_ld_i_vx":
+            return range(i, i + ((opcode & 0x0F00) >> 8) + 1)
+        if name == "op_ld_b_vx":
+            return range(i, i + 3)
+
+        return range(0)
+
+    def execute(self, check_breakpoint: bool = True) -> bool:
+        # one instruction, False when it stopped at a break or watchpoint
+        cpu = self.cpu
+        pc = int(cpu.pc)
+
+        if check_breakpoint and pc in self.breakpoints:
+            self.pause(f"breakpoint at {pc:03X}")
+            return False
+
+        opcode = self.opcode(pc)
+        watched = self.watchpoints.intersection(self.written(opcode))
+        registers = {x: int(cpu.v[x]) for x in self.register_watchpoints}
+
+        try:
+            cpu.cpu_cycle()
+        finally:
+            self.steps += 1
+
+        hits = [
+            f"ram {address:03X} = {int(cpu.ram[address]):02X}"
+            for address in sorted(watched)
+        ] + [
+            f"V{x:X} {old:02X} -> {int(cpu.v[x]):02X}"
+            for x, old in registers.items() if int(cpu.v[x]) != old
+        ]
+
+        if hits:
+            self.pause(f"watchpoint at {pc:03X}: " + ", ".join(hits))
+            return False
+
+        return True
+
+    def cpu_frame(self, instructions: int) -> int:
+        # a paused machine does nothing, the timers stop with it; returns
+        # the instructions run like CPU.cpu_frame
+        if self.paused:
+            return 0
+
+        cpu = self.cpu
+        steps = self.steps
+
+        try:
+            for _ in range(instructions):
+                resuming = self.resume_at == int(cpu.pc)
+                self.resume_at = None
+
+                if not self.execute(not resuming):
+                    return self.steps - steps
+        except FrameIdle:
+            cpu.idle_frames += 1
+
+        cpu.tick_timers()
+        return self.steps - steps
+
+    def step(self) -> bool:
+        # runs the instruction at pc whatever breakpoint is on it
+        try:
+            return self.execute(check_breakpoint=False)
+        except FrameIdle:
+            return True
+
+    def step_over(self) -> bool:
+        # a 2nnn runs until its subroutine returns, ticking the timers
+        # every frame worth of instructions so waits inside it finish
+        cpu = self.cpu
+
+        if handler_name(self.opcode()) != "op_call_addr":
+            return self.step()
+
+        target = int(cpu.pc) + 2
+        depth = int(cpu.sp)
+
+        if not self.step():
+            return False
+
+        for executed in range(1, STEP_OVER_LIMIT):
+            if int(cpu.pc) == target and int(cpu.sp) == depth:
+                return True
+
+            try:
+                if not self.execute():
+                    return False
+            except FrameIdle:
+                pass
+
+            if executed % self.instructions_per_frame == 0:
+                cpu.tick_timers()
+
+        self.pause(f"step over gave up after {STEP_OVER_LIMIT} instructions")
+        return False
+
+
+HELP = """\
+b ADDR        set a breakpoint         d ADDR|vX   delete a break/watchpoint
+w ADDR [LEN]  watch Fx33/Fx55 writes   wv X        watch register VX
+s             step                     n           step over a call
+c             continue                 r           registers
+x ADDR [LEN]  dump ram                 l [ADDR]    list instructions
+q             quit"""
+
+
+class Console:
+    # a line based front end, addresses are hex
+
+    def __init__(self,
+                 debugger: Debugger,
+                 read: typing.Callable[[str], str] = input,
+                 write: typing.Callable[[str], None] = print) -> None:
+        self.debugger = debugger
+        self.read = read
+        self.write = write
+
+    def registers(self) -> str:
+        cpu = self.debugger.cpu
+        v = " ".join(f"{int(value):02X}" for value in cpu.v)
+        return (f"pc {int(cpu.pc):03X} i {int(cpu.i):03X} sp {int(cpu.sp)} "
+                f"dt {int(cpu.dt)} st {int(cpu.st)}\nv  {v}")
+
+    def dump(self, address: int, length: int) -> str:
+        ram = self.debugger.cpu.ram
+        lines = []
+
+        for start in range(address, min(address + length, 4096), 16):
+            end = min(start + 16, address + length, 4096)
+            values = " ".join(f"{int(ram[a]):02X}" for a in range(start, end))
+            lines.append(f"{start:03X}  {values}")
+
+        return "\n".join(lines)
+
+    def command(self, line: str) -> typing.Optional[bool]:
+        # True resumes the machine, False quits, None keeps prompting
+        debugger = self.debugger
+        words = line.split()
+
+        if not words:
+            return None
+
+        name, numbers = words[0], words[1:]
+
+        try:
+            if name == "c":
+                debugger.resume()
+                return True
+            if name == "q":
+                return False
+            if name in ("s", "n"):
+                debugger.reason = ""
+                (debugger.step if name == "s" else debugger.step_over)()
+
+                if debugger.reason:
+                    self.write(debugger.reason)
+                self.write(debugger.location())
+            elif name == "b":
+                debugger.breakpoints.add(int(numbers[0], 16))
+            elif name == "w":
+                start = int(numbers[0], 16)
+                length = int(numbers[1]) if len(numbers) > 1 else 1
+                debugger.watchpoints.update(range(start, start + length))
+            elif name == "wv":
+                debugger.register_watchpoints.add(int(numbers[0], 16))
+            elif name == "d" and numbers[0].lower().startswith("v"):
+                debugger.register_watchpoints.discard(int(numbers[0][1:], 16))
+            elif name == "d":
+                address = int(numbers[0], 16)
+                debugger.breakpoints.discard(address)
+                debugger.watchpoints.discard(address)
+            elif name == "r":
+                self.write(self.registers())
+            elif name == "x":
+                length = int(numbers[1]) if len(numbers) > 1 else 16
+                self.write(self.dump(int(numbers[0], 16), length))
+            elif name == "l":
+                address = (int(numbers[0], 16)
+                           if numbers else int(debugger.cpu.pc))
+                self.write("\n".join(
+                    debugger.location(a)
+                    for a in range(address, min(address + 16, 4094), 2)))
+            else:
+                self.write(HELP)
+        except (IndexError, ValueError):
+            self.write(HELP)
+
+        return None
+
+    def prompt(self) -> bool:
+        # reads commands until one resumes the machine, False on quit
+        self.write(self.debugger.reason)
+        self.write(self.debugger.location())
+
+        while True:
+            try:
+                result = self.command(self.read("(chip8) "))
+            except EOFError:
+                return False
+
+            if result is not None:
+                return result
@@ -0,0 +1,33 @@
+import numpy as np
+
+WIDTH: int = 64
+HEIGHT: int = 32
+
+
+class Display:
+
+    def present(self, frame_buffer: np.ndarray) -> None:
+        pass
+
+
+class NullDisplay(Display):
+    # discards everything, for running the core at interpreter speed
+    pass
+
+
+class FramebufferDisplay(Display):
+    # keeps a copy of the last presented frame in memory, no window needed
+
+    def __init__(self) -> None:
+        self.frame = np.zeros([WIDTH, HEIGHT], dtype=np.bool_)
+        self.presented = 0
+
+    def present(self, frame_buffer: np.ndarray) -> None:
+        np.copyto(self.frame, frame_buffer)
+        self.presented += 1
+
+
+DISPLAYS = {
+    "null": NullDisplay,
+    "framebuffer": FramebufferDisplay,
+}
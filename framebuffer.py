@@ -0,0 +1,89 @@
+import hashlib
+import typing
+import numpy as np
+
+WIDTH: int = 64
+HEIGHT: int = 32
+
+ROW_MASK: int = (1 << WIDTH) - 1
+
+
+class PackedFrameBuffer:
+    # each row is a 64 bit int, pixel x is bit 63 - x so a sprite byte lines
+    # up with the leftmost pixels before it is shifted into place
+
+    __slots__ = ("rows", )
+
+    def __init__(self, rows: typing.Optional[typing.List[int]] = None) -> None:
+        self.rows = [0] * HEIGHT if rows is None else list(rows)
+
+    def clear(self) -> None:
+        self.rows = [0] * HEIGHT
+
+    def draw_sprite(self, x: int, y: int, sprite: bytes) -> bool:
+        x %= WIDTH
+        y %= HEIGHT
+        rows = self.rows
+        collision = 0
+
+        for byte in sprite:
+            # rotate right by x so columns past the edge wrap to the left
+            line = byte << (WIDTH - 8)
+            line = ((line >> x) | (line << (WIDTH - x))) & ROW_MASK
+            old = rows[y]
+            collision |= old & line
+            rows[y] = old ^ line
+            y = (y + 1) % HEIGHT
+
+        return collision != 0
+
+    def copy(self) -> "PackedFrameBuffer":
+        return PackedFrameBuffer(self.rows)
+
+    def tobytes(self) -> bytes:
+        return b"".join(row.to_bytes(WIDTH // 8, "big") for row in self.rows)
+
+    @classmethod
+    def frombytes(cls, data: bytes) -> "PackedFrameBuffer":
+        step = WIDTH // 8
+        return cls([
+            int.from_bytes(data[i:i + step], "big")
+            for i in range(0, HEIGHT * step, step)
+        ])
+
+    def to_array(self) -> np.ndarray:
+        # same [x, y] layout as CPU.frame_buffer
+        packed = np.frombuffer(self.tobytes(), dtype=np.uint8)
+        return np.unpackbits(packed).reshape(HEIGHT, WIDTH).T.astype(np.bool_)
+
+    @classmethod
+    def from_array(cls, frame_buffer: np.ndarray) -> "PackedFrameBuffer":
+        packed = np.packbits(np.asarray(frame_buffer, dtype=np.bool_).T)
+        return cls.frombytes(packed.tobytes())
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        frame_buffer = self.to_array()
+        return frame_buffer if dtype is None else frame_buffer.astype(dtype)
+
+    def __getitem__(self, pos: typing.Tuple[int, int]) -> bool:
+        x, y = pos
+        return bool((self.rows[y] >> (WIDTH - 1 - x)) & 1)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, PackedFrameBuffer):
+            return NotImplemented
+        return self.rows == other.rows
+
+    __hash__ = None
+
+
+def pack_frame(frame_buffer) -> bytes:
+    # the rows bit packed, 256 bytes whatever the framebuffer layout
+    if isinstance(frame_buffer, PackedFrameBuffer):
+        return frame_buffer.tobytes()
+
+    return np.packbits(np.asarray(frame_buffer, dtype=np.bool_).T).tobytes()
+
+
+def frame_hash(frame_buffer) -> str:
+    return hashlib.sha1(pack_frame(frame_buffer)).hexdigest()
@@ -1,7 +1,8 @@
+import pygame
 from pygame import Color
 import typing
-
-delaytime: int = 1
+import numpy as np
+from display import Display
 
 scale: int = 15
 
@@ -14,5 +15,85 @@ class Colors:
     white = Color(255, 255, 255)
 
 
-def scale_rect(pos: typing.List[int]) -> typing.List[int]:
-    return [i * scale for i in pos] + [scale, scale]
+class PygameDisplay(Display):
+
+    def __init__(self, scale: int = scale, caption: str = "Chip-8") -> None:
+        self.scale = scale
+        self.screen = pygame.display.set_mode(
+            (width * self.scale, height * self.scale))
+        pygame.display.set_caption(caption)
+        self.screen.fill(Colors.black)
+
+        # the framebuffer is drawn 1:1 here and scaled onto the window
+        self.surface = pygame.Surface((width, height), depth=32)
+        self.palette = np.array(
+            [self.surface.map_rgb(Colors.black),
+             self.surface.map_rgb(Colors.white)],
+            dtype=np.uint32)
+        self.last_frame = np.zeros([width, height], dtype=np.bool_)
+        self.presented = 0
+        # a line of text drawn over the top left corner, may be set from
+        # any thread and shows from the next present
+        self.overlay: typing.Optional[str] = None
+        self.overlay_text: typing.Optional[str] = None
+        self.overlay_surface: typing.Optional[pygame.Surface] = None
+        self.overlay_rect: typing.Optional[pygame.Rect] = None
+        self.font: typing.Optional[pygame.font.Font] = None
+
+    def dirty_rects(self, frame_buffer: np.ndarray) -> typing.List[pygame.Rect]:
+        # one rect per framebuffer row spanning the columns that changed
+        changed = frame_buffer != self.last_frame
+        rects = []
+
+        for y in np.flatnonzero(changed.any(axis=0)):
+            columns = np.flatnonzero(changed[:, y])
+            rects.append(
+                pygame.Rect(columns[0] * self.scale, y * self.scale,
+                            (columns[-1] - columns[0] + 1) * self.scale,
+                            self.scale))
+
+        return rects
+
+    def draw_overlay(self) -> pygame.Rect:
+        # returns the area covering both the new and the previous text
+        overlay = self.overlay
+
+        if overlay != self.overlay_text:
+            self.overlay_text = overlay
+            self.overlay_surface = None
+
+            if overlay:
+                if self.font is None:
+                    self.font = pygame.font.Font(None, max(16, self.scale))
+                self.overlay_surface = self.font.render(
+                    overlay, True, Colors.white, Colors.black)
+
+        rect = pygame.Rect(0, 0, 0, 0)
+
+        if self.overlay_surface is not None:
+            rect = self.screen.blit(self.overlay_surface, (0, 0))
+
+        dirty = rect.union(self.overlay_rect) if self.overlay_rect else rect
+        self.overlay_rect = rect if self.overlay_surface else None
+
+        return dirty
+
+    def present(self, frame_buffer: np.ndarray) -> None:
+        frame_buffer = np.asarray(frame_buffer)
+        rects = self.dirty_rects(frame_buffer)
+
+        if not rects and self.overlay == self.overlay_text:
+            return
+
+        pixels = self.palette[frame_buffer.view(np.uint8)]
+        pygame.surfarray.blit_array(self.surface, pixels)
+        pygame.transform.scale(self.surface, self.screen.get_size(),
+                               self.screen)
+
+        if self.overlay is not None or self.overlay_rect is not None:
+            rects.append(self.draw_overlay())
+
+        pygame.display.update(rects)
+
+        np.copyto(self.last_frame, frame_buffer)
+        self.presented += 1
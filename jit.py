@@ -0,0 +1,232 @@
+import typing
+from cpu import CPU, PackedCPU, Opcode, FrameIdle, timer_wait_loop
+
+MAX_BLOCK_INSTRUCTIONS: int = 32
+
+# blocks are indexed by the 64 byte pages they cover so a ram write only
+# has to look at the blocks near it
+PAGE_BITS: int = 6
+
+
+class Block(typing.NamedTuple):
+    start: int
+    end: int
+    length: int
+    run: typing.Callable[[CPU], int]
+    source: str
+
+
+def _skip(condition: str, address: int, executed: int) -> typing.List[str]:
+    return [
+        f"if {condition}:",
+        f"    self.pc = {address + 4}",
+        f"    return {executed}",
+    ]
+
+
+def _translate_instruction(
+        opcode: Opcode, address: int, executed: int, call: str,
+        idle: bool) -> typing.Tuple[typing.List[str], bool]:
+    # returns the python lines for one instruction and whether the block
+    # ends after it; anything not inlined goes through the decode table
+    family = opcode.opcode >> 12
+    x, y, NN, NNN = opcode.x, opcode.y, opcode.NN, opcode.NNN
+    flags = 0xF in (x, y)
+
+    if family == 0x1 and idle:
+        # the jump closing a timer wait loop
+        return [f"self.pc = {NNN}", "raise FrameIdle"], True
+    if family == 0x1:
+        return [f"self.pc = {NNN}", f"return {executed}"], True
+    if family == 0x3:
+        return _skip(f"v[{x}] == {NN}", address, executed), False
+    if family == 0x4:
+        return _skip(f"v[{x}] != {NN}", address, executed), False
+    if family == 0x5:
+        return _skip(f"v[{x}] == v[{y}]", address, executed), False
+    if family == 0x6:
+        return [f"v[{x}] = {NN}"], False
+    if family == 0x7:
+        return [f"v[{x}] = (int(v[{x}]) + {NN}) & 255"], False
+    if family == 0x8 and opcode.N <= 0x3:
+        operator = ["", "|", "&", "^"][opcode.N]
+        return [f"v[{x}] {operator}= v[{y}]"], False
+    if family == 0x8 and opcode.N == 0x4 and not flags:
+        return [
+            f"s = int(v[{x}]) + int(v[{y}])",
+            "v[15] = s >> 8",
+            f"v[{x}] = s & 255",
+        ], False
+    if family == 0x8 and opcode.N in (0x5, 0x7) and not flags:
+        a, b = (x, y) if opcode.N == 0x5 else (y, x)
+        return [
+            f"v[15] = 1 if v[{a}] > v[{b}] else 0",
+            f"v[{x}] = (int(v[{a}]) - int(v[{b}])) & 255",
+        ], False
+    if family == 0x8 and opcode.N == 0x6 and x != 0xF:
+        return [f"v[15] = v[{x}] & 1", f"v[{x}] = v[{x}] >> 1"], False
+    if family == 0x8 and opcode.N == 0xE and x != 0xF:
+        return [
+            f"v[15] = v[{x}] >> 7",
+            f"v[{x}] = (int(v[{x}]) << 1) & 255",
+        ], False
+    if family == 0x9:
+        return _skip(f"v[{x}] != v[{y}]", address, executed), False
+    if family == 0xA:
+        return [f"self.i = {NNN}"], False
+    if family == 0xB:
+        return [f"self.pc = {NNN} + int(v[0])", f"return {executed}"], True
+    if opcode.opcode & 0xF0FF == 0xE09E:
+        return _skip(f"self.keys[v[{x}]]", address, executed), False
+    if opcode.opcode & 0xF0FF == 0xE0A1:
+        return _skip(f"not self.keys[v[{x}]]", address, executed), False
+    if opcode.opcode & 0xF0FF == 0xF007:
+        return [f"v[{x}] = self.dt"], False
+    if opcode.opcode & 0xF0FF == 0xF015:
+        return [f"self.dt = v[{x}]"], False
+    if opcode.opcode & 0xF0FF == 0xF018:
+        return [f"self.st = v[{x}]"], False
+    if opcode.opcode & 0xF0FF == 0xF01E:
+        return [f"self.i += int(v[{x}])"], False
+
+    # 00E0, 00EE, 2nnn, Cxkk, Dxyn, Fx0A, Fx29, Fx33, Fx55, Fx65, flag
+    # corner cases and illegal opcodes
+    lines = [f"self.pc = {address + 2}", call]
+
+    if (opcode.opcode == 0x00EE or family == 0x2
+            or opcode.opcode & 0xF0FF in (0xF00A, 0xF033, 0xF055)):
+        # control flow, waiting for a key or a write that may hit this block
+        return lines + [f"return {executed}"], True
+
+    return lines, False
+
+
+class JitCPU(CPU):
+    # runs basic blocks translated to python functions, cpu_cycle still
+    # interprets a single instruction
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.blocks: typing.Dict[int, Block] = {}
+        self.pages: typing.Dict[int, typing.Set[int]] = {}
+        self.translations = 0
+        self.invalidations = 0
+
+    def translate(self, start: int) -> Block:
+        lines = ["def block(self):", "    v = self.v"]
+        namespace: typing.Dict[str, typing.Any] = {"FrameIdle": FrameIdle}
+        address = start
+        length = 0
+        ended = False
+
+        while (not ended and length < MAX_BLOCK_INSTRUCTIONS
+               and address < 0xFFF):
+            handler, opcode = self.dispatch[(int(self.ram[address]) << 8)
+                                            | int(self.ram[address + 1])]
+            namespace[f"h{length}"] = handler
+            namespace[f"o{length}"] = opcode
+            call = f"h{length}(self, o{length})"
+            length += 1
+
+            # idle_skip is read here, flush() after changing it
+            idle = (self.idle_skip and opcode.opcode >> 12 == 0x1
+                    and timer_wait_loop(self.ram, opcode.NNN, address))
+            body, ended = _translate_instruction(opcode, address, length,
+                                                 call, idle)
+            lines.extend("    " + line for line in body)
+            address += 2
+
+        if not ended:
+            lines += [f"    self.pc = {address}", f"    return {length}"]
+
+        source = "\n".join(lines)
+        exec(compile(source, f"<block {start:03X}>", "exec"), namespace)
+        block = Block(start, address, length, namespace["block"], source)
+
+        self.blocks[start] = block
+        for page in range(start >> PAGE_BITS,
+                          ((address - 1) >> PAGE_BITS) + 1):
+            self.pages.setdefault(page, set()).add(start)
+        self.translations += 1
+
+        return block
+
+    def invalidate(self, start: int, end: int) -> None:
+        # drop every cached block overlapping ram[start:end]
+        for page in range(start >> PAGE_BITS, ((end - 1) >> PAGE_BITS) + 1):
+            for block_start in tuple(self.pages.get(page, ())):
+                block = self.blocks.get(block_start)
+
+                if block is None or block.end <= start or block.start >= end:
+                    continue
+
+                del self.blocks[block_start]
+                for block_page in range(block.start >> PAGE_BITS,
+                                        ((block.end - 1) >> PAGE_BITS) + 1):
+                    self.pages[block_page].discard(block_start)
+                self.invalidations += 1
+
+    def fork(self) -> "JitCPU":
+        # blocks only read the cpu they are given, the child reuses them
+        child = super().fork()
+        child.blocks = self.blocks.copy()
+        child.pages = {
+            page: set(starts)
+            for page, starts in self.pages.items()
+        }
+        return child
+
+    def flush(self) -> None:
+        self.blocks.clear()
+        self.pages.clear()
+
+    def cpu_frame(self, instructions: int) -> int:
+        # see CPU.cpu_frame
+        blocks = self.blocks
+        cycle = self.cpu_cycle
+        budget = instructions
+        # what the block or single instruction being run would add, the
+        # idle jump and Fx0A always end their block
+        running = 0
+
+        try:
+            while instructions > 0:
+                pc = int(self.pc)
+                block = blocks.get(pc)
+
+                if block is None:
+                    block = self.translate(pc)
+
+                if block.length <= instructions:
+                    running = block.length
+                    instructions -= block.run(self)
+                else:
+                    # not enough budget left for the whole block, finish
+                    # the frame one instruction at a time
+                    running = 1
+                    cycle()
+                    instructions -= 1
+        except FrameIdle:
+            self.idle_frames += 1
+            instructions -= running
+
+        self.tick_timers()
+        return budget - instructions
+
+    def load_rom(self, rom: bytes) -> None:
+        super().load_rom(rom)
+        self.flush()
+
+    def op_ld_b_vx(self, opcode: Opcode):
+        # Fx33
+        super().op_ld_b_vx(opcode)
+        self.invalidate(int(self.i), int(self.i) + 3)
+
+    def op_ld_i_vx(self, opcode: Opcode):
+        # Fx55
+        super().op_ld_i_vx(opcode)
+        self.invalidate(int(self.i), int(self.i) + opcode.x + 1)
+
+
+class PackedJitCPU(JitCPU, PackedCPU):
+    pass
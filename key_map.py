@@ -1,3 +1,5 @@
+import json
+import typing
 import pygame
 
 key_map = {
@@ -18,3 +20,18 @@ key_map = {
     0xE: pygame.K_f,
     0xF: pygame.K_v,
 }
+
+
+def load_layout(path: str) -> typing.Dict[int, typing.List[int]]:
+    # a json object from keypad hex digit to a pygame key name or a list of
+    # names, e.g. {"5": ["w", "up"]}
+    with open(path) as file:
+        data = json.load(file)
+
+    layout = {}
+
+    for key, names in data.items():
+        names = [names] if isinstance(names, str) else names
+        layout[int(key, 16)] = [pygame.key.key_code(name) for name in names]
+
+    return layout
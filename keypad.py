@@ -0,0 +1,45 @@
+import typing
+import numpy as np
+
+Layout = typing.Dict[int, typing.Union[int, typing.Sequence[int]]]
+
+
+class Keypad:
+    # host key codes go through an inverse map straight to a keypad index,
+    # the state is copied into cpu.keys once per frame by latch()
+
+    def __init__(self, layout: Layout) -> None:
+        self.codes: typing.Dict[int, int] = {}
+
+        for key, codes in layout.items():
+            for code in ([codes] if isinstance(codes, int) else codes):
+                self.codes[code] = key
+
+        # several host keys may share a keypad key, it stays down until the
+        # last of them is released
+        self.held: typing.Set[int] = set()
+        self.counts = [0] * 16
+        self.state = np.zeros(16, dtype=np.bool_)
+
+    def press(self, code: int) -> None:
+        key = self.codes.get(code)
+
+        if key is None or code in self.held:
+            return
+
+        self.held.add(code)
+        self.counts[key] += 1
+        self.state[key] = True
+
+    def release(self, code: int) -> None:
+        key = self.codes.get(code)
+
+        if key is None or code not in self.held:
+            return
+
+        self.held.discard(code)
+        self.counts[key] -= 1
+        self.state[key] = self.counts[key] > 0
+
+    def latch(self, cpu) -> None:
+        np.asarray(cpu.keys)[:] = self.state
@@ -0,0 +1,204 @@
+import multiprocessing
+import typing
+from multiprocessing import shared_memory
+import numpy as np
+from cpu import CPU
+from scheduler import INSTRUCTIONS_PER_FRAME
+
+Reward = typing.Callable[[CPU], float]
+Done = typing.Callable[[CPU], bool]
+
+# the one byte commands sent to every worker, each answers with DONE
+RESET = b"r"
+STEP = b"s"
+CLOSE = b"c"
+DONE = b"."
+
+
+def no_reward(cpu: CPU) -> float:
+    return 0.0
+
+
+def never_done(cpu: CPU) -> bool:
+    return False
+
+
+class SharedArray:
+    # a numpy array living in a named shared memory block, the parent owns
+    # and unlinks it, the workers only attach
+
+    def __init__(self,
+                 shape: typing.Tuple[int, ...],
+                 dtype: typing.Any,
+                 name: typing.Optional[str] = None) -> None:
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        size = max(1, int(np.prod(shape)) * self.dtype.itemsize)
+        self.memory = shared_memory.SharedMemory(name=name,
+                                                 create=name is None,
+                                                 size=size)
+        self.array = np.ndarray(shape, dtype=self.dtype,
+                                buffer=self.memory.buf)
+
+    def attach_args(self) -> typing.Tuple:
+        return self.shape, self.dtype.str, self.memory.name
+
+    def close(self) -> None:
+        del self.array
+        self.memory.close()
+
+    def unlink(self) -> None:
+        self.memory.unlink()
+
+
+def _set_keys(cpu: CPU, action: int) -> None:
+    # bit k of the action holds keypad key k
+    np.asarray(cpu.keys)[:] = (action >> np.arange(16)) & 1
+
+
+def _worker(connection, envs: typing.List[int], rom: str, cpu_type: type,
+            frames_per_step: int, instructions_per_frame: int,
+            reward: Reward, done: Done,
+            frames_args: typing.Tuple, actions_args: typing.Tuple,
+            rewards_args: typing.Tuple, dones_args: typing.Tuple) -> None:
+    shared = [
+        SharedArray(*args)
+        for args in (frames_args, actions_args, rewards_args, dones_args)
+    ]
+    frames, actions, rewards, dones = (array.array for array in shared)
+    # read once, every reset copies from memory
+    data = np.fromfile(rom, dtype=np.ubyte)
+
+    def new_cpu() -> CPU:
+        cpu = cpu_type()
+        cpu.load_rom(data)
+        return cpu
+
+    cpus = {env: new_cpu() for env in envs}
+
+    try:
+        while True:
+            command = connection.recv_bytes()
+
+            if command == CLOSE:
+                break
+
+            for env in envs:
+                if command == RESET or dones[env]:
+                    cpus[env] = new_cpu()
+                    dones[env] = False
+                    rewards[env] = 0.0
+
+                cpu = cpus[env]
+
+                if command == STEP:
+                    _set_keys(cpu, int(actions[env]))
+                    total = 0.0
+
+                    for _ in range(frames_per_step):
+                        cpu.cpu_frame(instructions_per_frame)
+                        total += reward(cpu)
+
+                        if done(cpu):
+                            dones[env] = True
+                            break
+
+                    rewards[env] = total
+
+                frames[env] = np.asarray(cpu.frame_buffer)
+
+            connection.send_bytes(DONE)
+    finally:
+        for array in shared:
+            array.close()
+        connection.close()
+
+
+class EnvPool:
+    # hosts num_envs machines across worker processes, observations are
+    # written straight into shared memory and returned as views on it
+
+    def __init__(self,
+                 rom: str,
+                 num_envs: int,
+                 workers: typing.Optional[int] = None,
+                 frames_per_step: int = 1,
+                 instructions_per_frame: int = INSTRUCTIONS_PER_FRAME,
+                 cpu_type: type = CPU,
+                 reward: Reward = no_reward,
+                 done: Done = never_done) -> None:
+        workers = min(num_envs, workers or multiprocessing.cpu_count())
+
+        self.num_envs = num_envs
+        self.frames_per_step = frames_per_step
+        self.frames = SharedArray((num_envs, CPU.WIDTH, CPU.HEIGHT), np.bool_)
+        self.actions = SharedArray((num_envs, ), np.uint16)
+        self.rewards = SharedArray((num_envs, ), np.float32)
+        self.dones = SharedArray((num_envs, ), np.bool_)
+        self.shared = [self.frames, self.actions, self.rewards, self.dones]
+
+        self.connections = []
+        self.processes = []
+        # spawned rather than forked, a fork of a parent that has SDL or
+        # other threads running can deadlock on a lock copied while held;
+        # reward and done have to be picklable module level functions
+        context = multiprocessing.get_context("spawn")
+
+        for envs in np.array_split(np.arange(num_envs), workers):
+            parent, child = context.Pipe()
+            process = context.Process(
+                target=_worker,
+                args=(child, envs.tolist(), rom, cpu_type, frames_per_step,
+                      instructions_per_frame, reward, done) +
+                tuple(array.attach_args() for array in self.shared),
+                daemon=True)
+            process.start()
+            child.close()
+
+            self.connections.append(parent)
+            self.processes.append(process)
+
+        self.closed = False
+
+    def _broadcast(self, command: bytes) -> None:
+        for connection in self.connections:
+            connection.send_bytes(command)
+
+        for connection in self.connections:
+            connection.recv_bytes()
+
+    def reset(self) -> np.ndarray:
+        self._broadcast(RESET)
+        return self.frames.array
+
+    def step(
+        self, actions: typing.Sequence[int]
+    ) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # the returned arrays are overwritten by the next call, copy them
+        # to keep them around
+        self.actions.array[:] = actions
+        self._broadcast(STEP)
+        return self.frames.array, self.rewards.array, self.dones.array
+
+    def close(self) -> None:
+        if self.closed:
+            return
+
+        for connection in self.connections:
+            connection.send_bytes(CLOSE)
+            connection.close()
+
+        for process in self.processes:
+            process.join()
+
+        for array in self.shared:
+            array.close()
+            array.unlink()
+
+        self.closed = True
+
+    def __enter__(self) -> "EnvPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
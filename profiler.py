@@ -0,0 +1,118 @@
+import collections
+import json
+import time
+import typing
+from cpu import CPU
+
+
+class Profiler:
+    # attach() shadows cpu_cycle and cpu_frame on the instance with
+    # instrumented versions, detach() removes them again, so a cpu that is
+    # not being profiled runs the plain class methods
+
+    def __init__(self) -> None:
+        self.counts = collections.Counter()
+        self.times = collections.defaultdict(float)
+        self.address_counts = collections.Counter()
+        self.address_times = collections.defaultdict(float)
+        # (loop start, jump address) -> times the backward jump was taken
+        self.loops = collections.Counter()
+        self.cpu: typing.Optional[CPU] = None
+
+    def attach(self, cpu: CPU) -> None:
+        counts, times = self.counts, self.times
+        address_counts = self.address_counts
+        address_times = self.address_times
+        loops = self.loops
+        dispatch = cpu.dispatch
+        ram = cpu.ram
+        clock = time.perf_counter
+        jump = CPU.op_jp_addr
+
+        def cpu_cycle():
+            pc = int(cpu.pc)
+            handler, opcode = dispatch[(int(ram[pc]) << 0x8)
+                                       | int(ram[pc + 1])]
+
+            start = clock()
+            cpu.pc += 2
+
+            # an idle jump or Fx0A ends the frame with FrameIdle, it still
+            # ran and timer waits are the hottest loops there are
+            try:
+                handler(cpu, opcode)
+            finally:
+                elapsed = clock() - start
+
+                name = handler.__name__
+                counts[name] += 1
+                times[name] += elapsed
+                address_counts[pc] += 1
+                address_times[pc] += elapsed
+
+                if handler is jump and opcode.NNN <= pc:
+                    loops[(opcode.NNN, pc)] += 1
+
+        cpu.cpu_cycle = cpu_cycle
+        # translated blocks would bypass cpu_cycle, profile the interpreter
+        cpu.cpu_frame = CPU.cpu_frame.__get__(cpu)
+        self.cpu = cpu
+
+    def detach(self) -> None:
+        if self.cpu is not None:
+            del self.cpu.cpu_cycle
+            del self.cpu.cpu_frame
+            self.cpu = None
+
+    def to_json(self, top: int = 20) -> typing.Dict:
+        hottest = self.address_counts.most_common(top)
+
+        return {
+            "instructions": sum(self.counts.values()),
+            "opcodes": {
+                name: {
+                    "count": count,
+                    "seconds": self.times[name]
+                }
+                for name, count in self.counts.most_common()
+            },
+            "addresses": [{
+                "address": f"{address:03X}",
+                "count": count,
+                "seconds": self.address_times[address]
+            } for address, count in hottest],
+            "loops": [{
+                "start": f"{start:03X}",
+                "end": f"{end:03X}",
+                "iterations": count
+            } for (start, end), count in self.loops.most_common(top)],
+        }
+
+    def report(self, top: int = 10) -> str:
+        total = sum(self.times.values()) or 1.0
+        lines = [f"{'opcode':24} {'count':>10} {'seconds':>10} {'share':>7}"]
+
+        for name, seconds in sorted(self.times.items(),
+                                    key=lambda item: -item[1])[:top]:
+            lines.append(f"{name:24} {self.counts[name]:>10} {seconds:>10.4f}"
+                         f" {seconds / total:>7.1%}")
+
+        lines.append("")
+        lines.append(f"{'address':24} {'count':>10} {'seconds':>10}")
+
+        for address, count in self.address_counts.most_common(top):
+            lines.append(f"{address:<24X} {count:>10}"
+                         f" {self.address_times[address]:>10.4f}")
+
+        if self.loops:
+            lines.append("")
+            lines.append(f"{'loop':24} {'iterations':>10}")
+
+            for (start, end), count in self.loops.most_common(top):
+                lines.append(f"{start:03X}-{end:03X}{'':17} {count:>10}")
+
+        return "\n".join(lines)
+
+    def dump(self, path: str, top: int = 20) -> None:
+        with open(path, "w") as file:
+            json.dump(self.to_json(top), file, indent=2)
@@ -0,0 +1,136 @@
+import struct
+import typing
+import numpy as np
+from cpu import CPU
+from catalog import rom_hash
+
+MAGIC = b"C8IN"
+VERSION = 2
+
+# magic, version, seed, instructions per frame, idle skip, frame count,
+# sha256 of the rom; followed by one (frame, key mask) change per entry
+HEADER = struct.Struct(">4sBQHBI32s")
+CHANGE = struct.Struct(">IH")
+
+
+class RecordingError(Exception):
+    pass
+
+
+def key_mask(cpu: CPU) -> int:
+    # bit k holds keypad key k
+    keys = np.asarray(cpu.keys, dtype=np.bool_)
+    return int(np.packbits(keys, bitorder="little").view("<u2")[0])
+
+
+class Recording:
+    # the rom, seed and timing a session ran with plus every key state
+    # change, enough to run the exact same session again
+
+    def __init__(self,
+                 rom: str,
+                 seed: int,
+                 instructions_per_frame: int,
+                 idle_skip: bool = False) -> None:
+        # rom is the hex sha256 of the rom, see catalog.rom_hash
+        self.rom = rom
+        self.seed = seed
+        self.instructions_per_frame = instructions_per_frame
+        self.idle_skip = idle_skip
+        self.frames = 0
+        self.changes: typing.List[typing.Tuple[int, int]] = []
+        self.last = 0
+
+    def record(self, cpu: CPU) -> None:
+        # a scheduler hook, runs after every frame with the keys that
+        # frame saw still latched
+        mask = key_mask(cpu)
+
+        if mask != self.last:
+            self.changes.append((self.frames, mask))
+            self.last = mask
+
+        self.frames += 1
+
+    def tobytes(self) -> bytes:
+        header = HEADER.pack(MAGIC, VERSION, self.seed,
+                             self.instructions_per_frame, self.idle_skip,
+                             self.frames, bytes.fromhex(self.rom))
+
+        return header + b"".join(
+            CHANGE.pack(frame, mask) for frame, mask in self.changes)
+
+    @classmethod
+    def frombytes(cls, data: bytes) -> "Recording":
+        # the size depends on the version, an older recording is reported
+        # as such rather than as the wrong size
+        version = data[4] if len(data) > 4 else None
+
+        if data[:4] != MAGIC:
+            raise RecordingError("not a Chip-8 input recording")
+        if version != VERSION:
+            raise RecordingError(f"unsupported recording version {version}")
+        if len(data) < HEADER.size or (len(data) -
+                                       HEADER.size) % CHANGE.size:
+            raise RecordingError(f"bad recording size {len(data)}")
+
+        (_, _, seed, instructions_per_frame, idle_skip, frames,
+         rom) = HEADER.unpack_from(data)
+
+        recording = cls(rom.hex(), seed, instructions_per_frame,
+                        bool(idle_skip))
+        recording.frames = frames
+        recording.changes = list(CHANGE.iter_unpack(data[HEADER.size:]))
+
+        if recording.changes:
+            recording.last = recording.changes[-1][1]
+
+        return recording
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as file:
+            file.write(self.tobytes())
+
+    @classmethod
+    def load(cls, path: str) -> "Recording":
+        with open(path, "rb") as file:
+            return cls.frombytes(file.read())
+
+
+def replay(recording: Recording,
+           rom: str,
+           cpu_type: type = CPU,
+           display=None,
+           hooks: typing.Sequence[typing.Callable[[CPU], None]] = ()) -> CPU:
+    # runs the whole session unpaced and returns the machine at the end,
+    # hooks are called with the cpu after every frame
+    with open(rom, "rb") as file:
+        data = file.read()
+
+    if rom_hash(data) != recording.rom:
+        raise RecordingError(f"{rom} is not the rom the session was "
+                             f"recorded with, sha256 {recording.rom}")
+
+    cpu = cpu_type(display, seed=recording.seed)
+    cpu.idle_skip = recording.idle_skip
+    cpu.load_rom(data)
+
+    keys = np.asarray(cpu.keys)
+    bits = np.arange(16)
+    changes = iter(recording.changes)
+    change = next(changes, None)
+    instructions = recording.instructions_per_frame
+
+    for frame in range(recording.frames):
+        if change is not None and change[0] == frame:
+            keys[:] = (change[1] >> bits) & 1
+            change = next(changes, None)
+
+        cpu.cpu_frame(instructions)
+
+        for hook in hooks:
+            hook(cpu)
+
+    cpu.display.present(cpu.frame_buffer)
+
+    return cpu
@@ -0,0 +1,134 @@
+import collections
+import struct
+import typing
+import zlib
+import numpy as np
+from cpu import CPU
+from framebuffer import PackedFrameBuffer
+
+MAGIC = b"C8ST"
+VERSION = 1
+
+# magic, version, pc, i, sp, dt, st, keys, pcg64 state, inc, has_uint32,
+# uinteger; followed by v, the stack, ram and the bit packed framebuffer
+HEADER = struct.Struct(">4sBHHBBBH16s16sBI")
+STATE_SIZE = HEADER.size + 16 + 64 * 2 + 4096 + 64 * 32 // 8
+
+
+class StateError(Exception):
+    pass
+
+
+def save_state(cpu: CPU) -> bytes:
+    rng = cpu.rng.bit_generator.state
+    keys = int(np.packbits(np.asarray(cpu.keys, dtype=np.bool_),
+                           bitorder="little").view("<u2")[0])
+
+    if isinstance(cpu.frame_buffer, PackedFrameBuffer):
+        frame_buffer = cpu.frame_buffer.tobytes()
+    else:
+        frame_buffer = np.packbits(cpu.frame_buffer.T).tobytes()
+
+    header = HEADER.pack(MAGIC, VERSION, int(cpu.pc), int(cpu.i), int(cpu.sp),
+                         int(cpu.dt), int(cpu.st), keys,
+                         rng["state"]["state"].to_bytes(16, "big"),
+                         rng["state"]["inc"].to_bytes(16, "big"),
+                         rng["has_uint32"], rng["uinteger"])
+
+    return b"".join([
+        header,
+        np.asarray(cpu.v, dtype=np.ubyte).tobytes(),
+        np.asarray(cpu.stack, dtype=">u2").tobytes(),
+        np.asarray(cpu.ram, dtype=np.ubyte).tobytes(), frame_buffer
+    ])
+
+
+def load_state(cpu: CPU, data: bytes) -> None:
+    if len(data) != STATE_SIZE:
+        raise StateError(f"expected {STATE_SIZE} bytes, got {len(data)}")
+
+    (magic, version, pc, i, sp, dt, st, keys, state, inc, has_uint32,
+     uinteger) = HEADER.unpack_from(data)
+
+    if magic != MAGIC:
+        raise StateError("not a Chip-8 save state")
+    if version != VERSION:
+        raise StateError(f"unsupported save state version {version}")
+
+    offset = HEADER.size
+    body = np.frombuffer(data, dtype=np.ubyte, offset=offset)
+
+    cpu.pc = pc
+    cpu.i = i
+    cpu.sp = sp
+    cpu.dt = dt
+    cpu.st = st
+    # through numpy views so bytearray backed machines work too
+    np.asarray(cpu.keys)[:] = (keys >> np.arange(16)) & 1
+    np.asarray(cpu.v)[:] = body[:16]
+    np.asarray(cpu.stack)[:] = body[16:144].view(">u2")
+    np.asarray(cpu.ram)[:] = body[144:4240]
+
+    frame_buffer = body[4240:].tobytes()
+
+    if isinstance(cpu.frame_buffer, PackedFrameBuffer):
+        cpu.frame_buffer.rows = PackedFrameBuffer.frombytes(frame_buffer).rows
+    else:
+        np.copyto(cpu.frame_buffer,
+                  PackedFrameBuffer.frombytes(frame_buffer).to_array())
+
+    rng = cpu.rng.bit_generator.state
+    rng["state"] = {
+        "state": int.from_bytes(state, "big"),
+        "inc": int.from_bytes(inc, "big")
+    }
+    rng["has_uint32"] = has_uint32
+    rng["uinteger"] = uinteger
+    cpu.rng.bit_generator.state = rng
+
+    # translated blocks may no longer match ram
+    if hasattr(cpu, "flush"):
+        cpu.flush()
+
+
+class Rewind:
+    # one state per frame in a bounded ring; only the newest state is kept
+    # whole, every older one is stored as the zlib compressed XOR against
+    # the state after it, so stepping back is a decompress and an XOR
+
+    def __init__(self, capacity: int = 600) -> None:
+        self.deltas: typing.Deque[bytes] = collections.deque(maxlen=capacity)
+        self.latest: typing.Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.deltas)
+
+    def record(self, cpu: CPU) -> None:
+        state = np.frombuffer(save_state(cpu), dtype=np.ubyte)
+
+        if self.latest is not None:
+            self.deltas.append(zlib.compress((state ^ self.latest).tobytes(),
+                                             1))
+
+        self.latest = state
+
+    def rewind(self, cpu: CPU, frames: int = 1) -> int:
+        if self.latest is None:
+            return 0
+
+        rewound = 0
+        state = self.latest
+
+        while rewound < frames and self.deltas:
+            delta = np.frombuffer(zlib.decompress(self.deltas.pop()),
+                                  dtype=np.ubyte)
+            state = state ^ delta
+            rewound += 1
+
+        self.latest = state
+        load_state(cpu, state.tobytes())
+
+        return rewound
+
+    def memory(self) -> int:
+        return sum(len(delta) for delta in self.deltas) + STATE_SIZE
@@ -0,0 +1,296 @@
+import typing
+import numpy as np
+from cpu import (Opcode, IllegalOpcodeError, SpriteRangeError, FrameIdle,
+                 build_decode_table, fork_rng, timer_wait_loop)
+from display import Display, NullDisplay
+from fonts import FONTS
+from framebuffer import PackedFrameBuffer
+
+
+class ScalarCPU:
+    # plain ints for pc, i, sp and the timers, memoryviews over bytearrays
+    # for v, the stack and ram, every write is masked explicitly
+
+    __slots__ = ("v", "i", "stack", "sp", "dt", "st", "frame_buffer", "pc",
+                 "ram", "keys", "rng", "idle_skip", "idle_frames", "display",
+                 "dispatch")
+
+    FIRST_ADDRESS_MEMORY = 0x200
+    FONTS_ADDRESS_MEMORY = 0x50
+    WIDTH = 64
+    HEIGHT = 32
+
+    def __init__(self,
+                 display: typing.Optional[Display] = None,
+                 seed: typing.Optional[int] = None):
+        self.v = memoryview(bytearray(16))
+        self.i = 0
+        self.stack = memoryview(bytearray(64 * 2)).cast("H")
+        self.sp = 0
+        self.dt = 0
+        self.st = 0
+        self.frame_buffer = PackedFrameBuffer()
+        self.pc = self.FIRST_ADDRESS_MEMORY
+        self.ram = memoryview(bytearray(4096))
+        self.keys = memoryview(bytearray(16))
+        self.rng = np.random.default_rng(seed)
+        self.idle_skip = False
+        self.idle_frames = 0
+        self.ram[self.FONTS_ADDRESS_MEMORY:self.FONTS_ADDRESS_MEMORY +
+                 FONTS.shape[0]] = FONTS.tobytes()
+        self.display = NullDisplay() if display is None else display
+        self.dispatch = self.decode_table()
+
+    decode_table = classmethod(build_decode_table)
+
+    def arrays(self) -> typing.Dict[str, np.ndarray]:
+        # zero copy numpy views, writes go straight to the machine
+        return {
+            "v": np.asarray(self.v),
+            "stack": np.asarray(self.stack),
+            "ram": np.asarray(self.ram),
+            "keys": np.asarray(self.keys).view(np.bool_),
+        }
+
+    def load_rom_to_ram(self, path: str) -> None:
+        with open(path, "rb") as file:
+            self.load_rom(file.read())
+
+    def load_rom(self, rom: typing.Union[bytes, np.ndarray]) -> None:
+        buffer = memoryview(rom).cast("B")
+        self.ram[self.pc:self.pc + len(buffer)] = buffer
+
+    def fork(self) -> "ScalarCPU":
+        # see CPU.fork
+        child = object.__new__(type(self))
+
+        for name in self.__slots__:
+            setattr(child, name, getattr(self, name))
+
+        child.v = memoryview(bytearray(self.v))
+        child.stack = memoryview(bytearray(self.stack)).cast("H")
+        child.ram = memoryview(bytearray(self.ram))
+        child.keys = memoryview(bytearray(self.keys))
+        child.frame_buffer = self.frame_buffer.copy()
+        child.rng = fork_rng(self.rng)
+        return child
+
+    def cpu_cycle(self):
+        ram = self.ram
+        pc = self.pc
+        handler, opcode = self.dispatch[(ram[pc] << 0x8) | ram[pc + 1]]
+
+        self.pc = pc + 2
+
+        handler(self, opcode)
+
+    def cpu_frame(self, instructions: int) -> int:
+        # see CPU.cpu_frame
+        cycle = self.cpu_cycle
+        executed = 0
+
+        try:
+            for executed in range(instructions):
+                cycle()
+            executed = instructions
+        except FrameIdle:
+            self.idle_frames += 1
+            executed += 1
+
+        self.tick_timers()
+        return executed
+
+    def tick_timers(self) -> None:
+        # 60 Hz
+        if self.dt > 0:
+            self.dt -= 1
+
+        if self.st > 0:
+            self.st -= 1
+
+    def op_illegal(self, opcode: Opcode):
+        raise IllegalOpcodeError(opcode.opcode, self.pc - 2)
+
+    def op_sys(self, opcode: Opcode):
+        # 0nnn
+        pass
+
+    def op_cls(self, opcode: Opcode):
+        # 00E0
+        self.frame_buffer.clear()
+
+    def op_ret(self, opcode: Opcode):
+        # 00EE
+        self.sp -= 1
+        self.pc = self.stack[self.sp]
+
+    def op_jp_addr(self, opcode: Opcode):
+        # 1nnn
+        jump = self.pc - 2
+        self.pc = opcode.NNN
+
+        if self.idle_skip and timer_wait_loop(self.ram, opcode.NNN, jump):
+            raise FrameIdle
+
+    def op_call_addr(self, opcode: Opcode):
+        # 2nnn
+        self.stack[self.sp] = self.pc
+        self.sp += 1
+        self.pc = opcode.NNN
+
+    def op_se_vx_byte(self, opcode: Opcode):
+        # 3xkk
+        if self.v[opcode.x] == opcode.NN:
+            self.pc += 2
+
+    def op_sne_vx_byte(self, opcode: Opcode):
+        # 4xkk
+        if self.v[opcode.x] != opcode.NN:
+            self.pc += 2
+
+    def op_se_vx_vy(self, opcode: Opcode):
+        # 5xy0
+        if self.v[opcode.x] == self.v[opcode.y]:
+            self.pc += 2
+
+    def op_ld_vx_byte(self, opcode: Opcode):
+        # 6xkk
+        self.v[opcode.x] = opcode.NN
+
+    def op_add_vx_byte(self, opcode: Opcode):
+        # 7xkk
+        self.v[opcode.x] = (self.v[opcode.x] + opcode.NN) & 0xFF
+
+    def op_ld_vx_vy(self, opcode: Opcode):
+        # 8xy0
+        self.v[opcode.x] = self.v[opcode.y]
+
+    def op_or_vx_vy(self, opcode: Opcode):
+        # 8xy1
+        self.v[opcode.x] |= self.v[opcode.y]
+
+    def op_and_vx_vy(self, opcode: Opcode):
+        # 8xy2
+        self.v[opcode.x] &= self.v[opcode.y]
+
+    def op_xor_vx_vy(self, opcode: Opcode):
+        # 8xy3
+        self.v[opcode.x] ^= self.v[opcode.y]
+
+    def op_add_vx_vy(self, opcode: Opcode):
+        # 8xy4
+        vx = self.v[opcode.x] + self.v[opcode.y]
+
+        self.v[0xF] = vx >> 8
+        self.v[opcode.x] = vx & 0xFF
+
+    def op_sub_vx_vy(self, opcode: Opcode):
+        # 8xy5
+        self.v[0xF] = 0
+
+        if self.v[opcode.x] > self.v[opcode.y]:
+            self.v[0xF] = 1
+
+        self.v[opcode.x] = (self.v[opcode.x] - self.v[opcode.y]) & 0xFF
+
+    def op_shr_vx_vy(self, opcode: Opcode):
+        # 8xy6
+        self.v[0xF] = self.v[opcode.x] & 0x1
+        self.v[opcode.x] >>= 1
+
+    def op_subn_vx_vy(self, opcode: Opcode):
+        # 8xy7
+        self.v[0xF] = 0
+
+        if self.v[opcode.y] > self.v[opcode.x]:
+            self.v[0xF] = 1
+
+        self.v[opcode.x] = (self.v[opcode.y] - self.v[opcode.x]) & 0xFF
+
+    def op_shl_vx_vy(self, opcode: Opcode):
+        # 8xyE
+        self.v[0xF] = (self.v[opcode.x] & 0x80) >> 7
+        self.v[opcode.x] = (self.v[opcode.x] << 1) & 0xFF
+
+    def op_sne_vx_vy(self, opcode: Opcode):
+        # 9xy0
+        if self.v[opcode.x] != self.v[opcode.y]:
+            self.pc += 2
+
+    def op_ld_i_addr(self, opcode: Opcode):
+        # Annn
+        self.i = opcode.NNN
+
+    def op_jp_v0_addr(self, opcode: Opcode):
+        # Bnnn
+        self.pc = opcode.NNN + self.v[0]
+
+    def op_rnd_vx_byte(self, opcode: Opcode):
+        # Cxkk
+        self.v[opcode.x] = int(self.rng.integers(255)) & opcode.NN
+
+    def op_drw_vx_vy_nibble(self, opcode: Opcode):
+        # Dxyn, a slice would quietly come up short
+        if self.i + opcode.N > len(self.ram):
+            raise SpriteRangeError(self.i, opcode.N)
+
+        self.v[0xF] = self.frame_buffer.draw_sprite(
+            self.v[opcode.x], self.v[opcode.y],
+            self.ram[self.i:self.i + opcode.N])
+
+    def op_skp_vx(self, opcode: Opcode):
+        # Ex9E
+        if self.keys[self.v[opcode.x]]:
+            self.pc += 2
+
+    def op_sknp_vx(self, opcode: Opcode):
+        # ExA1
+        if not self.keys[self.v[opcode.x]]:
+            self.pc += 2
+
+    def op_ld_vx_dt(self, opcode: Opcode):
+        # Fx07
+        self.v[opcode.x] = self.dt
+
+    def op_ld_vx_k(self, opcode: Opcode):
+        # Fx0A
+        for key, pressed in enumerate(self.keys):
+            if pressed:
+                self.v[opcode.x] = key
+                return
+
+        self.pc -= 2
+
+        if self.idle_skip:
+            raise FrameIdle
+
+    def op_ld_dt_vx(self, opcode: Opcode):
+        # Fx15
+        self.dt = self.v[opcode.x]
+
+    def op_ld_st_vx(self, opcode: Opcode):
+        # Fx18
+        self.st = self.v[opcode.x]
+
+    def op_add_i_vx(self, opcode: Opcode):
+        # Fx1E
+        self.i = (self.i + self.v[opcode.x]) & 0xFFFF
+
+    def op_ld_f_vx(self, opcode: Opcode):
+        # Fx29
+        self.i = self.FONTS_ADDRESS_MEMORY + (5 * self.v[opcode.x])
+
+    def op_ld_b_vx(self, opcode: Opcode):
+        # Fx33
+        number = self.v[opcode.x]
+        self.ram[self.i + 2] = number % 10
+        self.ram[self.i + 1] = (number // 10) % 10
+        self.ram[self.i] = (number // 100)
+
+    def op_ld_i_vx(self, opcode: Opcode):
+        # Fx55
+        self.ram[self.i:self.i + opcode.x + 1] = self.v[:opcode.x + 1]
+
+    def op_ld_vx_i(self, opcode: Opcode):
+        # Fx65
+        self.v[:opcode.x + 1] = self.ram[self.i:self.i + opcode.x + 1]
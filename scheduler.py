@@ -0,0 +1,88 @@
+import time
+import typing
+from cpu import CPU
+
+FRAME_RATE: int = 60
+INSTRUCTIONS_PER_FRAME: int = 10
+
+
+class FrameScheduler:
+
+    def __init__(self,
+                 cpu: CPU,
+                 instructions_per_frame: int = INSTRUCTIONS_PER_FRAME,
+                 frame_rate: int = FRAME_RATE,
+                 poll_input: typing.Optional[typing.Callable[[], bool]] = None,
+                 paced: bool = True,
+                 hooks: typing.Sequence[typing.Callable[[CPU], None]] = (),
+                 telemetry=None) -> None:
+        self.cpu = cpu
+        self.instructions_per_frame = instructions_per_frame
+        self.frame_time = 1.0 / frame_rate
+        self.poll_input = poll_input
+        self.paced = paced
+        # called with the cpu after every frame
+        self.hooks = list(hooks)
+        # a telemetry.Telemetry given the time of every phase of a frame
+        self.telemetry = telemetry
+        # the phase presenting is timed as, a threaded window only copies
+        # the frame to its own thread here and renders it there
+        self.present_phase = "render"
+        self.frames = 0
+        # frames skipped after falling behind, paced runs only
+        self.dropped = 0
+
+    def step(self) -> bool:
+        # one 60 Hz frame: latch input, run a batch of instructions, tick
+        # the timers once and present the result
+        clock = time.perf_counter
+        start = clock()
+
+        if self.poll_input is not None and not self.poll_input():
+            return False
+
+        polled = clock()
+        executed = self.cpu.cpu_frame(self.instructions_per_frame)
+        emulated = clock()
+        self.cpu.display.present(self.cpu.frame_buffer)
+        presented = clock()
+        self.frames += 1
+
+        for hook in self.hooks:
+            hook(self.cpu)
+
+        if self.telemetry is not None:
+            self.telemetry.frame(
+                self.cpu, executed, {
+                    "input": polled - start,
+                    "cpu": emulated - polled,
+                    self.present_phase: presented - emulated,
+                    "hooks": clock() - presented,
+                })
+
+        return True
+
+    def run(self, frames: int = 0) -> None:
+        deadline = time.perf_counter()
+
+        while not frames or self.frames < frames:
+            if not self.step():
+                return
+
+            if not self.paced:
+                continue
+
+            deadline += self.frame_time
+            remaining = deadline - time.perf_counter()
+
+            if remaining > 0:
+                time.sleep(remaining)
+            elif remaining < -self.frame_time:
+                # fell more than a frame behind, drop the debt instead of
+                # running flat out to catch up
+                dropped = int(-remaining / self.frame_time)
+                self.dropped += dropped
+                deadline = time.perf_counter()
+
+                if self.telemetry is not None:
+                    self.telemetry.drop(dropped)
@@ -0,0 +1,370 @@
+import argparse
+import os
+import selectors
+import socket
+import stat
+import struct
+import sys
+import typing
+import numpy as np
+from cpu import CPU
+from framebuffer import PackedFrameBuffer, WIDTH, HEIGHT
+
+# every message is a type byte and a payload length, then the payload:
+#   D  rows changed since the last D, a 32 bit row mask then the packbits
+#      encoded 8 byte rows in order
+#   K  the keypad as a 16 bit mask, bit k for key k, sent by the viewer
+MESSAGE = struct.Struct(">cH")
+DELTA = struct.Struct(">I")
+KEYS = struct.Struct(">H")
+ROW_BYTES = WIDTH // 8
+
+# a viewer this far behind is skipped until it drains, its next delta then
+# covers everything it missed
+BACKLOG = 4096
+
+Address = typing.Union[str, typing.Tuple[str, int]]
+
+
+def parse_address(text: str) -> Address:
+    # host:port for tcp, anything else is a unix socket path
+    host, _, port = text.rpartition(":")
+
+    if host and port.isdigit():
+        return host, int(port)
+
+    return text
+
+
+def open_socket(address: Address) -> socket.socket:
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    return socket.socket(family, socket.SOCK_STREAM)
+
+
+def packbits(data: bytes) -> bytes:
+    # apple packbits: n < 128 is n + 1 literal bytes, n > 128 repeats the
+    # next byte 257 - n times
+    out = bytearray()
+    i = 0
+
+    while i < len(data):
+        run = 1
+
+        while (i + run < len(data) and run < 128
+               and data[i + run] == data[i]):
+            run += 1
+
+        if run > 1:
+            out += bytes([257 - run, data[i]])
+            i += run
+            continue
+
+        start = i
+        i += 1
+
+        while (i < len(data) and i - start < 128
+               and not (i + 1 < len(data) and data[i] == data[i + 1])):
+            i += 1
+
+        out.append(i - start - 1)
+        out += data[start:i]
+
+    return bytes(out)
+
+
+def unpackbits(data: bytes) -> bytes:
+    out = bytearray()
+    i = 0
+
+    while i < len(data):
+        header = data[i]
+
+        if header > 128:
+            out += data[i + 1:i + 2] * (257 - header)
+            i += 2
+        elif header < 128:
+            out += data[i + 1:i + 2 + header]
+            i += header + 2
+        else:
+            i += 1
+
+    return bytes(out)
+
+
+def frame_rows(frame_buffer) -> typing.List[int]:
+    if isinstance(frame_buffer, PackedFrameBuffer):
+        return list(frame_buffer.rows)
+
+    return PackedFrameBuffer.from_array(frame_buffer).rows
+
+
+def encode_delta(old: typing.Optional[typing.List[int]],
+                 rows: typing.List[int]) -> typing.Optional[bytes]:
+    # None when no row changed; a viewer without a frame gets every row
+    mask = 0
+    changed = []
+
+    for y, row in enumerate(rows):
+        if old is None or old[y] != row:
+            mask |= 1 << y
+            changed.append(row.to_bytes(ROW_BYTES, "big"))
+
+    if not mask:
+        return None
+
+    payload = DELTA.pack(mask) + packbits(b"".join(changed))
+    return MESSAGE.pack(b"D", len(payload)) + payload
+
+
+def apply_delta(rows: typing.List[int], payload: bytes) -> None:
+    (mask, ) = DELTA.unpack_from(payload)
+    data = unpackbits(payload[DELTA.size:])
+    offset = 0
+
+    for y in range(HEIGHT):
+        if mask >> y & 1:
+            rows[y] = int.from_bytes(data[offset:offset + ROW_BYTES], "big")
+            offset += ROW_BYTES
+
+
+def split_messages(
+        buffer: bytearray) -> typing.Iterator[typing.Tuple[bytes, bytes]]:
+    # yields whole messages and removes them from buffer
+    while len(buffer) >= MESSAGE.size:
+        kind, length = MESSAGE.unpack_from(buffer)
+        end = MESSAGE.size + length
+
+        if len(buffer) < end:
+            return
+
+        payload = bytes(buffer[MESSAGE.size:end])
+        del buffer[:end]
+        yield kind, payload
+
+
+class Viewer:
+    # one connection as the server sees it
+
+    def __init__(self, connection: socket.socket) -> None:
+        self.connection = connection
+        self.rows: typing.Optional[typing.List[int]] = None
+        self.outgoing = bytearray()
+        self.incoming = bytearray()
+
+
+class StreamServer:
+    # never blocks the emulation: the listening socket and every viewer are
+    # non blocking and polled from the scheduler, poll() before a frame for
+    # keys and new viewers, record() after it to send the changed rows
+
+    def __init__(self, address: Address) -> None:
+        self.address = address
+        self.socket = open_socket(address)
+
+        if isinstance(address, str) and os.path.exists(address):
+            if not stat.S_ISSOCK(os.stat(address).st_mode):
+                raise FileExistsError(f"{address} is not a socket")
+            os.unlink(address)
+        else:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        self.socket.bind(address)
+        self.socket.listen()
+        self.socket.setblocking(False)
+        self.viewers: typing.List[Viewer] = []
+        self.keys: typing.Optional[int] = None
+        self.sent = 0
+        self.frames = 0
+
+    def accept(self) -> None:
+        while True:
+            try:
+                connection, _ = self.socket.accept()
+            except BlockingIOError:
+                return
+
+            connection.setblocking(False)
+            self.viewers.append(Viewer(connection))
+
+    def drop(self, viewer: Viewer) -> None:
+        viewer.connection.close()
+        self.viewers.remove(viewer)
+
+    def receive(self, viewer: Viewer) -> None:
+        while True:
+            try:
+                data = viewer.connection.recv(4096)
+            except BlockingIOError:
+                break
+            except OSError:
+                data = b""
+
+            if not data:
+                self.drop(viewer)
+                return
+
+            viewer.incoming += data
+
+        for kind, payload in split_messages(viewer.incoming):
+            if kind == b"K" and len(payload) == KEYS.size:
+                (self.keys, ) = KEYS.unpack(payload)
+
+    def flush(self, viewer: Viewer) -> None:
+        try:
+            sent = viewer.connection.send(viewer.outgoing)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.drop(viewer)
+            return
+
+        del viewer.outgoing[:sent]
+        self.sent += sent
+
+    def poll(self, cpu: CPU) -> bool:
+        # a poll_input for the scheduler, the newest keys any viewer sent
+        # are latched for the coming frame
+        self.accept()
+
+        for viewer in list(self.viewers):
+            self.receive(viewer)
+
+        if self.keys is not None:
+            np.asarray(cpu.keys)[:] = (self.keys >> np.arange(16)) & 1
+
+        return True
+
+    def record(self, cpu: CPU) -> None:
+        # a scheduler hook
+        rows = frame_rows(cpu.frame_buffer)
+        self.frames += 1
+
+        for viewer in list(self.viewers):
+            if viewer.outgoing:
+                self.flush(viewer)
+
+            if len(viewer.outgoing) > BACKLOG or viewer not in self.viewers:
+                continue
+
+            message = encode_delta(viewer.rows, rows)
+
+            if message is not None:
+                viewer.outgoing += message
+                viewer.rows = rows
+                self.flush(viewer)
+
+    def close(self) -> None:
+        for viewer in list(self.viewers):
+            self.drop(viewer)
+
+        self.socket.close()
+
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+
+class StreamClient:
+    # the viewer end: rebuilds the frame from deltas and sends keys back
+
+    def __init__(self, address: Address) -> None:
+        self.socket = open_socket(address)
+        self.socket.connect(address)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.socket, selectors.EVENT_READ)
+        self.frame_buffer = PackedFrameBuffer()
+        self.incoming = bytearray()
+        self.deltas = 0
+        self.received = 0
+        self.closed = False
+
+    def receive(self, timeout: float = 0.0) -> bool:
+        # True when the frame changed
+        changed = False
+
+        while self.selector.select(timeout):
+            timeout = 0.0
+            data = self.socket.recv(65536)
+
+            if not data:
+                self.closed = True
+                break
+
+            self.received += len(data)
+            self.incoming += data
+
+        for kind, payload in split_messages(self.incoming):
+            if kind == b"D":
+                apply_delta(self.frame_buffer.rows, payload)
+                self.deltas += 1
+                changed = True
+
+        return changed
+
+    def send_keys(self, mask: int) -> None:
+        self.socket.sendall(MESSAGE.pack(b"K", KEYS.size) + KEYS.pack(mask))
+
+    def close(self) -> None:
+        self.selector.close()
+        self.socket.close()
+
+
+def view(address: Address, scale: int, layout: typing.Optional[str]) -> None:
+    import pygame
+    import gpu
+    from key_map import key_map, load_layout
+    from keypad import Keypad
+
+    pygame.init()
+    client = StreamClient(address)
+    display = gpu.PygameDisplay(scale, f"Chip-8 {address}")
+    keypad = Keypad(load_layout(layout) if layout else key_map)
+    clock = pygame.time.Clock()
+    mask = 0
+
+    try:
+        while not client.closed:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    return
+                if event.type == pygame.KEYDOWN:
+                    keypad.press(event.key)
+                elif event.type == pygame.KEYUP:
+                    keypad.release(event.key)
+
+            keys = int(np.packbits(keypad.state,
+                                   bitorder="little").view("<u2")[0])
+
+            if keys != mask:
+                mask = keys
+                client.send_keys(mask)
+
+            if client.receive():
+                display.present(client.frame_buffer.to_array())
+
+            clock.tick(60)
+    finally:
+        client.close()
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Chip-8 stream viewer")
+    parser.add_argument("address",
+                        help="host:port or a unix socket path to watch.")
+    parser.add_argument("-s",
+                        "--scale",
+                        default=15,
+                        type=int,
+                        help="the window pixel size.")
+    parser.add_argument(
+        "--layout",
+        metavar="PATH",
+        help="a json keypad layout to use instead of the default one.")
+    args = parser.parse_args(argv)
+
+    view(parse_address(args.address), args.scale, args.layout)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
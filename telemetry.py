@@ -0,0 +1,307 @@
+import functools
+import http.server
+import os
+import tempfile
+import threading
+import time
+import typing
+from cpu import CPU, Opcode
+from scheduler import FRAME_RATE
+
+# where the wall clock time of a frame goes, see FrameScheduler.step;
+# exchange is the copy to the window thread of a threaded run
+PHASES = ("input", "cpu", "render", "hooks", "exchange")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Exporter = typing.Callable[["Telemetry"], None]
+
+
+class Telemetry:
+    # fed once a frame by the scheduler: instructions are what cpu_frame
+    # returned and draws are counted by the Dxyn entries attach puts in the
+    # cpu's decode table, the only per instruction cost; every interval
+    # the rates over the window since the previous one are updated and the
+    # exporters called, on the thread that ran the frame
+
+    def __init__(self,
+                 frame_rate: int = FRAME_RATE,
+                 interval: float = 1.0,
+                 exporters: typing.Sequence[Exporter] = ()) -> None:
+        self.frame_time = 1.0 / frame_rate
+        self.interval = interval
+        self.exporters = list(exporters)
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.instructions = 0
+        self.idle_frames = 0
+        self.draws = 0
+        # Dxyn run since the previous frame, bumped on the cpu thread
+        self.counted = 0
+        self.dropped = 0
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.started: typing.Optional[float] = None
+        self.last = 0.0
+        self.worst = 0.0
+        # cpu.idle_frames as of the previous frame
+        self.seen = 0
+        # time, frames, instructions and draws when the window opened
+        self.window = (0.0, 0, 0, 0)
+        self.rates = {
+            "fps": 0.0,
+            "ips": 0.0,
+            "speed": 0.0,
+            "draws_per_frame": 0.0,
+            "worst_frame_seconds": 0.0,
+        }
+        self.cpu: typing.Optional[CPU] = None
+        self.dispatch: typing.Optional[typing.List] = None
+
+    def attach(self, cpu: CPU) -> None:
+        # before a profiler, so that it looks up the counting handler
+        draw = cpu.dispatch[0xD000][0]
+
+        @functools.wraps(draw)
+        def counted(cpu: CPU, opcode: Opcode) -> None:
+            self.counted += 1
+            draw(cpu, opcode)
+
+        self.cpu = cpu
+        self.dispatch = cpu.dispatch
+        dispatch = list(cpu.dispatch)
+        dispatch[0xD000:0xE000] = [(counted, opcode)
+                                   for _, opcode in dispatch[0xD000:0xE000]]
+        cpu.dispatch = dispatch
+        self.flush_blocks(cpu)
+
+    def detach(self) -> None:
+        if self.cpu is not None:
+            self.cpu.dispatch = self.dispatch
+            self.flush_blocks(self.cpu)
+            self.cpu = self.dispatch = None
+
+    @staticmethod
+    def flush_blocks(cpu: CPU) -> None:
+        # translated blocks hold on to the handlers they were built with
+        flush = getattr(cpu, "flush", None)
+        if flush is not None:
+            flush()
+
+    def frame(self, cpu: CPU, instructions: int,
+              seconds: typing.Dict[str, float]) -> None:
+        # seconds maps some of PHASES to the time the frame spent in them
+        now = time.perf_counter()
+        draws, self.counted = self.counted, 0
+        idle_frames = cpu.idle_frames
+
+        with self.lock:
+            if self.started is None:
+                self.started = self.last = now - sum(seconds.values())
+                self.window = (self.started, 0, 0, 0)
+
+            self.frames += 1
+            self.instructions += instructions
+            self.draws += draws
+            self.idle_frames += max(0, idle_frames - self.seen)
+            self.seen = idle_frames
+
+            for phase, phase_seconds in seconds.items():
+                self.seconds[phase] += phase_seconds
+
+            self.worst = max(self.worst, now - self.last)
+            self.last = now
+            export = now - self.window[0] >= self.interval
+
+            if export:
+                self.update(now)
+
+        if export:
+            self.export()
+
+    def render(self, seconds: float, dropped: int = 0) -> None:
+        # rendering done away from the scheduler, a threaded window
+        with self.lock:
+            self.seconds["render"] += seconds
+            self.dropped += dropped
+
+    def drop(self, frames: int) -> None:
+        with self.lock:
+            self.dropped += frames
+
+    def update(self, now: float) -> None:
+        # the lock is held
+        start, frames, instructions, draws = self.window
+        elapsed = max(now - start, 1e-9)
+        frames = self.frames - frames
+
+        self.rates = {
+            "fps": frames / elapsed,
+            "ips": (self.instructions - instructions) / elapsed,
+            "speed": frames * self.frame_time / elapsed,
+            "draws_per_frame": (self.draws - draws) / max(frames, 1),
+            "worst_frame_seconds": self.worst,
+        }
+        self.window = (now, self.frames, self.instructions, self.draws)
+        self.worst = 0.0
+
+    def export(self) -> None:
+        for exporter in self.exporters:
+            exporter(self)
+
+    def flush(self) -> None:
+        # closes the window early for a last export, say on exit
+        with self.lock:
+            if self.frames > self.window[1]:
+                self.update(self.last)
+
+        self.export()
+
+    def snapshot(self) -> typing.Dict[str, typing.Any]:
+        with self.lock:
+            return {
+                "frames": self.frames,
+                "instructions": self.instructions,
+                "idle_frames": self.idle_frames,
+                "draws": self.draws,
+                "dropped": self.dropped,
+                "emulated_seconds": self.frames * self.frame_time,
+                "wall_seconds": (0.0 if self.started is None else
+                                 self.last - self.started),
+                "seconds": dict(self.seconds),
+                **self.rates,
+            }
+
+    def prometheus(self) -> str:
+        snapshot = self.snapshot()
+        metrics = [
+            ("frames_total", "counter", "frames emulated",
+             snapshot["frames"]),
+            ("instructions_total", "counter",
+             "instructions executed",
+             snapshot["instructions"]),
+            ("idle_frames_total", "counter",
+             "frames ended early waiting on a timer or a key",
+             snapshot["idle_frames"]),
+            ("draw_calls_total", "counter", "Dxyn instructions executed",
+             snapshot["draws"]),
+            ("dropped_frames_total", "counter",
+             "frames skipped or never shown after falling behind",
+             snapshot["dropped"]),
+            ("emulated_seconds_total", "counter",
+             "machine time emulated at 60 Hz", snapshot["emulated_seconds"]),
+            ("wall_seconds_total", "counter",
+             "wall clock time since the first frame",
+             snapshot["wall_seconds"]),
+            ("phase_seconds_total", "counter",
+             "wall clock time spent in each phase of a frame", [
+                 (f'{{phase="{phase}"}}', seconds)
+                 for phase, seconds in snapshot["seconds"].items()
+             ]),
+            ("frames_per_second", "gauge", "over the last interval",
+             snapshot["fps"]),
+            ("instructions_per_second", "gauge", "over the last interval",
+             snapshot["ips"]),
+            ("speed_ratio", "gauge",
+             "emulated over wall clock time in the last interval",
+             snapshot["speed"]),
+            ("draw_calls_per_frame", "gauge", "over the last interval",
+             snapshot["draws_per_frame"]),
+            ("worst_frame_seconds", "gauge",
+             "the longest frame in the last interval",
+             snapshot["worst_frame_seconds"]),
+        ]
+        lines = []
+
+        for name, kind, description, samples in metrics:
+            if not isinstance(samples, list):
+                samples = [("", samples)]
+
+            lines += [
+                f"# HELP chip8_{name} {description}",
+                f"# TYPE chip8_{name} {kind}",
+            ]
+            lines += [
+                f"chip8_{name}{labels} {value}"
+                for labels, value in samples
+            ]
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        # one line for the overlay and the report on exit
+        snapshot = self.snapshot()
+        wall = max(snapshot["wall_seconds"], 1e-9)
+        busy = " ".join(f"{phase} {seconds / wall:.0%}"
+                        for phase, seconds in snapshot["seconds"].items())
+
+        return (f"{snapshot['fps']:.0f} fps {snapshot['ips']:,.0f} ips "
+                f"x{snapshot['speed']:.2f} {busy} "
+                f"{snapshot['draws_per_frame']:.1f} draws/frame "
+                f"{snapshot['dropped']} dropped")
+
+
+class TextfileExporter:
+    # for a node exporter style textfile collector; the file is replaced
+    # atomically so a scrape never reads half of it
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def __call__(self, telemetry: Telemetry) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        handle, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+
+        try:
+            with os.fdopen(handle, "w") as file:
+                file.write(telemetry.prometheus())
+
+            os.replace(temporary, self.path)
+        except OSError:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self) -> None:
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+
+        body = self.server.telemetry.prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class MetricsServer:
+    # serves GET /metrics from a daemon thread, bound to localhost unless
+    # told otherwise; port 0 picks a free one, see address
+
+    def __init__(self,
+                 telemetry: Telemetry,
+                 port: int,
+                 host: str = "127.0.0.1") -> None:
+        self.server = http.server.ThreadingHTTPServer((host, port),
+                                                      MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.telemetry = telemetry
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       name="metrics",
+                                       daemon=True)
+        self.thread.start()
+
+    @property
+    def address(self) -> typing.Tuple[str, int]:
+        return self.server.server_address[:2]
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
@@ -1,6 +1,40 @@
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+import urllib.error
+import urllib.request
+import benchmarks
+import conformance
+import chip8
 import cpu
 from fonts import FONTS
+from display import NullDisplay, FramebufferDisplay
+from scheduler import FrameScheduler
+from framebuffer import PackedFrameBuffer, frame_hash
+from jit import JitCPU
+from keypad import Keypad
+from batch import BatchCPU
+from pool import EnvPool
+from profiler import Profiler
+from catalog import Catalog, ANALYSIS_VERSION, rom_hash
+import analysis
+from analysis import analyze
+from threaded import FrameExchange, ThreadedScheduler
+from capture import Capture, RawWriter, GifWriter, PngWriter
+from debugger import Debugger, Console
+import stream
+from recording import Recording, RecordingError, replay
+from scalar import ScalarCPU
+from telemetry import Telemetry, TextfileExporter, MetricsServer
+from savestate import (save_state, load_state, Rewind, StateError,
+                       STATE_SIZE)
 import numpy as np
 
 
@@ -16,25 +50,33 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testopcode.y, 10)
 
     def test_init_cpu(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         test_fonts = testcpu.ram[0x50:0x50 + 80]
 
         for i in range(FONTS.shape[0]):
             self.assertEqual(FONTS[i], test_fonts[i])
 
-        with open(r'roms\Paddles.ch8', "rb") as file:
-            buffer = file.read()
+        handle, rom = tempfile.mkstemp(suffix=".ch8")
+        with os.fdopen(handle, "wb") as file:
+            file.write(bytes(PROGRAM))
 
-        buffer_np = np.array(list(buffer), dtype=np.ubyte)
+        try:
+            with open(rom, "rb") as file:
+                buffer = file.read()
+
+            buffer_np = np.array(list(buffer), dtype=np.ubyte)
+
+            testcpu.load_rom_to_ram(rom)
+        finally:
+            os.remove(rom)
 
-        testcpu.load_rom_to_ram(r'roms\Paddles.ch8')
         testing_ram = testcpu.ram[0x200:0x200 + buffer_np.shape[0]]
 
         for i in range(buffer_np.shape[0]):
             self.assertEqual(buffer_np[i], testing_ram[i])
 
     # def test_op_cls(self):
-    #     testcpu = cpu.CPU(screen="_")
+    #     testcpu = cpu.CPU()
 
     #     for _ in range(10):
     #         testcpu.frame_buffer[np.random.randint(0, 64),
@@ -47,7 +89,7 @@ class TestCPU(unittest.TestCase):
     #             self.assertEqual(testcpu.frame_buffer[i, j], 0)
 
     def test_ret(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testcpu.stack[testcpu.sp] = testcpu.pc
         testcpu.sp += 1
 
@@ -56,14 +98,14 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.sp, 0)
 
     def test_op_jp_addr(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0x13A5))
 
         testcpu.op_jp_addr(testopcode)
         self.assertEqual(testcpu.pc, 0x3A5)
 
     def test_op_call_addr(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0x23A5))
 
         testcpu.op_call_addr(testopcode)
@@ -76,7 +118,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.stack[testcpu.sp - 1], 0x3A5)
 
     def test_op_se_vx_byt(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0x33B4))
 
         testcpu.v[3] = 0xB4
@@ -88,7 +130,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.pc, 0x202)
 
     def test_op_sne_vx_byte(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0x43B4))
 
         testcpu.v[3] = 0xB4
@@ -100,7 +142,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.pc, 0x202)
 
     def test_op_se_vx_vy(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0x5344))
 
         testcpu.v[3] = 0xB4
@@ -114,14 +156,14 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.pc, 0x202)
 
     def test_op_ld_vx_byte(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0x6344))
 
         testcpu.op_ld_vx_byte(testopcode)
         self.assertEqual(testcpu.v[testopcode.x], 0x44)
 
     def test_op_add_vx_byte(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0x6344))
 
         testcpu.op_add_vx_byte(testopcode)
@@ -131,7 +173,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.v[testopcode.x], 0x44 + 0x44)
 
     def test_op_ld_vx_vy(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0x7344))
         testcpu.v[4] = 0x68
         testcpu.op_ld_vx_vy(testopcode)
@@ -142,7 +184,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.v[testopcode.x], 0xAA)
 
     def test_op_or_vx_vy(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0x8341))
 
         testcpu.v[4] = 0xAA
@@ -154,7 +196,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.v[testopcode.x], 0xFF)
 
     def test_op_and_vx_vy(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0x8341))
 
         testcpu.v[3] = 0xAA
@@ -163,7 +205,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.v[testopcode.x], 0x0A)
 
     def test_op_xor_vx_vy(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0x8341))
 
         testcpu.v[3] = 0xAF
@@ -175,7 +217,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.v[testopcode.x], 0xAF)
 
     def test_op_add_vx_vy(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0x8341))
 
         testcpu.v[3] = 0x0F
@@ -191,7 +233,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.v[0xF], 1)
 
     def test_op_sub_vx_vy(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0x8341))
 
         testcpu.v[3] = 0x0F
@@ -207,7 +249,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.v[0xF], 1)
 
     def test_op_shr_vx_vy(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0x8341))
 
         testcpu.v[3] = 0x0F
@@ -221,7 +263,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.v[0xF], 0)
 
     def test_op_subn_vx_vy(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0x8341))
 
         testcpu.v[3] = 0x0F
@@ -237,7 +279,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.v[0xF], 1)
 
     def test_op_shl_vx_vy(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0x8341))
 
         testcpu.v[3] = 0xFF
@@ -251,7 +293,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.v[0xF], 0)
 
     def test_op_sne_vx_vy(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0x9340))
 
         testcpu.v[3] = 0xB4
@@ -265,13 +307,13 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.pc, 0x202)
 
     def test_op_ld_i_addr(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0xA340))
         testcpu.op_ld_i_addr(testopcode)
         self.assertEqual(testcpu.i, 0x340)
 
     def test_op_jp_v0_addr(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0xB340))
         testcpu.op_jp_v0_addr(testopcode)
         self.assertEqual(testcpu.pc, 0x340)
@@ -280,7 +322,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.pc, 0x341)
 
     def test_op_rnd_vx_byte(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0xc3AA))
         testcpu.op_rnd_vx_byte(testopcode)
         self.assertEqual(testcpu.v[3] & 0x55, 0)
@@ -290,7 +332,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.v[3] & 0xF0, 0)
 
     def test_op_skp_vx(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0xE39E))
 
         testcpu.v[3] = 4
@@ -303,7 +345,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.pc, 0x202)
 
     def test_op_sknp_vx(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0xE3A1))
 
         testcpu.v[3] = 4
@@ -316,7 +358,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.pc, 0x202)
 
     def test_op_ld_vx_dt(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0xF307))
 
         testcpu.dt = 0x20
@@ -324,7 +366,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.v[testopcode.x], 0x20)
 
     def test_op_ld_dt_vx(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0xF315))
 
         testcpu.v[3] = 0x20
@@ -332,7 +374,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.dt, 0x20)
 
     def test_op_ld_st_vx(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0xF318))
 
         testcpu.v[3] = 0x20
@@ -340,7 +382,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.st, 0x20)
 
     def test_op_add_i_vx(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0xF31E))
 
         testcpu.v[3] = 0x20
@@ -351,7 +393,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.i, 0x20 + 0x20)
 
     def test_op_ld_f_vx(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0xF329))
 
         testcpu.op_ld_f_vx(testopcode)
@@ -361,7 +403,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.i, 95)
 
     def test_op_ld_b_vx(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0xF329))
 
         testcpu.v[3] = 254
@@ -371,7 +413,7 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.ram[testcpu.i + 2], 4)
 
     def test_op_ld_i_vx(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0xF355))
 
         testcpu.v[:4] = [25, 34, 35, 60]
@@ -381,7 +423,7 @@ class TestCPU(unittest.TestCase):
             self.assertEqual(testcpu.ram[testcpu.i + i], testcpu.v[i])
 
     def test_op_ld_vx_i(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0xF355))
 
         testcpu.ram[testcpu.i:testcpu.i + 4] = [25, 34, 35, 60]
@@ -391,7 +433,7 @@ class TestCPU(unittest.TestCase):
             self.assertEqual(testcpu.ram[testcpu.i + i], testcpu.v[i])
 
     def test_op_ld_vx_k(self):
-        testcpu = cpu.CPU(screen="_")
+        testcpu = cpu.CPU()
         testopcode = cpu.Opcode.adapt(np.ushort(0xF355))
 
         testcpu.op_ld_vx_k(testopcode)
@@ -412,4 +454,1603 @@ class TestCPU(unittest.TestCase):
         self.assertEqual(testcpu.v[testopcode.x], 2)
 
 
-unittest.main()
\ No newline at end of file
+class TestDecode(unittest.TestCase):
+
+    def test_decode_table_covers_every_opcode(self):
+        table = cpu.CPU.decode_table()
+        self.assertEqual(len(table), 0x10000)
+
+        handler, opcode = table[0xD3A5]
+        self.assertIs(handler, cpu.CPU.op_drw_vx_vy_nibble)
+        self.assertEqual(opcode, cpu.Opcode.adapt(np.ushort(0xD3A5)))
+
+    def test_decode_families(self):
+        table = cpu.CPU.decode_table()
+
+        self.assertIs(table[0x00E0][0], cpu.CPU.op_cls)
+        self.assertIs(table[0x00EE][0], cpu.CPU.op_ret)
+        self.assertIs(table[0x834E][0], cpu.CPU.op_shl_vx_vy)
+        self.assertIs(table[0xE39E][0], cpu.CPU.op_skp_vx)
+        self.assertIs(table[0xF307][0], cpu.CPU.op_ld_vx_dt)
+        self.assertIs(table[0xE307][0], cpu.CPU.op_illegal)
+        self.assertIs(table[0x8348][0], cpu.CPU.op_illegal)
+        self.assertIs(table[0x0123][0], cpu.CPU.op_sys)
+        self.assertIs(table[0x0000][0], cpu.CPU.op_illegal)
+
+    def test_sys_is_ignored(self):
+        # 0123 then V3 = 44, 0000 stays illegal on every cpu
+        program = [0x01, 0x23, 0x63, 0x44, 0x00, 0x00]
+
+        for cpu_type in (cpu.CPU, cpu.PackedCPU, JitCPU, ScalarCPU):
+            testcpu = cpu_type()
+            testcpu.load_rom(bytes(program))
+
+            with self.assertRaises(cpu.IllegalOpcodeError) as context:
+                testcpu.cpu_frame(3)
+
+            self.assertEqual(int(testcpu.v[3]), 0x44, cpu_type.__name__)
+            self.assertEqual(context.exception.address, 0x204)
+
+        batch = BatchCPU(1)
+        batch.load_rom(bytes(program))
+        batch.cpu_frame(3)
+        self.assertEqual(batch.v[0, 3], 0x44)
+        self.assertTrue(batch.halted[0])
+        self.assertEqual(batch.pc[0], 0x204)
+
+    def test_illegal_opcode(self):
+        testcpu = cpu.CPU()
+        testcpu.ram[0x200:0x202] = [0xF3, 0xFF]
+
+        with self.assertRaises(cpu.IllegalOpcodeError) as context:
+            testcpu.cpu_cycle()
+
+        self.assertEqual(context.exception.opcode, 0xF3FF)
+        self.assertEqual(context.exception.address, 0x200)
+
+    def test_cpu_cycle(self):
+        testcpu = cpu.CPU()
+        testcpu.ram[0x200:0x206] = [0x63, 0x44, 0x73, 0x01, 0x12, 0x00]
+
+        for _ in range(3):
+            testcpu.cpu_cycle()
+
+        self.assertEqual(testcpu.v[3], 0x45)
+        self.assertEqual(testcpu.pc, 0x200)
+
+
+class TestDisplay(unittest.TestCase):
+
+    def test_default_display_is_headless(self):
+        testcpu = cpu.CPU()
+        self.assertIsInstance(testcpu.display, NullDisplay)
+
+    def test_framebuffer_display(self):
+        display = FramebufferDisplay()
+        testcpu = cpu.CPU(display)
+        testcpu.i = 0x50
+        testopcode = cpu.Opcode.adapt(np.ushort(0xD015))
+
+        testcpu.op_drw_vx_vy_nibble(testopcode)
+        self.assertEqual(display.presented, 0)
+
+        FrameScheduler(testcpu, 0, paced=False).run(1)
+
+        self.assertEqual(display.presented, 1)
+        self.assertTrue(np.array_equal(display.frame, testcpu.frame_buffer))
+        self.assertEqual(display.frame[:4, 0].sum(), 4)
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_timers_tick_per_frame(self):
+        testcpu = cpu.CPU()
+        testcpu.ram[0x200:0x202] = [0x12, 0x00]
+        testcpu.dt = 5
+        testcpu.st = 1
+
+        testcpu.cpu_cycle()
+        self.assertEqual(testcpu.dt, 5)
+
+        FrameScheduler(testcpu, 10, paced=False).run(3)
+        self.assertEqual(testcpu.dt, 2)
+        self.assertEqual(testcpu.st, 0)
+
+    def test_poll_input_stops_run(self):
+        testcpu = cpu.CPU()
+        testcpu.ram[0x200:0x202] = [0x12, 0x00]
+        polls = []
+
+        def poll_input():
+            polls.append(1)
+            return len(polls) < 4
+
+        scheduler = FrameScheduler(testcpu, 10, poll_input=poll_input)
+        scheduler.run()
+
+        self.assertEqual(scheduler.frames, 3)
+        self.assertEqual(len(polls), 4)
+
+
+class TestPygameDisplay(unittest.TestCase):
+
+    def setUp(self):
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        import gpu
+        gpu.pygame.display.init()
+        self.display = gpu.PygameDisplay(scale=2)
+
+    def tearDown(self):
+        import gpu
+        gpu.pygame.display.quit()
+
+    def test_unchanged_frame_is_not_presented(self):
+        frame_buffer = np.zeros([64, 32], dtype=np.bool_)
+
+        self.display.present(frame_buffer)
+        self.assertEqual(self.display.presented, 0)
+
+    def test_dirty_rects(self):
+        frame_buffer = np.zeros([64, 32], dtype=np.bool_)
+        frame_buffer[3:6, 2] = 1
+        frame_buffer[10, 7] = 1
+
+        rects = self.display.dirty_rects(frame_buffer)
+        self.assertEqual([tuple(rect) for rect in rects], [(6, 4, 6, 2),
+                                                           (20, 14, 2, 2)])
+
+        self.display.present(frame_buffer)
+        self.assertEqual(self.display.presented, 1)
+        self.assertEqual(self.display.screen.get_at((7, 5)), (255, 255, 255))
+        self.assertEqual(self.display.dirty_rects(frame_buffer), [])
+
+
+class TestPackedFrameBuffer(unittest.TestCase):
+
+    def test_draw_matches_cpu(self):
+        testcpu = cpu.CPU()
+        packedcpu = cpu.PackedCPU()
+        rng = np.random.default_rng(8)
+
+        for _ in range(200):
+            sprite = rng.integers(0, 256, 15, dtype=np.ubyte)
+            testopcode = cpu.Opcode.adapt(0xD010 | rng.integers(0, 16))
+
+            for machine in (testcpu, packedcpu):
+                machine.i = 0x300
+                machine.ram[0x300:0x30F] = sprite
+                machine.v[0] = rng.integers(0, 256)
+                machine.v[1] = rng.integers(0, 256)
+
+            packedcpu.v[:2] = testcpu.v[:2]
+            testcpu.op_drw_vx_vy_nibble(testopcode)
+            packedcpu.op_drw_vx_vy_nibble(testopcode)
+
+            self.assertEqual(testcpu.v[0xF], packedcpu.v[0xF])
+            self.assertTrue(
+                np.array_equal(testcpu.frame_buffer,
+                               np.asarray(packedcpu.frame_buffer)))
+
+    def test_wrap_and_bytes(self):
+        frame_buffer = PackedFrameBuffer()
+
+        self.assertFalse(frame_buffer.draw_sprite(60, 31, bytes([0xFF, 0x81])))
+        self.assertTrue(frame_buffer[63, 31])
+        self.assertTrue(frame_buffer[0, 31])
+        self.assertTrue(frame_buffer[60, 0])
+        self.assertFalse(frame_buffer[61, 0])
+        self.assertTrue(frame_buffer.draw_sprite(63, 31, bytes([0x80])))
+        self.assertFalse(frame_buffer[63, 31])
+
+        self.assertEqual(len(frame_buffer.tobytes()), 256)
+        self.assertEqual(PackedFrameBuffer.frombytes(frame_buffer.tobytes()),
+                         frame_buffer)
+        self.assertEqual(PackedFrameBuffer.from_array(frame_buffer.to_array()),
+                         frame_buffer)
+
+
+PROGRAM = [
+    0x6A, 0x00, 0x7A, 0x01, 0x8B, 0xA0, 0x8B, 0xA4, 0x8C, 0xB5, 0x8C, 0x06,
+    0xA3, 0x00, 0xFA, 0x33, 0xF2, 0x65, 0xD0, 0x15, 0x3A, 0x40, 0x12, 0x02,
+    0xE1, 0x9E, 0x6D, 0x01, 0x12, 0x00
+]
+
+
+class TestJit(unittest.TestCase):
+
+    def test_matches_interpreter(self):
+        testcpu = cpu.CPU()
+        jitcpu = JitCPU()
+
+        for machine in (testcpu, jitcpu):
+            machine.ram[0x200:0x200 + len(PROGRAM)] = PROGRAM
+
+            for _ in range(200):
+                machine.cpu_frame(7)
+
+        for name in ("v", "i", "pc", "sp", "dt", "ram", "frame_buffer"):
+            self.assertTrue(
+                np.array_equal(getattr(testcpu, name), getattr(jitcpu, name)),
+                name)
+        self.assertLess(jitcpu.translations, 20)
+
+    def test_self_modifying_code(self):
+        jitcpu = JitCPU()
+        jitcpu.ram[0x300:0x304] = [0x6D, 0x05, 0x13, 0x00]
+        jitcpu.pc = 0x300
+
+        jitcpu.cpu_frame(2)
+        self.assertEqual(jitcpu.v[0xD], 5)
+        self.assertIn(0x300, jitcpu.blocks)
+
+        jitcpu.i = 0x301
+        jitcpu.v[0] = 9
+        jitcpu.op_ld_i_vx(cpu.Opcode.adapt(0xF055))
+        self.assertNotIn(0x300, jitcpu.blocks)
+        self.assertEqual(jitcpu.invalidations, 1)
+
+        jitcpu.cpu_frame(2)
+        self.assertEqual(jitcpu.v[0xD], 9)
+
+
+class TestBatch(unittest.TestCase):
+
+    def test_matches_cpu(self):
+        cpus = []
+
+        for n in range(6):
+            testcpu = cpu.CPU()
+            testcpu.ram[0x200:0x200 + len(PROGRAM)] = PROGRAM
+            testcpu.v[:] = np.arange(16) * (n + 1)
+            testcpu.keys[1] = n % 2
+            cpus.append(testcpu)
+
+        batch = BatchCPU.from_cpus(cpus)
+
+        for _ in range(200):
+            batch.cpu_frame(7)
+
+            for testcpu in cpus:
+                testcpu.cpu_frame(7)
+
+        for n, testcpu in enumerate(cpus):
+            batchcpu = batch.to_cpu(n)
+
+            for name in ("v", "i", "pc", "sp", "stack", "dt", "ram",
+                         "frame_buffer"):
+                self.assertTrue(
+                    np.array_equal(getattr(testcpu, name),
+                                   getattr(batchcpu, name)), name)
+
+    def test_draw_with_vf_coordinates(self):
+        # DF05 then D0F5 with VF = 10, every cpu reads the coordinates
+        # before the collision flag overwrites VF
+        program = [
+            0x6F, 0x0A, 0x60, 0x03, 0xA0, 0x50, 0xDF, 0x05, 0x6F, 0x0A,
+            0xD0, 0xF5, 0x12, 0x0C
+        ]
+        expected = cpu.CPU()
+        expected.load_rom(bytes(program))
+        expected.cpu_frame(7)
+        self.assertEqual(
+            np.flatnonzero(expected.frame_buffer.any(axis=1)).tolist(),
+            [3, 4, 5, 6, 10, 11, 12, 13])
+
+        for cpu_type in (cpu.PackedCPU, JitCPU, ScalarCPU):
+            testcpu = cpu_type()
+            testcpu.load_rom(bytes(program))
+            testcpu.cpu_frame(7)
+            frame_buffer = testcpu.frame_buffer
+
+            if isinstance(frame_buffer, PackedFrameBuffer):
+                frame_buffer = frame_buffer.to_array()
+
+            self.assertEqual(int(testcpu.v[0xF]), int(expected.v[0xF]))
+            self.assertTrue(
+                np.array_equal(frame_buffer, expected.frame_buffer),
+                cpu_type.__name__)
+
+        batch = BatchCPU(2)
+        batch.load_rom(bytes(program))
+        batch.cpu_frame(7)
+        self.assertTrue(np.array_equal(batch.frame_buffer[1],
+                                       expected.frame_buffer))
+        self.assertEqual(batch.v[:, 0xF].tolist(), [expected.v[0xF]] * 2)
+
+    def test_sprite_at_end_of_ram(self):
+        # the last five bytes of ram draw on every cpu, a sixth row is an
+        # error on every cpu instead of a short sprite on some
+        program = [0xAF, 0xFB, 0xD0, 0x05, 0xD0, 0x06]
+        program += [0] * (0xFFB - 0x200 - len(program))
+        program += [0xFF, 0x81, 0x81, 0x81, 0xFF]
+        frame_buffers = []
+
+        for cpu_type in (cpu.CPU, cpu.PackedCPU, JitCPU, ScalarCPU):
+            testcpu = cpu_type()
+            testcpu.load_rom(bytes(program))
+            testcpu.cpu_frame(2)
+            frame_buffer = testcpu.frame_buffer
+
+            if isinstance(frame_buffer, PackedFrameBuffer):
+                frame_buffer = frame_buffer.to_array()
+            frame_buffers.append(np.asarray(frame_buffer))
+
+            with self.assertRaises(cpu.SpriteRangeError) as raised:
+                testcpu.cpu_frame(1)
+            self.assertIsInstance(raised.exception, IndexError)
+            self.assertEqual(
+                str(raised.exception),
+                "sprite of 6 rows at FFB runs past the end of ram")
+            self.assertEqual(int(testcpu.v[0xF]), 0, cpu_type.__name__)
+
+        self.assertEqual(int(frame_buffers[0].sum()), 22)
+        for frame_buffer in frame_buffers[1:]:
+            self.assertTrue(np.array_equal(frame_buffer, frame_buffers[0]))
+
+    def test_illegal_opcode_halts_instance(self):
+        batch = BatchCPU(2)
+        batch.ram[0, 0x200:0x202] = [0xF3, 0xFF]
+        batch.ram[1, 0x200:0x204] = [0x63, 0x07, 0x12, 0x02]
+
+        batch.cpu_frame(3)
+
+        self.assertEqual(batch.halted.tolist(), [True, False])
+        self.assertEqual(batch.pc.tolist(), [0x200, 0x202])
+        self.assertEqual(batch.v[1, 3], 7)
+
+
+def done_after_draw(machine):
+    return bool(np.asarray(machine.frame_buffer).any())
+
+
+class TestEnvPool(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.rom = tempfile.mkstemp(suffix=".ch8")
+        with os.fdopen(handle, "wb") as file:
+            file.write(bytes(PROGRAM))
+
+    def tearDown(self):
+        os.remove(self.rom)
+
+    def test_step_matches_cpu(self):
+        testcpu = cpu.CPU()
+        testcpu.load_rom_to_ram(self.rom)
+        testcpu.keys[1] = 1
+
+        for _ in range(6):
+            testcpu.cpu_frame(20)
+
+        with EnvPool(self.rom, 3, workers=2, frames_per_step=3,
+                     instructions_per_frame=20) as pool:
+            frames = pool.reset()
+            self.assertFalse(frames.any())
+
+            for _ in range(2):
+                frames, rewards, dones = pool.step([0b10, 0, 0b10])
+
+            self.assertTrue(np.array_equal(frames[0], testcpu.frame_buffer))
+            self.assertTrue(np.array_equal(frames[2], testcpu.frame_buffer))
+            self.assertEqual(rewards.tolist(), [0.0, 0.0, 0.0])
+            self.assertFalse(dones.any())
+
+    def test_done_resets_on_next_step(self):
+        with EnvPool(self.rom, 2, workers=1, frames_per_step=50,
+                     instructions_per_frame=20, done=done_after_draw) as pool:
+            _, _, dones = pool.step([0, 0])
+            self.assertEqual(dones.tolist(), [True, True])
+
+            frames, _, dones = pool.step([0, 0])
+            self.assertEqual(dones.tolist(), [True, True])
+            self.assertTrue(frames.any())
+
+
+class TestSaveState(unittest.TestCase):
+
+    def run_program(self, testcpu, frames):
+        for _ in range(frames):
+            testcpu.cpu_frame(7)
+
+    def test_round_trip(self):
+        for cpu_type in (cpu.CPU, cpu.PackedCPU):
+            testcpu = cpu_type()
+            testcpu.ram[0x200:0x200 + len(PROGRAM)] = PROGRAM
+            testcpu.keys[[1, 9]] = 1
+            testcpu.dt = 7
+            testcpu.stack[3] = 0x2AB
+            self.run_program(testcpu, 30)
+            testcpu.rng.integers(255)
+
+            data = save_state(testcpu)
+            self.assertEqual(len(data), STATE_SIZE)
+
+            restored = cpu_type()
+            load_state(restored, data)
+            self.assertEqual(save_state(restored), data)
+            self.assertEqual(restored.rng.integers(1 << 30),
+                             testcpu.rng.integers(1 << 30))
+
+            self.run_program(testcpu, 30)
+            self.run_program(restored, 30)
+            self.assertEqual(save_state(restored), save_state(testcpu))
+
+    def test_bad_state(self):
+        data = bytearray(save_state(cpu.CPU()))
+        data[4] = 99
+
+        with self.assertRaises(StateError):
+            load_state(cpu.CPU(), bytes(data))
+        with self.assertRaises(StateError):
+            load_state(cpu.CPU(), bytes(data[:-1]))
+
+    def test_rewind(self):
+        testcpu = cpu.CPU()
+        testcpu.ram[0x200:0x200 + len(PROGRAM)] = PROGRAM
+        rewind = Rewind(capacity=50)
+        states = []
+
+        for _ in range(80):
+            self.run_program(testcpu, 1)
+            rewind.record(testcpu)
+            states.append(save_state(testcpu))
+
+        self.assertEqual(len(rewind), 50)
+        self.assertLess(rewind.memory(), 50 * STATE_SIZE // 4)
+
+        self.assertEqual(rewind.rewind(testcpu, 10), 10)
+        self.assertEqual(save_state(testcpu), states[-11])
+
+        self.assertEqual(rewind.rewind(testcpu, 100), 40)
+        self.assertEqual(save_state(testcpu), states[-51])
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_run(self):
+        results = benchmarks.run(100, 10, ["packed"])
+
+        self.assertIn("rom/draw/packed", results["results"])
+        self.assertGreater(
+            results["results"]["opcode/op_drw_vx_vy_nibble/packed"]
+            ["calls_per_second"], 0)
+
+    def test_opcodes_on_every_cpu(self):
+        results = benchmarks.run(10, 2)["results"]
+
+        for type_name in benchmarks.CPU_TYPES:
+            for name in benchmarks.MICRO_OPCODES:
+                self.assertGreater(
+                    results[f"opcode/{name}/{type_name}"]
+                    ["calls_per_second"], 0)
+
+        # the committed baseline covers everything run measures
+        with open(benchmarks.BASELINE) as file:
+            baseline = json.load(file)
+        self.assertEqual(set(baseline["results"]), set(results))
+        self.assertGreater(baseline["threshold"], benchmarks.THRESHOLD)
+
+    def test_compare(self):
+        baseline = {"results": {"rom/loop/cpu": {"ips": 1000.0}}}
+        slower = {"results": {"rom/loop/cpu": {"ips": 950.0}}}
+        regressed = {"results": {"rom/loop/cpu": {"ips": 850.0}}}
+
+        self.assertEqual(benchmarks.compare(slower, baseline), [])
+        self.assertEqual(len(benchmarks.compare(regressed, baseline)), 1)
+
+        baseline["threshold"] = 0.2
+        self.assertEqual(benchmarks.compare(regressed, baseline), [])
+        self.assertEqual(len(benchmarks.compare(regressed, baseline, 0.1)),
+                         1)
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_profile_and_detach(self):
+        testcpu = cpu.CPU()
+        testcpu.ram[0x200:0x200 + len(PROGRAM)] = PROGRAM
+        profiler = Profiler()
+
+        profiler.attach(testcpu)
+        testcpu.cpu_frame(23)
+        profiler.detach()
+        testcpu.cpu_frame(23)
+
+        report = profiler.to_json()
+        self.assertEqual(report["instructions"], 23)
+        self.assertEqual(report["opcodes"]["op_jp_addr"]["count"], 2)
+        self.assertEqual(report["loops"], [{
+            "start": "202",
+            "end": "216",
+            "iterations": 2
+        }])
+        self.assertNotIn("cpu_cycle", vars(testcpu))
+        self.assertIn("op_drw_vx_vy_nibble", profiler.report())
+
+    def test_idle_skip_records_timer_waits(self):
+        # V0 = 60, DT = V0, then a wait on the timer at 0x204
+        testcpu = cpu.CPU()
+        testcpu.idle_skip = True
+        testcpu.load_rom(
+            bytes([0x60, 0x3C, 0xF0, 0x15, 0xF0, 0x07, 0x30, 0x00, 0x12,
+                   0x04, 0x12, 0x0A]))
+        profiler = Profiler()
+        profiler.attach(testcpu)
+
+        for _ in range(10):
+            testcpu.cpu_frame(20)
+
+        self.assertEqual(testcpu.idle_frames, 10)
+        self.assertEqual(profiler.loops[(0x204, 0x208)], 10)
+        self.assertEqual(profiler.counts["op_jp_addr"], 10)
+        self.assertEqual(sum(profiler.counts.values()), 5 + 3 * 9)
+
+
+class TestScalarCPU(unittest.TestCase):
+
+    def test_matches_cpu(self):
+        testcpu = cpu.PackedCPU()
+        scalarcpu = ScalarCPU()
+        testcpu.ram[0x200:0x200 + len(PROGRAM)] = PROGRAM
+        scalarcpu.ram[0x200:0x200 + len(PROGRAM)] = bytes(PROGRAM)
+        testcpu.keys[1] = scalarcpu.keys[1] = 1
+        testcpu.rng = np.random.default_rng(1)
+        scalarcpu.rng = np.random.default_rng(1)
+
+        for _ in range(200):
+            testcpu.cpu_frame(7)
+            scalarcpu.cpu_frame(7)
+
+        self.assertEqual(save_state(scalarcpu)[5:], save_state(testcpu)[5:])
+        self.assertIsInstance(scalarcpu.pc, int)
+
+    def test_numpy_views(self):
+        scalarcpu = ScalarCPU()
+        arrays = scalarcpu.arrays()
+
+        arrays["v"][3] = 0x44
+        arrays["stack"][0] = 0x2AB
+        arrays["keys"][5] = True
+
+        self.assertEqual(scalarcpu.v[3], 0x44)
+        self.assertEqual(scalarcpu.stack[0], 0x2AB)
+        self.assertEqual(scalarcpu.keys[5], 1)
+        self.assertFalse(hasattr(scalarcpu, "__dict__"))
+
+    def test_wrapping(self):
+        scalarcpu = ScalarCPU()
+        scalarcpu.v[3] = 0xF0
+        scalarcpu.v[4] = 0x20
+
+        scalarcpu.op_add_vx_byte(cpu.Opcode.adapt(0x7320))
+        self.assertEqual(scalarcpu.v[3], 0x10)
+
+        scalarcpu.op_sub_vx_vy(cpu.Opcode.adapt(0x8345))
+        self.assertEqual(scalarcpu.v[3], 0xF0)
+        self.assertEqual(scalarcpu.v[0xF], 0)
+
+        scalarcpu.op_shl_vx_vy(cpu.Opcode.adapt(0x834E))
+        self.assertEqual(scalarcpu.v[3], 0xE0)
+        self.assertEqual(scalarcpu.v[0xF], 1)
+
+
+TIMER_WAIT = [
+    0x60, 0x05, 0xF0, 0x15, 0xF1, 0x07, 0x31, 0x00, 0x12, 0x04, 0x72, 0x01,
+    0x12, 0x0A
+]
+
+
+class TestIdleSkip(unittest.TestCase):
+
+    def test_timer_wait(self):
+        for cpu_type in (cpu.CPU, JitCPU, ScalarCPU):
+            testcpu = cpu_type()
+            np.asarray(testcpu.ram)[0x200:0x200 + len(TIMER_WAIT)] = TIMER_WAIT
+            testcpu.idle_skip = True
+
+            for _ in range(5):
+                testcpu.cpu_frame(100)
+
+            self.assertEqual(testcpu.idle_frames, 5)
+            self.assertEqual(testcpu.dt, 0)
+            self.assertEqual(testcpu.pc, 0x204)
+
+            testcpu.cpu_frame(100)
+            self.assertEqual(testcpu.idle_frames, 5)
+            self.assertGreater(testcpu.v[2], 0)
+
+    def test_key_wait(self):
+        testcpu = cpu.CPU()
+        testcpu.ram[0x200:0x204] = [0xF3, 0x0A, 0x12, 0x02]
+        testcpu.idle_skip = True
+
+        testcpu.cpu_frame(100)
+        self.assertEqual(testcpu.idle_frames, 1)
+        self.assertEqual(testcpu.pc, 0x200)
+
+        testcpu.keys[7] = 1
+        testcpu.cpu_frame(100)
+        self.assertEqual(testcpu.idle_frames, 1)
+        self.assertEqual(testcpu.v[3], 7)
+
+    def test_disabled_by_default(self):
+        testcpu = cpu.CPU()
+        testcpu.ram[0x200:0x200 + len(TIMER_WAIT)] = TIMER_WAIT
+
+        testcpu.cpu_frame(100)
+        self.assertEqual(testcpu.idle_frames, 0)
+
+
+class TestKeypad(unittest.TestCase):
+
+    def test_press_release_latch(self):
+        keypad = Keypad({0x1: 49, 0x5: [119, 273]})
+        testcpu = cpu.CPU()
+
+        keypad.press(49)
+        keypad.press(119)
+        keypad.press(273)
+        keypad.press(999)
+        keypad.release(119)
+        self.assertFalse(testcpu.keys.any())
+
+        keypad.latch(testcpu)
+        self.assertEqual(np.flatnonzero(testcpu.keys).tolist(), [0x1, 0x5])
+
+        keypad.release(273)
+        keypad.latch(testcpu)
+        self.assertEqual(np.flatnonzero(testcpu.keys).tolist(), [0x1])
+
+    def test_latch_scalar_cpu(self):
+        keypad = Keypad({0xA: 122})
+        scalarcpu = ScalarCPU()
+
+        keypad.press(122)
+        keypad.latch(scalarcpu)
+        self.assertEqual(scalarcpu.keys[0xA], 1)
+
+    def test_load_layout(self):
+        import key_map
+        handle, path = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(handle, "w") as file:
+            file.write('{"5": ["w", "up"], "a": "z"}')
+
+        try:
+            layout = key_map.load_layout(path)
+        finally:
+            os.remove(path)
+
+        self.assertEqual(layout, {
+            0x5: [key_map.pygame.K_w, key_map.pygame.K_UP],
+            0xA: [key_map.pygame.K_z]
+        })
+
+
+# draws font digit 0 at a random position while key 5 is held
+RANDOM_DRAW = [
+    0xC0, 0x3F, 0xC1, 0x1F, 0x62, 0x05, 0xE2, 0x9E, 0x12, 0x0E, 0xA0, 0x50,
+    0xD0, 0x15, 0x12, 0x00
+]
+
+
+class TestRecording(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.rom = tempfile.mkstemp(suffix=".ch8")
+        with os.fdopen(handle, "wb") as file:
+            file.write(bytes(RANDOM_DRAW))
+        self.hash = rom_hash(bytes(RANDOM_DRAW))
+
+    def tearDown(self):
+        os.remove(self.rom)
+
+    def play(self, recording, frames):
+        testcpu = cpu.CPU(seed=recording.seed)
+        testcpu.load_rom_to_ram(self.rom)
+        held = {3, 4, 5, 9, 20, 21, 22}
+
+        def poll_input():
+            testcpu.keys[5] = recording.frames in held
+            return True
+
+        FrameScheduler(testcpu, recording.instructions_per_frame,
+                       poll_input=poll_input, paced=False,
+                       hooks=[recording.record]).run(frames)
+
+        return testcpu
+
+    def test_seed(self):
+        first = cpu.CPU(seed=7)
+        second = ScalarCPU(seed=7)
+        self.assertEqual(first.rng.integers(255, size=8).tolist(),
+                         second.rng.integers(255, size=8).tolist())
+
+    def test_record_changes_only(self):
+        recording = Recording(self.hash, 1234, 10)
+        self.play(recording, 30)
+
+        self.assertEqual(recording.frames, 30)
+        self.assertEqual(recording.changes, [(3, 0x20), (6, 0), (9, 0x20),
+                                             (10, 0), (20, 0x20), (23, 0)])
+
+    def test_replay_is_bit_identical(self):
+        recording = Recording(self.hash, 1234, 10)
+        testcpu = self.play(recording, 30)
+        self.assertTrue(testcpu.frame_buffer.any())
+
+        handle, path = tempfile.mkstemp(suffix=".c8in")
+        os.close(handle)
+
+        try:
+            recording.save(path)
+            loaded = Recording.load(path)
+        finally:
+            os.remove(path)
+
+        self.assertEqual(loaded.changes, recording.changes)
+        self.assertEqual(loaded.rom, self.hash)
+
+        for cpu_type in (cpu.CPU, cpu.PackedCPU, JitCPU, ScalarCPU):
+            replayed = replay(loaded, self.rom, cpu_type)
+            self.assertEqual(frame_hash(replayed.frame_buffer),
+                             frame_hash(testcpu.frame_buffer))
+            self.assertTrue(
+                np.array_equal(np.asarray(replayed.ram), testcpu.ram))
+
+    def test_bad_recording(self):
+        data = Recording(self.hash, 1, 10).tobytes()
+
+        with self.assertRaises(RecordingError):
+            Recording.frombytes(data + b"\x00")
+        with self.assertRaises(RecordingError):
+            Recording.frombytes(b"XXXX" + data[4:])
+        with self.assertRaisesRegex(RecordingError, "version 1$"):
+            Recording.frombytes(data[:4] + b"\x01" + data[5:-32])
+
+    def test_replay_checks_the_rom(self):
+        recording = Recording(rom_hash(bytes(PROGRAM)), 1, 10)
+        recording.frames = 5
+
+        with self.assertRaisesRegex(RecordingError, "not the rom"):
+            replay(recording, self.rom)
+
+# sets the delay timer, calls a subroutine at 0x20A and spins, with two
+# bytes of data between the loop and the subroutine and after it
+CALL_PROGRAM = [
+    0x60, 0x05, 0xF0, 0x15, 0x22, 0x0A, 0x12, 0x06, 0xF0, 0x10, 0x00, 0xEE,
+    0xAA, 0xBB
+]
+
+
+class TestCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = tempfile.mkdtemp()
+        handle, self.rom = tempfile.mkstemp(suffix=".ch8")
+        with os.fdopen(handle, "wb") as file:
+            file.write(bytes(CALL_PROGRAM))
+
+    def tearDown(self):
+        os.remove(self.rom)
+        for name in os.listdir(self.cache):
+            os.remove(os.path.join(self.cache, name))
+        os.rmdir(self.cache)
+
+    def test_analyze(self):
+        analysis = analyze(bytes(CALL_PROGRAM))
+
+        self.assertEqual(analysis["code"], [[0x200, 0x208], [0x20A, 0x20C]])
+        self.assertEqual(analysis["data"], [[0x208, 0x20A], [0x20C, 0x20E]])
+        self.assertEqual(analysis["instructions"][-1],
+                         [0x20A, 0x00EE, "op_ret"])
+        self.assertEqual(analysis["ipf"], 20)
+        self.assertEqual(analyze(bytes(PROGRAM))["ipf"], 10)
+
+    def test_cache_hit(self):
+        rom = Catalog(self.cache).load(self.rom)
+        self.assertEqual(rom.data.tobytes(), bytes(CALL_PROGRAM))
+        self.assertEqual(os.listdir(self.cache), [rom.hash + ".json"])
+
+        catalog = Catalog(self.cache)
+        self.assertEqual(catalog.load(self.rom).analysis, rom.analysis)
+        self.assertEqual((catalog.hits, catalog.misses), (1, 0))
+
+        catalog.load(self.rom)
+        self.assertEqual(catalog.hits, 1)
+
+    def test_changed_rom_is_reanalyzed(self):
+        first = Catalog(self.cache).load(self.rom)
+
+        with open(self.rom, "wb") as file:
+            file.write(bytes(PROGRAM))
+
+        catalog = Catalog(self.cache)
+        second = catalog.load(self.rom)
+        self.assertNotEqual(first.hash, second.hash)
+        self.assertEqual(catalog.misses, 1)
+        self.assertEqual(second.ipf, 10)
+
+    def test_stale_version_is_reanalyzed(self):
+        rom = Catalog(self.cache).load(self.rom)
+        path = os.path.join(self.cache, rom.hash + ".json")
+
+        with open(path, "w") as file:
+            file.write('{"version": %d}' % (ANALYSIS_VERSION - 1))
+
+        catalog = Catalog(self.cache)
+        self.assertEqual(catalog.load(self.rom).analysis, rom.analysis)
+        self.assertEqual(catalog.misses, 1)
+
+    def test_load_rom(self):
+        rom = Catalog(self.cache).load(self.rom)
+
+        for cpu_type in (cpu.CPU, JitCPU, ScalarCPU):
+            testcpu = cpu_type()
+            testcpu.load_rom(rom.data)
+            self.assertEqual(
+                np.asarray(testcpu.ram)[0x200:0x20E].tolist(), CALL_PROGRAM)
+
+        batch = BatchCPU(2)
+        batch.load_rom(rom.data)
+        self.assertEqual(batch.ram[1, 0x200:0x20E].tolist(), CALL_PROGRAM)
+
+class TestThreaded(unittest.TestCase):
+
+    def test_exchange_keeps_newest(self):
+        exchange = FrameExchange()
+        self.assertIsNone(exchange.acquire())
+
+        frame_buffer = PackedFrameBuffer()
+        for x in range(3):
+            frame_buffer.draw_sprite(x, 0, b"\x80")
+            exchange.present(frame_buffer)
+
+        frame = exchange.acquire()
+        self.assertEqual(frame[:3, 0].tolist(), [True, True, True])
+        self.assertIsNone(exchange.acquire())
+        self.assertEqual(exchange.stats(), {
+            "produced": 3,
+            "presented": 1,
+            "dropped": 2
+        })
+
+    def test_acquired_frame_is_stable(self):
+        exchange = FrameExchange()
+        exchange.present(np.ones([64, 32], dtype=np.bool_))
+        frame = exchange.acquire()
+
+        exchange.present(np.zeros([64, 32], dtype=np.bool_))
+        exchange.present(np.zeros([64, 32], dtype=np.bool_))
+        self.assertTrue(frame.all())
+
+    def test_run_matches_scheduler(self):
+        expected = cpu.CPU()
+        expected.ram[0x200:0x200 + len(PROGRAM)] = PROGRAM
+        FrameScheduler(expected, 20, paced=False).run(30)
+
+        testcpu = cpu.CPU()
+        testcpu.ram[0x200:0x200 + len(PROGRAM)] = PROGRAM
+        display = FramebufferDisplay()
+        scheduler = ThreadedScheduler(testcpu, display, 20, paced=False)
+        scheduler.run(30)
+
+        self.assertEqual(scheduler.frames, 30)
+        self.assertTrue(np.array_equal(display.frame, expected.frame_buffer))
+        stats = scheduler.stats()
+        self.assertEqual(stats["produced"], 30)
+        self.assertEqual(stats["presented"] + stats["dropped"], 30)
+
+    def test_poll_events_stops_emulation(self):
+        testcpu = cpu.CPU()
+        testcpu.ram[0x200:0x202] = [0x12, 0x00]
+        polls = []
+
+        def poll_events():
+            polls.append(1)
+            return len(polls) < 3
+
+        scheduler = ThreadedScheduler(testcpu, NullDisplay(),
+                                      poll_events=poll_events)
+        scheduler.run()
+        self.assertEqual(len(polls), 3)
+
+    def test_errors_reach_the_caller(self):
+        testcpu = cpu.CPU()
+        testcpu.ram[0x200:0x202] = [0xFF, 0xFF]
+
+        with self.assertRaises(cpu.IllegalOpcodeError):
+            ThreadedScheduler(testcpu, NullDisplay(), paced=False).run(5)
+
+class BlockingWriter:
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.frames = []
+
+    def write(self, frame):
+        self.started.set()
+        self.release.wait()
+        self.frames.append(frame)
+
+    def close(self):
+        pass
+
+
+class TestCapture(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def frames(self, count):
+        frame_buffer = PackedFrameBuffer()
+
+        for x in range(count):
+            frame_buffer.draw_sprite(x * 8, x, FONTS[:5].tobytes())
+            yield frame_buffer.copy()
+
+    def test_raw_roundtrip(self):
+        path = os.path.join(self.directory, "capture.raw")
+        frames = list(self.frames(3))
+
+        with Capture(RawWriter(path)) as capture:
+            for frame in frames:
+                capture.push(frame)
+
+        with open(path, "rb") as file:
+            data = file.read()
+
+        self.assertEqual(len(data), 3 * 256)
+        self.assertEqual(PackedFrameBuffer.frombytes(data[512:]), frames[2])
+
+    def test_png_and_gif(self):
+        png = PngWriter(self.directory, scale=2)
+        gif_path = os.path.join(self.directory, "capture.gif")
+        gif = GifWriter(gif_path, scale=2)
+
+        for frame in self.frames(2):
+            png.write(frame.tobytes())
+            gif.write(frame.tobytes())
+
+        png.close()
+        gif.close()
+
+        with open(os.path.join(self.directory, "frame_000001.png"),
+                  "rb") as file:
+            data = file.read()
+        self.assertEqual(data[:8], b"\x89PNG\r\n\x1a\n")
+        self.assertEqual(data[16:24], bytes([0, 0, 0, 128, 0, 0, 0, 64]))
+
+        with open(gif_path, "rb") as file:
+            data = file.read()
+        self.assertEqual(data[:6], b"GIF89a")
+        self.assertEqual(data[6:10], bytes([128, 0, 64, 0]))
+        self.assertEqual(data.count(b"\x21\xf9\x04"), 2)
+        self.assertEqual(data[-1:], b"\x3b")
+
+    def test_full_queue_drops(self):
+        writer = BlockingWriter()
+        capture = Capture(writer, queue_size=2)
+        frames = list(self.frames(5))
+
+        capture.push(frames[0])
+        writer.started.wait()
+
+        for frame in frames[1:]:
+            capture.push(frame)
+
+        writer.release.set()
+        capture.close()
+
+        self.assertEqual((capture.captured, capture.dropped), (3, 2))
+        self.assertEqual(writer.frames,
+                         [frame.tobytes() for frame in frames[:3]])
+
+    def test_scheduler_hook(self):
+        testcpu = cpu.CPU()
+        testcpu.ram[0x200:0x200 + len(PROGRAM)] = PROGRAM
+        path = os.path.join(self.directory, "capture.raw")
+
+        with Capture(RawWriter(path)) as capture:
+            FrameScheduler(testcpu, 20, paced=False,
+                           hooks=[capture.record]).run(4)
+
+        self.assertEqual(os.path.getsize(path), 4 * 256)
+
+# draws a sprite across the screen, waits on the delay timer, then
+# overwrites its own first instruction and starts over
+ANALYSIS_PROGRAM = [
+    0xA2, 0x18, 0x60, 0x00, 0xD0, 0x05, 0x70, 0x08, 0x30, 0x20, 0x12, 0x04,
+    0xF1, 0x07, 0x31, 0x00, 0x12, 0x0C, 0xA2, 0x00, 0xF0, 0x55, 0x12, 0x00,
+    0xF0, 0x90, 0x90, 0x90, 0xF0
+]
+
+
+class TestAnalysis(unittest.TestCase):
+
+    def test_mnemonic(self):
+        self.assertEqual(analysis.mnemonic(0xD015), "DRW V0, V1, 5")
+        self.assertEqual(analysis.mnemonic(0x8AB6), "SHR VA, VB")
+        self.assertEqual(analysis.mnemonic(0xF255), "LD [I], V2")
+        self.assertEqual(analysis.mnemonic(0x0123), "SYS 123")
+        self.assertEqual(analysis.mnemonic(0x0000), "DW 0000")
+
+    def test_blocks(self):
+        result = analyze(bytes(ANALYSIS_PROGRAM))
+
+        self.assertEqual(result["blocks"][:3], [[0x200, 0x204, [0x204]],
+                                                [0x204, 0x20A, [0x20A, 0x20C]],
+                                                [0x20A, 0x20C, [0x204]]])
+        self.assertEqual(result["code"], [[0x200, 0x218]])
+
+    def test_sprites_and_writes(self):
+        result = analyze(bytes(ANALYSIS_PROGRAM))
+
+        self.assertEqual(result["sprites"], [[0x218, 0x21D]])
+        self.assertEqual(result["data"], [[0x218, 0x21D]])
+        self.assertEqual(result["self_modifying"], [0x214])
+        self.assertEqual(result["unknown_writes"], [])
+
+    def test_loops(self):
+        loops = analyze(bytes(ANALYSIS_PROGRAM))["loops"]
+
+        self.assertEqual([(loop["head"], loop["kind"], loop["depth"])
+                          for loop in loops],
+                         [(0x20C, "timer_wait", 1), (0x204, "loop", 1),
+                          (0x200, "loop", 0)])
+
+    def test_call_leaves_i_unknown(self):
+        # A300 2208 F055 1206 A400 00EE
+        result = analyze(
+            bytes([0xA3, 0x00, 0x22, 0x08, 0xF0, 0x55, 0x12, 0x06, 0xA4,
+                   0x00, 0x00, 0xEE]))
+        self.assertEqual(result["unknown_writes"], [0x204])
+
+    def test_main(self):
+        directory = tempfile.mkdtemp()
+        rom = os.path.join(directory, "program.ch8")
+        output = os.path.join(directory, "analysis.json")
+
+        with open(rom, "wb") as file:
+            file.write(bytes(ANALYSIS_PROGRAM))
+
+        try:
+            self.assertEqual(analysis.main([directory, "-s", "-o", output]),
+                             0)
+            with open(output) as file:
+                results = json.load(file)
+        finally:
+            os.remove(rom)
+            os.remove(output)
+            os.rmdir(directory)
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["path"], rom)
+        self.assertEqual(results[0]["self_modifying"], [0x214])
+        self.assertNotIn("instructions", results[0])
+
+class TestDebugger(unittest.TestCase):
+
+    def setUp(self):
+        self.cpu = cpu.CPU()
+        self.cpu.ram[0x200:0x200 + len(ANALYSIS_PROGRAM)] = ANALYSIS_PROGRAM
+        self.debugger = Debugger()
+        self.debugger.attach(self.cpu)
+
+    def test_detach_restores_fast_path(self):
+        self.assertIn("cpu_frame", vars(self.cpu))
+        self.debugger.detach()
+        self.assertNotIn("cpu_frame", vars(self.cpu))
+
+    def test_breakpoint_and_resume(self):
+        self.debugger.breakpoints.add(0x206)
+        self.cpu.cpu_frame(10)
+
+        self.assertTrue(self.debugger.paused)
+        self.assertEqual(self.debugger.reason, "breakpoint at 206")
+        self.assertEqual(self.cpu.pc, 0x206)
+
+        self.cpu.cpu_frame(10)
+        self.assertEqual(self.cpu.pc, 0x206)
+
+        self.debugger.resume()
+        self.cpu.cpu_frame(10)
+        self.assertEqual(self.cpu.pc, 0x206)
+        self.assertEqual(self.cpu.v[0], 8)
+        self.assertTrue(self.debugger.paused)
+
+    def test_ram_watchpoint(self):
+        self.debugger.watchpoints.add(0x200)
+        self.cpu.dt = 0
+        self.cpu.v[0] = 0x20
+
+        for _ in range(10):
+            self.cpu.cpu_frame(10)
+
+        self.assertEqual(self.debugger.reason,
+                         "watchpoint at 214: ram 200 = 20")
+        self.assertEqual(self.cpu.pc, 0x216)
+
+    def test_register_watchpoint(self):
+        self.debugger.register_watchpoints.add(0)
+        self.cpu.cpu_frame(10)
+
+        self.assertEqual(self.debugger.reason,
+                         "watchpoint at 206: V0 00 -> 08")
+
+    def test_step_over(self):
+        # 2206 6105 1204 6208 00EE
+        self.cpu.ram[0x200:0x20A] = [
+            0x22, 0x06, 0x61, 0x05, 0x12, 0x04, 0x62, 0x08, 0x00, 0xEE
+        ]
+        self.assertTrue(self.debugger.step_over())
+        self.assertEqual((self.cpu.pc, self.cpu.sp, self.cpu.v[2]),
+                         (0x202, 0, 8))
+
+        self.assertTrue(self.debugger.step())
+        self.assertEqual(self.cpu.v[1], 5)
+
+    def test_console(self):
+        lines = iter(["b 204", "x 200 4", "s", "r", "c"])
+        output = []
+        console = Console(self.debugger, lambda prompt: next(lines),
+                          output.append)
+        self.debugger.pause("test")
+
+        self.assertTrue(console.prompt())
+        self.assertFalse(self.debugger.paused)
+        self.assertEqual(self.debugger.breakpoints, {0x204})
+        self.assertIn("200  A2 18 60 00", output)
+        self.assertIn("202  6000  LD V0, 00", output)
+        self.assertTrue(output[-1].startswith("pc 202 i 218"))
+
+class TestConformance(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.roms = {
+            "program.ch8": PROGRAM,
+            "random_draw.ch8": RANDOM_DRAW,
+            "analysis.ch8": ANALYSIS_PROGRAM,
+        }
+
+        for name, program in self.roms.items():
+            with open(os.path.join(self.directory, name), "wb") as file:
+                file.write(bytes(program))
+
+    def tearDown(self):
+        for name in self.roms:
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def test_default_script(self):
+        self.assertEqual(conformance.default_script(75),
+                         [(30, 0x1), (40, 0), (60, 0x2), (70, 0)])
+
+    def test_golden_roundtrip(self):
+        golden = conformance.new_golden(frames=90, period=30)
+        results = conformance.run_all(self.directory, golden, jobs=2)
+        conformance.update(golden, results)
+
+        self.assertEqual(len(results["program.ch8"]["periodic"]), 3)
+        self.assertEqual(results["analysis.ch8"]["error"],
+                         "IllegalOpcodeError: illegal opcode 0000 at 018")
+
+        for cpu_type in ("cpu", "scalar", "jit"):
+            self.assertEqual(
+                conformance.compare(
+                    conformance.run_all(self.directory, golden, 1, cpu_type),
+                    golden), [])
+
+    def test_crash_is_an_outcome(self):
+        # I = FFF, V0 = 0B, I += V0 then a sprite from past the end of ram
+        path = os.path.join(self.directory, "past_ram.ch8")
+        with open(path, "wb") as file:
+            file.write(bytes([0xAF, 0xFF, 0x60, 0x0B, 0xF0, 0x1E, 0xD0, 0x05]))
+
+        try:
+            result = conformance.run_rom(path, frames=10)
+        finally:
+            os.remove(path)
+
+        self.assertEqual(
+            result["error"], "SpriteRangeError: sprite of 5 rows at 100A "
+            "runs past the end of ram")
+        self.assertNotIn("frame", result)
+
+    def test_detects_changes(self):
+        golden = conformance.new_golden(frames=60, period=30)
+        conformance.update(golden,
+                           conformance.run_all(self.directory, golden, 1))
+        golden["roms"]["random_draw.ch8"]["script"] = [[0, 0x20]]
+        golden["roms"]["gone.ch8"] = golden["roms"]["program.ch8"]
+
+        with open(os.path.join(self.directory, "program.ch8"), "ab") as file:
+            file.write(b"\x00")
+
+        problems = conformance.compare(
+            conformance.run_all(self.directory, golden, 1), golden)
+        self.assertEqual(problems, [
+            "program.ch8: the rom changed",
+            "random_draw.ch8: frame 30 differs",
+            "gone.ch8: missing",
+        ])
+
+    def test_main_update(self):
+        golden = os.path.join(self.directory, "golden.json")
+
+        try:
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                self.assertEqual(
+                    conformance.main([
+                        self.directory, "-g", golden, "-u", "-n", "60", "-j",
+                        "1", "-c", "cpu", "-c", "scalar"
+                    ]), 0)
+
+            self.assertEqual(output.getvalue().splitlines(), [
+                f"cpu: 3 roms written to {golden}",
+                "scalar: 3 roms",
+            ])
+
+            with open(golden) as file:
+                data = json.load(file)
+
+            data["version"] = conformance.VERSION + 1
+
+            with open(golden, "w") as file:
+                json.dump(data, file)
+
+            with contextlib.redirect_stderr(io.StringIO()):
+                with self.assertRaises(SystemExit):
+                    conformance.main([self.directory, "-g", golden])
+        finally:
+            os.remove(golden)
+
+
+class TestStream(unittest.TestCase):
+
+    def test_packbits_roundtrip(self):
+        rng = np.random.default_rng(3)
+        samples = [
+            b"", b"\x00", bytes(300), b"\x01\x02\x02\x03" * 70,
+            rng.integers(0, 4, 500, dtype=np.uint8).tobytes()
+        ]
+
+        for data in samples:
+            self.assertEqual(stream.unpackbits(stream.packbits(data)), data)
+
+        self.assertEqual(len(stream.packbits(bytes(256))), 4)
+
+    def test_delta(self):
+        frame_buffer = PackedFrameBuffer()
+        old = list(frame_buffer.rows)
+        self.assertIsNone(stream.encode_delta(old, frame_buffer.rows))
+
+        frame_buffer.draw_sprite(10, 3, FONTS[:5].tobytes())
+        message = stream.encode_delta(old, frame_buffer.rows)
+        self.assertLess(len(message), 30)
+
+        rows = old
+        ((kind, payload), ) = stream.split_messages(bytearray(message))
+        stream.apply_delta(rows, payload)
+        self.assertEqual(kind, b"D")
+        self.assertEqual(rows, frame_buffer.rows)
+
+    def test_parse_address(self):
+        self.assertEqual(stream.parse_address("localhost:8600"),
+                         ("localhost", 8600))
+        self.assertEqual(stream.parse_address("/tmp/chip8.sock"),
+                         "/tmp/chip8.sock")
+
+    def test_server_and_client(self):
+        address = os.path.join(tempfile.mkdtemp(), "chip8.sock")
+        server = stream.StreamServer(address)
+        testcpu = cpu.CPU()
+        testcpu.ram[0x200:0x200 + len(PROGRAM)] = PROGRAM
+
+        try:
+            client = stream.StreamClient(address)
+            client.send_keys(0b10)
+            scheduler = FrameScheduler(testcpu, 20, paced=False,
+                                       poll_input=lambda: server.poll(testcpu),
+                                       hooks=[server.record])
+            scheduler.run(1)
+
+            while not client.receive(1.0):
+                pass
+
+            self.assertEqual(len(server.viewers), 1)
+            self.assertTrue(testcpu.keys[1])
+            self.assertEqual(client.frame_buffer,
+                             PackedFrameBuffer.from_array(
+                                 testcpu.frame_buffer))
+
+            scheduler.run(6)
+            while client.deltas < server.frames and client.receive(0.2):
+                pass
+
+            self.assertEqual(client.frame_buffer,
+                             PackedFrameBuffer.from_array(
+                                 testcpu.frame_buffer))
+            self.assertLess(server.sent / server.frames, 300)
+            client.close()
+        finally:
+            server.close()
+            os.rmdir(os.path.dirname(address))
+
+        self.assertFalse(os.path.exists(address))
+
+
+class TestFork(unittest.TestCase):
+
+    def machine(self, cpu_type):
+        testcpu = cpu_type()
+        np.asarray(testcpu.ram)[0x200:0x200 + len(PROGRAM)] = PROGRAM
+
+        for _ in range(30):
+            testcpu.cpu_frame(7)
+
+        return testcpu
+
+    def test_runs_like_parent(self):
+        for cpu_type in (cpu.CPU, cpu.PackedCPU, JitCPU, ScalarCPU):
+            parent = self.machine(cpu_type)
+            child = parent.fork()
+            self.assertEqual(save_state(child), save_state(parent))
+
+            for machine in (parent, child):
+                for _ in range(30):
+                    machine.cpu_frame(7)
+                machine.rng.integers(255)
+
+            self.assertEqual(save_state(child), save_state(parent))
+
+    def test_ram_is_private(self):
+        for cpu_type in (cpu.CPU, ScalarCPU):
+            parent = self.machine(cpu_type)
+            child = parent.fork()
+            self.assertFalse(
+                np.shares_memory(np.asarray(parent.ram),
+                                 np.asarray(child.ram)))
+
+            child.i = 0x300
+            child.v[0] = 255
+            child.op_ld_b_vx(cpu.Opcode.adapt(0xF033))
+            self.assertEqual(list(np.asarray(child.ram)[0x300:0x303]),
+                             [2, 5, 5])
+            self.assertNotEqual(save_state(child), save_state(parent))
+
+            # both machines stay writable from outside
+            parent.ram[0x200] = 0x12
+            child.ram[0x201] = 0x34
+            self.assertEqual(int(parent.ram[0x200]), 0x12)
+            self.assertEqual(int(child.ram[0x200]), PROGRAM[0])
+            self.assertEqual(int(parent.ram[0x201]), PROGRAM[1])
+
+    def test_registers_are_independent(self):
+        parent = self.machine(cpu.PackedCPU)
+        child = parent.fork()
+        child.v[3] = 0x42
+        child.keys[5] = 1
+        child.stack[0] = 0x345
+        child.frame_buffer.draw_sprite(0, 0, b"\xff")
+
+        self.assertNotEqual(int(parent.v[3]), 0x42)
+        self.assertFalse(parent.keys[5])
+        self.assertNotEqual(int(parent.stack[0]), 0x345)
+        self.assertNotEqual(parent.frame_buffer.rows,
+                            child.frame_buffer.rows)
+
+    def test_instrumentation_stays_with_parent(self):
+        parent = self.machine(JitCPU)
+        profiler = Profiler()
+        profiler.attach(parent)
+        child = parent.fork()
+        self.assertNotIn("cpu_cycle", vars(child))
+        self.assertNotIn("cpu_frame", vars(child))
+
+        parent.cpu_frame(7)
+        child.cpu_frame(7)
+        profiler.detach()
+        self.assertEqual(sum(profiler.counts.values()), 7)
+        self.assertEqual(save_state(child), save_state(parent))
+
+
+class TestTelemetry(unittest.TestCase):
+
+    def run_frames(self, telemetry, frames=100, profiler=None, **kwargs):
+        testcpu = cpu.PackedCPU()
+        testcpu.ram[0x200:0x200 + len(PROGRAM)] = PROGRAM
+        telemetry.attach(testcpu)
+        if profiler is not None:
+            profiler.attach(testcpu)
+        scheduler = FrameScheduler(testcpu,
+                                   7,
+                                   paced=False,
+                                   telemetry=telemetry,
+                                   **kwargs)
+        scheduler.run(frames)
+        return testcpu, scheduler
+
+    def test_frame_totals(self):
+        exported = []
+        telemetry = Telemetry(interval=0.0, exporters=[exported.append])
+        profiler = Profiler()
+        self.run_frames(telemetry, profiler=profiler)
+        snapshot = telemetry.snapshot()
+        draws = profiler.counts["op_drw_vx_vy_nibble"]
+
+        self.assertEqual(snapshot["frames"], 100)
+        self.assertEqual(snapshot["instructions"], 700)
+        self.assertEqual(snapshot["draws"], draws)
+        self.assertGreater(draws, 0)
+        self.assertAlmostEqual(snapshot["emulated_seconds"], 100 / 60)
+        self.assertGreater(snapshot["seconds"]["cpu"], 0)
+        self.assertGreater(snapshot["ips"], 0)
+        self.assertEqual(len(exported), 100)
+        self.assertIn("fps", telemetry.summary())
+
+    def test_attach_counts_draws_on_every_cpu(self):
+        for cpu_type in (cpu.CPU, cpu.PackedCPU, JitCPU, ScalarCPU):
+            telemetry = Telemetry()
+            testcpu = cpu_type()
+            testcpu.load_rom(bytes(PROGRAM))
+            other = cpu_type()
+            scheduler = FrameScheduler(testcpu, 7, paced=False,
+                                       telemetry=telemetry)
+            scheduler.run(2)
+            self.assertEqual(telemetry.snapshot()["draws"], 0,
+                             cpu_type.__name__)
+
+            telemetry.attach(testcpu)
+            scheduler.run(30)
+            draws = telemetry.snapshot()["draws"]
+            self.assertGreater(draws, 0, cpu_type.__name__)
+            self.assertIs(other.dispatch, cpu_type.decode_table())
+
+            telemetry.detach()
+            self.assertIs(testcpu.dispatch, cpu_type.decode_table())
+            scheduler.run(30)
+            self.assertEqual(telemetry.snapshot()["draws"], draws,
+                             cpu_type.__name__)
+
+    def test_idle_frames_count_executed_instructions(self):
+        # V0 = 60, DT = V0, then a wait on the timer at 0x204
+        rom = bytes([
+            0x60, 0x3C, 0xF0, 0x15, 0xF0, 0x07, 0x30, 0x00, 0x12, 0x04,
+            0x12, 0x0A
+        ])
+
+        for cpu_type in (cpu.CPU, JitCPU, ScalarCPU):
+            testcpu = cpu_type()
+            testcpu.idle_skip = True
+            testcpu.load_rom(rom)
+            executed = [testcpu.cpu_frame(20) for _ in range(62)]
+            self.assertEqual(executed, [5] + [3] * 59 + [20, 20],
+                             cpu_type.__name__)
+
+        telemetry = Telemetry()
+        testcpu = cpu.CPU()
+        testcpu.idle_skip = True
+        testcpu.load_rom(rom)
+        FrameScheduler(testcpu, 20, paced=False,
+                       telemetry=telemetry).run(10)
+        self.assertEqual(telemetry.snapshot()["instructions"], 5 + 3 * 9)
+        self.assertEqual(telemetry.snapshot()["idle_frames"], 10)
+
+    def test_threaded_phases(self):
+        telemetry = Telemetry()
+        testcpu = cpu.CPU()
+        testcpu.load_rom(bytes(PROGRAM))
+        ThreadedScheduler(testcpu,
+                          FramebufferDisplay(),
+                          7,
+                          paced=False,
+                          telemetry=telemetry).run(20)
+        snapshot = telemetry.snapshot()
+
+        self.assertEqual(snapshot["frames"], 20)
+        self.assertEqual(snapshot["instructions"], 140)
+        self.assertGreater(snapshot["seconds"]["exchange"], 0)
+        self.assertGreater(snapshot["seconds"]["render"], 0)
+
+    def test_flush_updates_rates(self):
+        telemetry = Telemetry(interval=3600.0)
+        self.run_frames(telemetry, 10)
+        self.assertEqual(telemetry.snapshot()["ips"], 0.0)
+
+        telemetry.flush()
+        self.assertGreater(telemetry.snapshot()["ips"], 0.0)
+        self.assertGreater(telemetry.snapshot()["draws_per_frame"], 0.0)
+
+    def test_dropped_frames(self):
+        telemetry = Telemetry()
+        testcpu = cpu.CPU()
+        testcpu.load_rom(bytes([0x12, 0x00]))
+        FrameScheduler(testcpu,
+                       7,
+                       frame_rate=1000,
+                       hooks=[lambda _: time.sleep(0.005)],
+                       telemetry=telemetry).run(5)
+
+        self.assertGreater(telemetry.snapshot()["dropped"], 0)
+        self.assertGreater(telemetry.snapshot()["seconds"]["hooks"], 0.02)
+
+    def test_textfile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "chip8.prom")
+            telemetry = Telemetry(interval=0.0,
+                                  exporters=[TextfileExporter(path)])
+            self.run_frames(telemetry, 10)
+
+            with open(path) as file:
+                lines = file.read().splitlines()
+
+            self.assertEqual(os.listdir(directory), ["chip8.prom"])
+
+        self.assertIn("chip8_frames_total 10", lines)
+        self.assertIn("chip8_instructions_total 70", lines)
+        self.assertIn("# TYPE chip8_phase_seconds_total counter", lines)
+        self.assertTrue(
+            any(line.startswith('chip8_phase_seconds_total{phase="cpu"} ')
+                for line in lines))
+
+    def test_http(self):
+        telemetry = Telemetry()
+        self.run_frames(telemetry, 3)
+        server = MetricsServer(telemetry, 0)
+        host, port = server.address
+
+        try:
+            with urllib.request.urlopen(
+                    f"http://{host}:{port}/metrics") as response:
+                body = response.read().decode()
+
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(f"http://{host}:{port}/")
+        finally:
+            server.close()
+
+        self.assertIn("chip8_frames_total 3\n", body)
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_core_imports_without_pygame(self):
+        code = ("import sys, chip8, cpu, pool, batch, scalar, jit; "
+                "sys.exit(any(name in sys.modules for name in ("
+                "'pygame', 'telemetry', 'http.server', 'stream', 'capture', "
+                "'debugger', 'threaded', 'profiler', 'conformance')))")
+        result = subprocess.run([sys.executable, "-c", code],
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(result.returncode, 0)
+
+    def test_main_headless(self):
+        handle, rom = tempfile.mkstemp(suffix=".ch8")
+        with os.fdopen(handle, "wb") as file:
+            file.write(bytes(PROGRAM))
+        cache = tempfile.mkdtemp()
+
+        try:
+            self.assertEqual(
+                chip8.main([rom, "-b", "null", "-n", "5", "--cache", cache]),
+                0)
+        finally:
+            os.remove(rom)
+            for name in os.listdir(cache):
+                os.remove(os.path.join(cache, name))
+            os.rmdir(cache)
+
+    def test_scalar_rejects_instrumentation(self):
+        for flags in (["--profile", "out.json"], ["--debug"]):
+            with contextlib.redirect_stderr(io.StringIO()):
+                with self.assertRaises(SystemExit):
+                    chip8.main(["rom.ch8", "--scalar"] + flags)
+
+
+if __name__ == "__main__":
+    unittest.main()
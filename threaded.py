@@ -0,0 +1,151 @@
+import threading
+import time
+import typing
+import numpy as np
+from cpu import CPU
+from display import Display, WIDTH, HEIGHT
+from scheduler import FrameScheduler, FRAME_RATE, INSTRUCTIONS_PER_FRAME
+
+Poll = typing.Callable[[], bool]
+
+
+class FrameExchange(Display):
+    # a triple buffer between the emulation thread, which presents into it,
+    # and the render thread, which takes the newest finished frame; the
+    # lock only guards an index swap, never a copy or a draw
+
+    def __init__(self) -> None:
+        self.buffers = [
+            np.zeros([WIDTH, HEIGHT], dtype=np.bool_) for _ in range(3)
+        ]
+        self.back, self.ready, self.front = 0, 1, 2
+        self.fresh = False
+        self.lock = threading.Lock()
+        self.produced = 0
+        self.presented = 0
+        # published frames replaced before the render thread took them
+        self.dropped = 0
+
+    def present(self, frame_buffer: np.ndarray) -> None:
+        np.copyto(self.buffers[self.back], np.asarray(frame_buffer))
+
+        with self.lock:
+            self.back, self.ready = self.ready, self.back
+            self.dropped += self.fresh
+            self.fresh = True
+            self.produced += 1
+
+    def acquire(self) -> typing.Optional[np.ndarray]:
+        # the returned frame stays untouched until the next acquire
+        with self.lock:
+            if not self.fresh:
+                return None
+
+            self.front, self.ready = self.ready, self.front
+            self.fresh = False
+            self.presented += 1
+
+        return self.buffers[self.front]
+
+    def stats(self) -> typing.Dict[str, int]:
+        with self.lock:
+            return {
+                "produced": self.produced,
+                "presented": self.presented,
+                "dropped": self.dropped,
+            }
+
+
+class ThreadedScheduler:
+    # runs a FrameScheduler on its own thread with the cpu presenting into
+    # a FrameExchange, while the calling thread keeps the window: it polls
+    # events and hands the newest frame to the real display
+
+    def __init__(self,
+                 cpu: CPU,
+                 display: Display,
+                 instructions_per_frame: int = INSTRUCTIONS_PER_FRAME,
+                 frame_rate: int = FRAME_RATE,
+                 poll_input: typing.Optional[Poll] = None,
+                 poll_events: typing.Optional[Poll] = None,
+                 paced: bool = True,
+                 hooks: typing.Sequence[typing.Callable[[CPU], None]] = (),
+                 telemetry=None) -> None:
+        self.exchange = FrameExchange()
+        cpu.display = self.exchange
+        self.display = display
+        # poll_input runs on the emulation thread before every frame,
+        # poll_events on the calling thread, either returns False to stop
+        self.poll_input = poll_input
+        self.poll_events = poll_events
+        self.stopping = threading.Event()
+        self.error: typing.Optional[BaseException] = None
+        self.scheduler = FrameScheduler(cpu,
+                                        instructions_per_frame,
+                                        frame_rate,
+                                        poll_input=self._poll_input,
+                                        paced=paced,
+                                        hooks=hooks,
+                                        telemetry=telemetry)
+        # the emulation thread only copies into the exchange, that is its
+        # own phase; this thread times the real rendering and counts the
+        # frames the window never showed
+        self.scheduler.present_phase = "exchange"
+        self.telemetry = telemetry
+        self.dropped = 0
+
+    @property
+    def frames(self) -> int:
+        return self.scheduler.frames
+
+    def _poll_input(self) -> bool:
+        if self.stopping.is_set():
+            return False
+
+        return self.poll_input is None or self.poll_input()
+
+    def _emulate(self, frames: int) -> None:
+        try:
+            self.scheduler.run(frames)
+        except BaseException as error:
+            self.error = error
+
+    def present(self) -> None:
+        start = time.perf_counter()
+        frame = self.exchange.acquire()
+
+        if frame is not None:
+            self.display.present(frame)
+
+        if self.telemetry is not None:
+            dropped = self.exchange.stats()["dropped"]
+            self.telemetry.render(time.perf_counter() - start,
+                                  dropped - self.dropped)
+            self.dropped = dropped
+
+    def run(self, frames: int = 0) -> None:
+        thread = threading.Thread(target=self._emulate,
+                                  args=(frames, ),
+                                  name="emulation",
+                                  daemon=True)
+        thread.start()
+
+        try:
+            while thread.is_alive():
+                if self.poll_events is not None and not self.poll_events():
+                    break
+
+                self.present()
+                # a quarter frame keeps the latency low without spinning
+                time.sleep(self.scheduler.frame_time / 4)
+        finally:
+            self.stopping.set()
+            thread.join()
+
+        self.present()
+
+        if self.error is not None:
+            raise self.error
+
+    def stats(self) -> typing.Dict[str, int]:
+        return self.exchange.stats()